@@ -0,0 +1,174 @@
+"""Build the offline benchmark corpus.
+
+Product and listing pages for Watsons and Sephora are generated from the
+records we have already scraped (output/watsons_products.csv and the Sephora
+product list), using the same markup the collectors read, with filler
+navigation, reviews and footer so pages are about the size of the real ones.
+Generation is seeded, so every run produces the same corpus.
+
+Saved real pages can be added next to the generated ones: drop the .html
+files into corpus/watsons/products or corpus/sephora/products.
+
+    python make_corpus.py [max_products]
+"""
+import csv
+import html
+import json
+import os
+import random
+import re
+import shutil
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+
+WATSONS_SOURCE = os.path.join(REPO_DIR, "output", "watsons_products.csv")
+SEPHORA_SOURCE = os.path.join(REPO_DIR, "python testing", "latest", "sephora_product_all.csv")
+
+DEFAULT_PRODUCTS = 200
+LISTING_PAGE_SIZE = 64
+SEED = 42
+
+FILLER_WORDS = (
+    "shop deals member points free delivery rm50 store locator voucher promotion new arrivals "
+    "best sellers brands health beauty skincare personal care wellness offers gift card help"
+).split()
+
+REVIEW_LINES = [
+    "Love it, my skin feels so soft after using this.",
+    "Good value for money, will buy again.",
+    "Smell is a bit strong but it works well.",
+    "Gentle and not drying at all.",
+    "Delivery was fast and packaging was nice.",
+    "Did not see much difference after two weeks.",
+]
+
+def read_rows(path):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+def filler(rng, words):
+    return " ".join(rng.choice(FILLER_WORDS) for _ in range(words))
+
+def page_shell(title, body, rng):
+    """Wrap page content with head, navigation and footer filler"""
+    nav = "".join(f'<li><a href="/c/{i}">{html.escape(filler(rng, 2))}</a></li>' for i in range(40))
+    footer = "".join(f"<p>{html.escape(filler(rng, 30))}</p>" for _ in range(6))
+    return (
+        "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+        f"<title>{html.escape(title)}</title>"
+        "<style>.hidden{display:none}</style>"
+        "<script>window.dataLayer = window.dataLayer || [];</script></head><body>"
+        f'<header><nav class="main-nav"><ul>{nav}</ul></nav></header>'
+        f"<main>{body}</main>"
+        f'<footer class="site-footer">{footer}</footer></body></html>'
+    )
+
+def product_id(url):
+    match = re.search(r"/p/([^/?#]+)", url)
+    return match.group(1) if match else None
+
+def watsons_product_page(row, rng):
+    """Product page with the elements watsons_http / capture_snapshot read"""
+    name = html.escape(row["productName"])
+    brand = html.escape(row["brandName"])
+    description = (
+        f"{row['productName']} is a {row['categoryType'] or 'care'} product for "
+        f"{row['bodyParts'] or 'daily use'}. Helps with {row['productFunction'] or 'care'}. "
+        + filler(rng, 40)
+    )
+    sections = [
+        f'<div class="product-description"><p>{html.escape(description)}</p></div>',
+        f"<h4>How to use</h4><p>Apply to {html.escape(row['bodyParts'] or 'skin')} and rinse well.</p>",
+    ]
+    if row["productIngredient"]:
+        sections.append(f"<h4>Ingredients</h4><p>{html.escape(row['productIngredient'])}</p>")
+    if row["country"]:
+        sections.append(f"<h4>Country of Origin</h4><p>{html.escape(row['country'])}</p>")
+    if row["babyProduct"] == "Yes":
+        sections.append("<p>Suitable for babies and kids.</p>")
+    if row["eczemaProduct"] == "Yes":
+        sections.append("<p>Suitable for eczema-prone and atopic skin.</p>")
+    reviews = "".join(f"<li>{rng.choice(REVIEW_LINES)}</li>" for _ in range(rng.randint(5, 25)))
+
+    body = (
+        f'<div class="product-detail"><h1 class="product-name">{name}</h1>'
+        f'<div class="brand-group"><div class="product-brand"><a href="/brand">{brand}</a></div></div>'
+        f'<div class="price">RM{rng.randint(5, 150)}.{rng.randint(0, 99):02d}</div>'
+        + "".join(sections)
+        + f'</div><section class="reviews"><h2>Reviews</h2><ul>{reviews}</ul></section>'
+    )
+    return page_shell(row["productName"], body, rng)
+
+def sephora_product_page(row, rng):
+    """Product page with the elements sephora_collector reads"""
+    body = (
+        f'<div class="product-heading"><h1>{html.escape(row["productName"])}</h1></div>'
+        f'<div class="product-brand"><a href="/brands">{html.escape(row["brandName"])}</a></div>'
+        f'<div class="product-description"><p>{html.escape(filler(rng, 80))}</p></div>'
+    )
+    return page_shell(row["productName"], body, rng)
+
+def listing_page(links, rng):
+    """Category page with one product tile per link"""
+    tiles = "".join(
+        f'<article class="product-tile"><a href="{html.escape(path)}"><img alt=""></a>'
+        f'<a href="{html.escape(path)}"><h3>{html.escape(name)}</h3></a></article>'
+        for path, name in links
+    )
+    return page_shell("Category", f'<div class="product-grid">{tiles}</div>', rng)
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+def build_watsons(rows, rng):
+    products = []
+    for row in rows:
+        pid = product_id(row["productURL"])
+        if not pid or not row["productName"]:
+            continue
+        write(os.path.join(CORPUS_DIR, "watsons", "products", f"{pid}.html"), watsons_product_page(row, rng))
+        products.append((f"/watsons/p/{pid}.html", row["productName"], row["brandName"]))
+
+    pages = [products[i:i + LISTING_PAGE_SIZE] for i in range(0, len(products), LISTING_PAGE_SIZE)]
+    for number, page in enumerate(pages):
+        data = {
+            "products": [{"url": path, "name": name, "masterBrand": {"name": brand}} for path, name, brand in page],
+            "pagination": {"currentPage": number, "pageSize": LISTING_PAGE_SIZE,
+                           "totalPages": len(pages), "totalResults": len(products)},
+        }
+        write(os.path.join(CORPUS_DIR, "watsons", "listing", f"page_{number:03d}.json"), json.dumps(data))
+        write(os.path.join(CORPUS_DIR, "watsons", "listing", f"page_{number:03d}.html"),
+              listing_page([(path, name) for path, name, _ in page], rng))
+    return len(products), len(pages)
+
+def build_sephora(rows, rng):
+    links = []
+    for number, row in enumerate(rows):
+        slug = f"product-{number:04d}"
+        write(os.path.join(CORPUS_DIR, "sephora", "products", f"{slug}.html"), sephora_product_page(row, rng))
+        links.append((f"/sephora/products/{slug}.html", row["productName"]))
+
+    pages = [links[i:i + LISTING_PAGE_SIZE] for i in range(0, len(links), LISTING_PAGE_SIZE)]
+    for number, page in enumerate(pages):
+        write(os.path.join(CORPUS_DIR, "sephora", "listing", f"page_{number:03d}.html"), listing_page(page, rng))
+    return len(links), len(pages)
+
+def build_corpus(max_products=DEFAULT_PRODUCTS):
+    """Regenerate corpus/ (keeps nothing from a previous build)"""
+    if os.path.exists(CORPUS_DIR):
+        shutil.rmtree(CORPUS_DIR)
+    rng = random.Random(SEED)
+
+    watsons = build_watsons(read_rows(WATSONS_SOURCE)[:max_products], rng)
+    sephora = build_sephora(read_rows(SEPHORA_SOURCE)[:max_products], rng)
+    print(f"Watsons: {watsons[0]} product pages, {watsons[1]} listing pages")
+    print(f"Sephora: {sephora[0]} product pages, {sephora[1]} listing pages")
+    print(f"Corpus written to {CORPUS_DIR}")
+
+if __name__ == "__main__":
+    build_corpus(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PRODUCTS)
@@ -0,0 +1,333 @@
+"""Offline benchmark of the collectors' fetch, parse and classify stages.
+
+Serves the corpus built by make_corpus.py from a local HTTP server (the
+Watsons listing API included) and measures:
+
+- latency percentiles of every stage: listing discovery, page fetch,
+  HTML parsing, each detector, is_single_product / is_combo_url and the
+  end-to-end parse_product
+- pages/minute for each fetch engine ("http", and "browser" with --browser)
+  at each worker count
+- CPU time of the classifiers
+
+Results are saved to results/<label>-<time>.json; compare two runs with
+--compare. Nothing leaves the machine.
+
+    python run_benchmark.py [--workers 1,4,8] [--browser] [--label name] [--repeat 3]
+    python run_benchmark.py --compare results/old.json results/new.json
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "collectors"))
+
+from bs4 import BeautifulSoup
+
+import listing_prefilter
+import make_corpus
+import watsons_detectors as detectors
+import watsons_http
+import watsons_listing
+from page_snapshot import PageSnapshot
+
+try:
+    import watsons_collector as collector  # needs selenium (and winsound on Windows)
+except ImportError as e:
+    print(f"watsons_collector not importable ({e}); skipping is_single_product and parse_product")
+    collector = None
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+DEFAULT_WORKERS = "1,4,8"
+
+DETECTORS = [
+    detectors.check_for_eczema,
+    detectors.check_for_baby,
+    detectors.detect_country,
+    detectors.detect_body_parts,
+    detectors.detect_product_function,
+    detectors.detect_category_type,
+    detectors.extract_ingredients,
+]
+
+class CorpusHandler(SimpleHTTPRequestHandler):
+    """Static corpus files, plus the Watsons product search API backed by the listing JSON"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=make_corpus.CORPUS_DIR, **kwargs)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/watsons/api/search":
+            page = int(parse_qs(parsed.query).get("currentPage", ["0"])[0])
+            self.path = f"/watsons/listing/page_{page:03d}.json"
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass  # keep the benchmark output readable
+
+def start_server():
+    """Serve the corpus on a free local port; returns (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CorpusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def percentiles(samples):
+    """count, mean and p50/p90/p99/max of latencies in seconds, reported in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(rank(50), 3),
+        "p90_ms": round(rank(90), 3),
+        "p99_ms": round(rank(99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+def time_each(func, items, repeat=1):
+    """Latency of func(item) for every item (repeated), plus the last results"""
+    latencies = []
+    results = []
+    for _ in range(repeat):
+        results = []
+        for item in items:
+            start = time.perf_counter()
+            results.append(func(item))
+            latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+def corpus_urls(base_url, retailer, kind, pattern="*.html"):
+    folder = os.path.join(make_corpus.CORPUS_DIR, retailer, kind)
+    return [f"{base_url}/{retailer}/{kind}/{os.path.basename(path)}"
+            for path in sorted(glob.glob(os.path.join(folder, pattern)))]
+
+def bench_listing(base_url, stages):
+    """Watsons discovery through the listing API, and Sephora listing page parsing"""
+    watsons_listing.LISTING_API = f"{base_url}/watsons/api/search"
+    latencies = []
+
+    def timed_fetch(category_url, page):
+        start = time.perf_counter()
+        data = watsons_listing.fetch_listing_page(category_url, page)
+        latencies.append(time.perf_counter() - start)
+        return data
+
+    products = watsons_listing.harvest_listing(f"{base_url}/watsons/c/bench", timed_fetch) or []
+    stages["watsons.listing_api_page"] = percentiles(latencies)
+
+    def sephora_listing(url):
+        soup = BeautifulSoup(watsons_http.fetch_html(url), "html.parser")
+        return len(soup.select("a[href*='/products/']"))
+
+    latencies, _ = time_each(sephora_listing, corpus_urls(base_url, "sephora", "listing"))
+    stages["sephora.listing_page"] = percentiles(latencies)
+    return products
+
+def fetch_with_pool(urls, workers, fetch):
+    """Fetch every URL with a pool of workers; (wall seconds, per-request latencies)"""
+    latencies = []
+    lock = threading.Lock()
+
+    def timed(url):
+        start = time.perf_counter()
+        fetch(url)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(timed, urls))
+    return time.perf_counter() - start, latencies
+
+def browser_fetcher():
+    """fetch(url) that loads the page in a per-thread headless Chrome"""
+    import page_waits
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    local = threading.local()
+    drivers = []
+
+    def fetch(url):
+        driver = getattr(local, "driver", None)
+        if driver is None:
+            options = Options()
+            options.add_argument("--headless=new")
+            driver = local.driver = webdriver.Chrome(options=options)
+            drivers.append(driver)
+        page_waits.load_page(driver, "benchmark", url, page_waits.document_ready)
+        return driver.execute_script("return document.body.innerText")
+
+    def close():
+        for driver in drivers:
+            driver.quit()
+
+    return fetch, close
+
+def bench_fetch(retailer, urls, workers_list, engines, stages, throughput):
+    """pages/minute of each fetch engine at each worker count"""
+    for engine in engines:
+        for workers in workers_list:
+            if engine == "http":
+                fetch, close = watsons_http.fetch_html, None
+            else:
+                fetch, close = browser_fetcher()
+            try:
+                if engine == "browser":
+                    fetch_with_pool(urls[:workers], workers, fetch)  # start the browsers outside the timing
+                seconds, latencies = fetch_with_pool(urls, workers, fetch)
+            finally:
+                if close:
+                    close()
+            stages[f"{retailer}.fetch.{engine}.w{workers}"] = percentiles(latencies)
+            throughput.append({
+                "retailer": retailer,
+                "engine": engine,
+                "workers": workers,
+                "pages": len(urls),
+                "seconds": round(seconds, 3),
+                "pages_per_minute": round(len(urls) / seconds * 60, 1) if seconds else None,
+            })
+            print(f"  {retailer} {engine} x{workers}: {len(urls) / seconds * 60:.0f} pages/min")
+
+def bench_classify(snapshots, products, repeat, stages, cpu):
+    """Latency and CPU time of every detector on fresh (uncached) snapshots"""
+    plain = [snapshot.to_dict() for snapshot in snapshots]
+
+    for detector in DETECTORS + [detectors.build_record]:
+        fresh = [PageSnapshot.from_dict(data) for data in plain * repeat]
+        cpu_start = time.process_time()
+        latencies, _ = time_each(detector, fresh)
+        cpu_seconds = time.process_time() - cpu_start
+        stages[f"watsons.classify.{detector.__name__}"] = percentiles(latencies)
+        cpu[detector.__name__] = {
+            "cpu_seconds": round(cpu_seconds, 4),
+            "cpu_ms_per_page": round(cpu_seconds / len(fresh) * 1000, 4),
+        }
+
+    names = [name for _, name, _ in products]
+    urls = [url for url, _, _ in products]
+    latencies, _ = time_each(listing_prefilter.is_combo_url, urls, repeat)
+    stages["watsons.is_combo_url"] = percentiles(latencies)
+    if collector is not None:
+        latencies, _ = time_each(collector.is_single_product, names, repeat)
+        stages["watsons.is_single_product"] = percentiles(latencies)
+
+def run(args):
+    if not os.path.isdir(make_corpus.CORPUS_DIR):
+        make_corpus.build_corpus()
+
+    workers_list = [int(n) for n in args.workers.split(",") if n.strip()]
+    engines = ["http"] + (["browser"] if args.browser else [])
+    server, base_url = start_server()
+    stages = {}
+    throughput = []
+    cpu = {}
+    try:
+        print("Listing discovery...")
+        products = bench_listing(base_url, stages)
+
+        watsons_urls = corpus_urls(base_url, "watsons", "products")
+        sephora_urls = corpus_urls(base_url, "sephora", "products")
+        print("Fetching product pages...")
+        bench_fetch("watsons", watsons_urls, workers_list, engines, stages, throughput)
+        bench_fetch("sephora", sephora_urls, workers_list, engines, stages, throughput)
+
+        print("Parsing...")
+        pages = [(url, watsons_http.fetch_html(url)) for url in watsons_urls]
+        latencies, snapshots = time_each(lambda page: watsons_http.snapshot_from_html(page[1], page[0]),
+                                         pages, args.repeat)
+        stages["watsons.parse.snapshot_from_html"] = percentiles(latencies)
+
+        print("Classifying...")
+        bench_classify(snapshots, products, args.repeat, stages, cpu)
+
+        if collector is not None:
+            print("End-to-end parse_product...")
+            latencies, _ = time_each(collector.parse_product, watsons_urls)
+            stages["watsons.parse_product"] = percentiles(latencies)
+    finally:
+        server.shutdown()
+
+    result = {
+        "label": args.label,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"watsons_pages": len(watsons_urls), "sephora_pages": len(sephora_urls)},
+        "stages": stages,
+        "throughput": throughput,
+        "cpu": cpu,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{args.label}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    print_result(result)
+    print(f"\nResults saved to: {path}")
+
+def print_result(result):
+    print(f"\n{'stage':<48}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for name, stats in result["stages"].items():
+        if stats.get("count"):
+            print(f"{name:<48}{stats['count']:>7}{stats['p50_ms']:>10.3f}{stats['p90_ms']:>10.3f}{stats['p99_ms']:>10.3f}")
+    print(f"\n{'classifier':<32}{'cpu s':>10}{'cpu ms/page':>13}")
+    for name, stats in result["cpu"].items():
+        print(f"{name:<32}{stats['cpu_seconds']:>10.3f}{stats['cpu_ms_per_page']:>13.4f}")
+
+def compare(old_path, new_path):
+    """Print the change in p50 latency and pages/minute between two result files"""
+    with open(old_path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f:
+        new = json.load(f)
+
+    def change(before, after):
+        return f"{(after - before) / before * 100:+.1f}%" if before else "-"
+
+    print(f"{old['label']} ({old['created']}) -> {new['label']} ({new['created']})\n")
+    print(f"{'stage':<48}{'old p50':>10}{'new p50':>10}{'change':>10}")
+    for name, stats in new["stages"].items():
+        before = old["stages"].get(name, {}).get("p50_ms")
+        after = stats.get("p50_ms")
+        if before is not None and after is not None:
+            print(f"{name:<48}{before:>10.3f}{after:>10.3f}{change(before, after):>10}")
+
+    old_rates = {(row["retailer"], row["engine"], row["workers"]): row["pages_per_minute"] for row in old["throughput"]}
+    print(f"\n{'fetch':<32}{'old pages/min':>15}{'new pages/min':>15}{'change':>10}")
+    for row in new["throughput"]:
+        key = (row["retailer"], row["engine"], row["workers"])
+        if old_rates.get(key) and row["pages_per_minute"]:
+            print(f"{' '.join(map(str, key)):<32}{old_rates[key]:>15.1f}{row['pages_per_minute']:>15.1f}"
+                  f"{change(old_rates[key], row['pages_per_minute']):>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline collector benchmark")
+    parser.add_argument("--workers", default=DEFAULT_WORKERS, help="comma-separated worker counts")
+    parser.add_argument("--browser", action="store_true", help="also benchmark the Chrome fetch engine")
+    parser.add_argument("--label", default="run", help="name used in the results file")
+    parser.add_argument("--repeat", type=int, default=1, help="repeat the CPU stages this many times")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    else:
+        run(args)
@@ -0,0 +1,228 @@
+"""Fixed versus adaptive domain limits against a local server that throttles.
+
+The mock site behaves like a retailer behind a bot filter:
+
+- more than SITE_RPS requests in the last second: HTTP 429 with Retry-After
+- more than SITE_CONCURRENCY requests in flight: every response slows down
+  (the site is queueing them)
+- more than BLOCK_AFTER 429s within BLOCK_WINDOW seconds: a challenge page
+  ("Just a moment...") for every request for the next BLOCK_SECONDS
+
+Each scenario runs WORKERS threads fetching pages for --seconds through
+domain_limits.request / report_response, the same way watsons_http does,
+and the server counts what it served. Nothing leaves the machine.
+
+The adaptive run must never be blocked, keep its 429s under
+MAX_THROTTLED_SHARE of its requests and fetch at least MIN_SPEEDUP times as
+many pages as the polite fixed limits; otherwise the script exits with 1.
+
+    python throttle_test.py [--seconds 60] [--workers 16]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "collectors"))
+
+import requests
+
+import domain_limits
+import watsons_http
+
+SITE_RPS = 8
+SITE_CONCURRENCY = 4
+BASE_LATENCY = 0.05  # seconds
+BLOCK_AFTER = 20
+BLOCK_WINDOW = 10
+BLOCK_SECONDS = 10
+RETRY_AFTER = 1
+
+# What the adaptive scenario has to achieve
+MAX_THROTTLED_SHARE = 0.15  # 429s / requests
+MIN_SPEEDUP = 1.5          # pages compared with "fixed, polite"
+
+PRODUCT_PAGE = ("<html><head><title>Product</title></head>"
+                "<body><h1>Gentle Cleanser</h1><p>Ingredients: Aqua, Glycerin</p></body></html>")
+CHALLENGE_PAGE = ("<html><head><title>Just a moment...</title></head>"
+                  "<body>Checking your browser before accessing the site.</body></html>")
+
+# (name, domain_limits.configure keyword arguments); the adaptive run starts
+# above the site's rate so it has to back off as well as speed up
+SCENARIOS = [
+    ("fixed, polite", {"concurrency": 1, "requests_per_second": 1}),
+    ("fixed, aggressive", {"concurrency": 16, "requests_per_second": 40}),
+    ("adaptive", {"concurrency": 8, "requests_per_second": 12, "adaptive": True,
+                  "max_concurrency": 16, "max_requests_per_second": 40}),
+]
+
+class ThrottlingSite:
+    """Shared state of the mock site: recent requests, 429s, block and counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.starts = deque()
+            self.rejections = deque()
+            self.blocked_until = 0.0
+            self.in_flight = 0
+            self.counts = {"ok": 0, "429": 0, "challenge": 0}
+
+    def begin(self):
+        """Outcome for a new request: ("ok", latency), ("429", 0) or ("challenge", 0)"""
+        with self.lock:
+            now = time.monotonic()
+            self.starts.append(now)
+            while self.starts and self.starts[0] < now - 1:
+                self.starts.popleft()
+            while self.rejections and self.rejections[0] < now - BLOCK_WINDOW:
+                self.rejections.popleft()
+
+            if now < self.blocked_until:
+                outcome = "challenge"
+            elif len(self.starts) > SITE_RPS:
+                self.rejections.append(now)
+                if len(self.rejections) > BLOCK_AFTER:
+                    self.blocked_until = now + BLOCK_SECONDS
+                    self.rejections.clear()
+                outcome = "429"
+            else:
+                outcome = "ok"
+            self.counts[outcome] += 1
+            if outcome != "ok":
+                return outcome, 0
+            self.in_flight += 1
+            return outcome, BASE_LATENCY * max(1, self.in_flight / SITE_CONCURRENCY) ** 2
+
+    def end(self):
+        with self.lock:
+            self.in_flight -= 1
+
+site = ThrottlingSite()
+
+class ThrottlingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        outcome, latency = site.begin()
+        if outcome == "429":
+            self.reply(429, "Too Many Requests", {"Retry-After": str(RETRY_AFTER)})
+            return
+        if outcome == "challenge":
+            self.reply(403, CHALLENGE_PAGE)
+            return
+        try:
+            time.sleep(latency)
+            self.reply(200, PRODUCT_PAGE)
+        finally:
+            site.end()
+
+    def reply(self, status, body, headers=None):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server():
+    """Serve the mock site on a free local port; returns (server, base_url)"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ThrottlingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def fetch(url):
+    """One page through the domain limits, like watsons_http.fetch_html but quiet"""
+    try:
+        with domain_limits.request(url):
+            start = time.perf_counter()
+            response = watsons_http.get_session().get(url, timeout=watsons_http.REQUEST_TIMEOUT)
+        domain_limits.report_response(url, response, time.perf_counter() - start)
+    except requests.RequestException as e:
+        domain_limits.report(url, "timeout" if isinstance(e, requests.Timeout) else "error")
+
+def run_scenario(base_url, name, limits, seconds, workers):
+    """Fetch pages with workers threads for seconds; returns the server's counts"""
+    domain_limits.clear()
+    limit = domain_limits.configure("127.0.0.1", **limits)
+    site.reset()
+    deadline = time.monotonic() + seconds
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while time.monotonic() < deadline:
+            with counter_lock:
+                number = next(counter)
+            fetch(f"{base_url}/p/BP_{number:06d}")
+
+    print(f"\n== {name}: {limits}")
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    counts = dict(site.counts)
+    counts["pages_per_minute"] = counts["ok"] / elapsed * 60
+    counts["final"] = f"{limit.concurrency} concurrent, {limit.requests_per_second:.2f} req/s"
+    return counts
+
+def print_results(results):
+    print(f"\nSite limit: {SITE_RPS} req/s, {SITE_CONCURRENCY} concurrent")
+    print(f"{'scenario':<20} {'pages':>6} {'429':>6} {'blocked':>8} {'pages/min':>10}  final limits")
+    for name, counts in results:
+        print(f"{name:<20} {counts['ok']:>6} {counts['429']:>6} {counts['challenge']:>8} "
+              f"{counts['pages_per_minute']:>10.1f}  {counts['final']}")
+
+def check_results(results):
+    """What the adaptive run got wrong (empty list if it passed)"""
+    counts = dict(results)
+    adaptive = counts["adaptive"]
+    polite = counts["fixed, polite"]
+    requests_made = adaptive["ok"] + adaptive["429"] + adaptive["challenge"]
+    problems = []
+    if adaptive["challenge"]:
+        problems.append(f"adaptive run was blocked ({adaptive['challenge']} challenge pages)")
+    if adaptive["429"] > MAX_THROTTLED_SHARE * requests_made:
+        problems.append(f"adaptive run got {adaptive['429']} 429s in {requests_made} requests "
+                        f"(limit {MAX_THROTTLED_SHARE:.0%})")
+    if adaptive["ok"] < MIN_SPEEDUP * polite["ok"]:
+        problems.append(f"adaptive run fetched {adaptive['ok']} pages, "
+                        f"less than {MIN_SPEEDUP}x the polite run's {polite['ok']}")
+    return problems
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fixed versus adaptive domain limits against a throttling mock site")
+    parser.add_argument("--seconds", type=float, default=60, help="run time of each scenario")
+    parser.add_argument("--workers", type=int, default=16, help="fetching threads")
+    args = parser.parse_args()
+
+    server, base_url = start_server()
+    try:
+        results = [(name, run_scenario(base_url, name, limits, args.seconds, args.workers))
+                   for name, limits in SCENARIOS]
+    finally:
+        server.shutdown()
+    print_results(results)
+
+    problems = check_results(results)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems:
+        sys.exit(1)
+    print("OK: adaptive limits were never blocked, stayed under the 429 limit and beat the polite rate")
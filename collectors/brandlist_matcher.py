@@ -0,0 +1,79 @@
+"""Index of "already taken" products from brandlist.csv.
+
+The filter scripts mark a product as taken when its brand is in the brandlist,
+or when its name and a brandlist product name contain one another. Checking
+every product against every brandlist entry is O(products x brandlist), so
+the index answers both directions without that loop:
+
+- taken entry inside the product name: every substring of the name whose
+  length matches some entry is looked up in a hash set of entries
+- product name inside a taken entry: the product names are compiled into a
+  KeywordMatcher and the brandlist is scanned through it once
+
+The result is exactly the same as the old nested loops.
+"""
+from keyword_matcher import KeywordMatcher
+
+class BrandlistIndex:
+    """Brandlist entries prepared for fast "is this product taken" checks
+
+    taken_products / taken_brands should already be stripped and lowercased.
+    min_length ignores product entries shorter than that many characters, and
+    skip_empty ignores empty entries and empty product names (filterW.py rules).
+    """
+
+    def __init__(self, taken_products, taken_brands=(), min_length=0, skip_empty=False):
+        entries = [entry for entry in dict.fromkeys(taken_products) if len(entry) >= min_length]
+        if skip_empty:
+            entries = [entry for entry in entries if entry]
+
+        self.skip_empty = skip_empty
+        self.entries = entries
+        self.entry_set = set(entries)
+        self.entry_lengths = sorted({len(entry) for entry in entries if entry})
+        self.brand_set = {brand for brand in taken_brands if brand}
+        # An empty entry is contained in every name
+        self.empty_entry = "" in self.entry_set
+
+    def entry_in_name(self, name):
+        """True if any brandlist entry is a substring of the name"""
+        if self.empty_entry:
+            return True
+        entry_set = self.entry_set
+        for length in self.entry_lengths:
+            if length > len(name):
+                break
+            for start in range(len(name) - length + 1):
+                if name[start:start + length] in entry_set:
+                    return True
+        return False
+
+    def names_inside_entries(self, names):
+        """The subset of names that appear inside some brandlist entry"""
+        matcher = KeywordMatcher(name for name in set(names) if name)
+        found = set()
+        for entry in self.entries:
+            for _, name in matcher.find_all(entry):
+                found.add(name)
+        return found
+
+    def mark_taken(self, names, brands=None):
+        """List of True/False (taken or not) for each product name (and brand)"""
+        names = list(names)
+        brands = list(brands) if brands is not None else [""] * len(names)
+        inside_entries = self.names_inside_entries(names)
+
+        taken = []
+        for name, brand in zip(names, brands):
+            if brand and brand in self.brand_set:
+                taken.append(True)
+            elif not name:
+                # "" is inside every entry, unless empty names are ignored
+                taken.append(not self.skip_empty and bool(self.entries))
+            else:
+                taken.append(
+                    name in self.entry_set
+                    or name in inside_entries
+                    or self.entry_in_name(name)
+                )
+        return taken
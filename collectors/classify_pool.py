@@ -0,0 +1,83 @@
+"""Product page classification in a pool of worker processes.
+
+The Watsons detectors (is_single_product, the keyword detectors, ingredient
+cleanup) are pure Python and CPU bound. Run inline they hold the thread that
+drives the browser (the browser waits while Python classifies) and, because
+of the GIL, use one core however many browser threads there are.
+
+Here the fetching threads only capture each page's PageSnapshot and submit
+it; PROCESSES worker processes classify the snapshots while the threads load
+the next pages.
+
+    future = classify_pool.submit(snapshot)
+    ...                                    # fetch the next page meanwhile
+    record = classify_pool.result(future, url)  # None for a bundle
+
+Workers are started with "spawn" on every platform (the Windows default),
+so they don't inherit browsers, the state database or held locks. Their
+detector timings are sent back with each result and recorded in the run's
+crawl_metrics as if they had run in this process.
+"""
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import crawl_metrics
+import watsons_detectors as detectors
+from page_snapshot import PageSnapshot
+
+# Leave one core for the browsers and the writer
+PROCESSES = max(1, (os.cpu_count() or 2) - 1)
+
+pool = None
+pool_lock = threading.Lock()
+
+def classify(data):
+    """Worker process: snapshot dict -> (record or None for a bundle, detector timings)"""
+    record = detectors.classify_snapshot(PageSnapshot.from_dict(data))
+    return record, crawl_metrics.take_durations()
+
+def get_pool():
+    """The shared process pool, started on first use"""
+    global pool
+    with pool_lock:
+        if pool is None:
+            pool = ProcessPoolExecutor(PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return pool
+
+def submit(snapshot):
+    """Start classifying a snapshot; returns a Future for result()"""
+    return get_pool().submit(classify, snapshot.to_dict())
+
+def result(future, url=None):
+    """The record of a submitted snapshot (None for a bundle); raises what the detectors raised"""
+    record, timings = future.result()
+    crawl_metrics.add_durations(timings, url)
+    return record
+
+def classify_many(items, window=None):
+    """(key, snapshot) pairs -> (key, record) in the same order
+
+    Keeps up to window snapshots (default 4 per process) in the pool, so a
+    long iterator isn't loaded into memory all at once.
+    """
+    window = window or PROCESSES * 4
+    pending = deque()
+    for key, snapshot in items:
+        pending.append((key, snapshot.url, submit(snapshot)))
+        if len(pending) >= window:
+            key, url, future = pending.popleft()
+            yield key, result(future, url)
+    while pending:
+        key, url, future = pending.popleft()
+        yield key, result(future, url)
+
+def shutdown():
+    """Stop the worker processes (a later submit() starts new ones)"""
+    global pool
+    with pool_lock:
+        if pool is not None:
+            pool.shutdown()
+            pool = None
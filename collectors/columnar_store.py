@@ -0,0 +1,219 @@
+"""Columnar (Parquet) copy of a collector's output CSV.
+
+The CSV stays the main output. With Parquet output switched on, every row
+written to the CSV is also buffered here and written in row groups to a
+Parquet dataset next to it:
+
+    output/watsons_products.csv
+    output/watsons_products.parquet/part-20250101-120000-0.parquet
+    output/watsons_products.parquet/part-20250102-093000-0.parquet
+
+Each run appends a new part file (a Parquet file can't be reopened for
+appending), and an export from the crawl state rewrites the dataset as a
+single part. Brand, category and the other short repeated columns are
+dictionary-encoded; the long free-text ones (ingredients, URLs) are plain.
+
+Readers memory-map the part files and only decode the columns they ask for,
+so filtering on brand/product name never touches the ingredient text:
+
+    df = columnar_store.read_columns("watsons_products.csv", ["brandName", "productName"])
+
+pyarrow is optional: without it nothing is written and read_columns returns
+None, so callers fall back to the CSV. The same happens when the CSV is newer
+than the dataset (edited or replaced after the last Parquet write, or copied
+without it), so a stale copy is never read instead of the CSV.
+"""
+import glob
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Rows buffered before a row group is written
+ROW_GROUP_SIZE = 500
+
+# Cells pandas.read_csv reads as NaN by default; read_columns does the same
+# so a DataFrame from Parquet matches one from the CSV
+MISSING_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# Slack for file systems with coarse timestamps when comparing CSV and dataset times
+MTIME_SLACK = 2.0
+
+# Few distinct values repeated on many rows: stored as dictionary indexes
+DICTIONARY_COLUMNS = {
+    "brandName", "brand_name", "categoryType", "category",
+    "babyProduct", "eczemaProduct", "country",
+}
+
+def available():
+    return pa is not None
+
+def dataset_path(csv_path):
+    """Directory of the Parquet dataset that goes with an output CSV"""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+def part_files(csv_path):
+    return sorted(glob.glob(os.path.join(dataset_path(csv_path), "part-*.parquet")))
+
+def exists(csv_path):
+    return available() and bool(part_files(csv_path))
+
+def is_current(csv_path):
+    """True if the dataset exists and is not older than the CSV"""
+    paths = part_files(csv_path) if available() else []
+    return bool(paths) and not is_stale(csv_path, paths)
+
+def is_stale(csv_path, paths):
+    """True if the CSV was written after the newest part file"""
+    try:
+        return os.path.getmtime(csv_path) > max(os.path.getmtime(path) for path in paths) + MTIME_SLACK
+    except OSError:
+        return False
+
+def schema(fieldnames):
+    """Every column is text; the repeated ones are dictionary-encoded"""
+    return pa.schema([
+        (name, pa.dictionary(pa.int32(), pa.string()) if name in DICTIONARY_COLUMNS else pa.string())
+        for name in fieldnames
+    ])
+
+def to_table(rows, table_schema):
+    columns = {
+        name: [None if row.get(name) is None else str(row.get(name)) for row in rows]
+        for name in table_schema.names
+    }
+    return pa.Table.from_pydict(columns, schema=table_schema)
+
+def new_part_path(csv_path):
+    directory = dataset_path(csv_path)
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    number = 0
+    while os.path.exists(os.path.join(directory, f"part-{stamp}-{number}.parquet")):
+        number += 1
+    return os.path.join(directory, f"part-{stamp}-{number}.parquet")
+
+class ParquetAppender:
+    """Writes rows (dicts, like csv.DictWriter) to a new part file, one row group per ROW_GROUP_SIZE rows
+
+    The part file is only created once the first row group is written, and
+    is only readable after close().
+    """
+
+    def __init__(self, csv_path, fieldnames, row_group_size=ROW_GROUP_SIZE):
+        self.csv_path = csv_path
+        self.schema = schema(fieldnames)
+        self.row_group_size = row_group_size
+        self.rows = []
+        self.writer = None
+        self.path = None
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def writeheader(self):
+        pass
+
+    def writerow(self, row):
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) >= self.row_group_size:
+                self.write_row_group()
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            self.path = new_part_path(self.csv_path)
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        self.writer.write_table(to_table(self.rows, self.schema), row_group_size=len(self.rows))
+        self.written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        with self.lock:
+            self.write_row_group()
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+                print(f"Appended {self.written} rows to {self.path}")
+
+class TeeWriter:
+    """Sends writeheader/writerow to several writers; None entries are ignored"""
+
+    def __init__(self, *writers):
+        self.writers = [writer for writer in writers if writer is not None]
+
+    def writeheader(self):
+        for writer in self.writers:
+            writer.writeheader()
+
+    def writerow(self, row):
+        for writer in self.writers:
+            writer.writerow(row)
+
+@contextmanager
+def parquet_output(csv_path, fieldnames, enabled=True):
+    """A ParquetAppender for the run, closed at the end (None if disabled or pyarrow is missing)"""
+    if not enabled:
+        yield None
+        return
+    if not available():
+        print("pyarrow is not installed: writing the CSV only (pip install pyarrow)")
+        yield None
+        return
+    appender = ParquetAppender(csv_path, fieldnames)
+    try:
+        yield appender
+    finally:
+        appender.close()
+
+def write_dataset(rows, csv_path, fieldnames):
+    """Replace the dataset with one part file holding rows; returns the row count (None without pyarrow)"""
+    if not available():
+        print("pyarrow is not installed: Parquet output skipped (pip install pyarrow)")
+        return None
+    old_parts = part_files(csv_path)
+    appender = ParquetAppender(csv_path, fieldnames)
+    for row in rows:
+        appender.writerow(row)
+    appender.close()
+    for path in old_parts:
+        if path != appender.path:
+            os.remove(path)
+    return appender.written
+
+def read_columns(csv_path, columns=None):
+    """DataFrame of the given columns (all if None) from the Parquet dataset, or None if there is none
+
+    Part files are memory-mapped and only the requested columns are decoded.
+    Dictionary columns come back as plain strings and MISSING_VALUES as NaN,
+    like the CSV. None if the CSV is newer than the dataset.
+    """
+    paths = part_files(csv_path) if available() else []
+    if not paths:
+        return None
+    if is_stale(csv_path, paths):
+        print(f"{dataset_path(csv_path)} is older than {os.path.basename(csv_path)}, using the CSV instead")
+        return None
+    try:
+        tables = [pq.read_table(path, columns=columns, memory_map=True) for path in paths]
+        table = pa.concat_tables(tables, promote_options="default")
+    except Exception as e:
+        print(f"Could not read {dataset_path(csv_path)} ({e}), using the CSV instead")
+        return None
+    for index, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(index, field.name, table.column(index).cast(pa.string()))
+    print(f"✓ Read {table.num_rows} rows ({', '.join(table.column_names)}) from {dataset_path(csv_path)}")
+    df = table.to_pandas()
+    return df.mask(df.isin(MISSING_VALUES))
@@ -0,0 +1,172 @@
+"""Per-stage timings and event counters for a collector run.
+
+Every timed stage of a product scrape (navigation, readiness wait, HTTP
+fetch, each detector, ingredient extraction, CSV write) and every counted
+event (retry, failure, wait timeout) is:
+
+- appended to crawl_metrics.jsonl as it happens, one JSON object per line
+- summed into histograms written to crawl_metrics.prom in the Prometheus
+  text format at the end of the run (for node_exporter's textfile collector
+  or just for reading)
+- printed as a summary table at the end of the run
+
+    crawl_metrics.start_run("watsons")
+    with crawl_metrics.timed("csv_write", url):
+        writer.writerow(data)
+    crawl_metrics.count("retry", url)
+    crawl_metrics.finish_run()
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_JSONL = "crawl_metrics.jsonl"
+METRICS_PROM = "crawl_metrics.prom"
+
+# Histogram bucket upper bounds (seconds) for the Prometheus file
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+metrics_lock = threading.Lock()
+run = {"retailer": "unknown", "run_id": None, "started": time.perf_counter()}
+durations = {}  # stage -> list of seconds
+failures = {}   # stage -> number of timed calls that raised
+counters = {}   # event -> count
+jsonl_file = None
+
+def start_run(retailer, jsonl_path=METRICS_JSONL):
+    """Reset the metrics and start appending events for a new run"""
+    global jsonl_file
+    with metrics_lock:
+        run["retailer"] = retailer
+        run["run_id"] = time.strftime("%Y%m%d-%H%M%S")
+        run["started"] = time.perf_counter()
+        durations.clear()
+        failures.clear()
+        counters.clear()
+        if jsonl_file is not None:
+            jsonl_file.close()
+        jsonl_file = open(jsonl_path, "a", encoding="utf-8")
+
+def write_event(event):
+    """Append one event to the JSON-lines file (if a run was started)"""
+    if jsonl_file is not None:
+        event["ts"] = round(time.time(), 3)
+        event["run"] = run["run_id"]
+        event["retailer"] = run["retailer"]
+        jsonl_file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        jsonl_file.flush()
+
+def observe(stage, seconds, url=None, ok=True):
+    """Record how long one stage took for one URL"""
+    with metrics_lock:
+        durations.setdefault(stage, []).append(seconds)
+        if not ok:
+            failures[stage] = failures.get(stage, 0) + 1
+        write_event({"type": "stage", "stage": stage, "url": url,
+                     "seconds": round(seconds, 6), "ok": ok})
+
+@contextmanager
+def timed(stage, url=None):
+    """Time the block as one stage; a raised exception is recorded as a failed call"""
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        observe(stage, time.perf_counter() - start, url, ok)
+
+def count(event, url=None, amount=1):
+    """Count an event such as a retry or a failure"""
+    with metrics_lock:
+        counters[event] = counters.get(event, 0) + amount
+        write_event({"type": "count", "event": event, "url": url, "amount": amount})
+
+def take_durations():
+    """The stage timings recorded so far as {stage: [seconds]}, then forgotten
+
+    Used in worker processes to send their timings back with each result.
+    """
+    with metrics_lock:
+        taken = dict(durations)
+        durations.clear()
+        failures.clear()
+    return taken
+
+def add_durations(timings, url=None):
+    """Record timings taken in another process (take_durations) as stages of this run"""
+    for stage, values in timings.items():
+        for seconds in values:
+            observe(stage, seconds, url)
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+def print_summary():
+    """Table of calls, total/average/p50/p95 time and share of the run per stage"""
+    with metrics_lock:
+        stages = {stage: sorted(values) for stage, values in durations.items()}
+        events = dict(counters)
+        elapsed = time.perf_counter() - run["started"]
+    if not stages and not events:
+        return
+
+    print(f"\nRun metrics ({run['retailer']}, {elapsed:.1f}s wall time):")
+    print(f"  {'stage':<28}{'calls':>7}{'total s':>10}{'avg ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'% wall':>8}{'failed':>8}")
+    for stage, values in sorted(stages.items(), key=lambda item: -sum(item[1])):
+        total = sum(values)
+        print(f"  {stage:<28}{len(values):>7}{total:>10.2f}{total / len(values) * 1000:>10.1f}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{(total / elapsed * 100 if elapsed else 0):>8.1f}{failures.get(stage, 0):>8}")
+    if events:
+        print("  " + ", ".join(f"{event}: {amount}" for event, amount in sorted(events.items())))
+
+def label(value):
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def write_prometheus(path=METRICS_PROM):
+    """Write the run's histograms and counters in the Prometheus text format"""
+    with metrics_lock:
+        stages = {stage: list(values) for stage, values in durations.items()}
+        stage_failures = dict(failures)
+        events = dict(counters)
+    retailer = label(run["retailer"])
+
+    lines = [
+        "# HELP collector_stage_seconds Time spent in each stage of scraping a product",
+        "# TYPE collector_stage_seconds histogram",
+    ]
+    for stage, values in sorted(stages.items()):
+        labels = f'retailer="{retailer}",stage="{label(stage)}"'
+        for bound in BUCKETS:
+            lines.append(f'collector_stage_seconds_bucket{{{labels},le="{bound}"}} '
+                         f"{sum(1 for value in values if value <= bound)}")
+        lines.append(f'collector_stage_seconds_bucket{{{labels},le="+Inf"}} {len(values)}')
+        lines.append(f"collector_stage_seconds_sum{{{labels}}} {sum(values):.6f}")
+        lines.append(f"collector_stage_seconds_count{{{labels}}} {len(values)}")
+
+    lines.append("# HELP collector_stage_failures_total Timed stage calls that raised an error")
+    lines.append("# TYPE collector_stage_failures_total counter")
+    for stage, amount in sorted(stage_failures.items()):
+        lines.append(f'collector_stage_failures_total{{retailer="{retailer}",stage="{label(stage)}"}} {amount}')
+
+    lines.append("# HELP collector_events_total Retries, failures and other counted events")
+    lines.append("# TYPE collector_events_total counter")
+    for event, amount in sorted(events.items()):
+        lines.append(f'collector_events_total{{retailer="{retailer}",event="{label(event)}"}} {amount}')
+
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write("\n".join(lines) + "\n")
+
+def finish_run():
+    """Print the summary table, write the Prometheus file and close the JSON-lines file"""
+    global jsonl_file
+    print_summary()
+    write_prometheus()
+    with metrics_lock:
+        if jsonl_file is not None:
+            jsonl_file.close()
+            jsonl_file = None
+    print(f"Metrics saved to: {METRICS_JSONL}, {METRICS_PROM}")
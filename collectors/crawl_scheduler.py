@@ -0,0 +1,190 @@
+"""Run category and product URLs for several retailers at the same time.
+
+    python crawl_scheduler.py jobs.txt
+
+jobs.txt lists one URL per line (# starts a comment, blank lines are
+ignored); the retailer is worked out from the URL's host:
+
+    # Watsons
+    https://www.watsons.com.my/face-wash-cleanser/c/120101
+    https://www.watsons.com.my/some-product/p/BP_12345
+    # Sephora
+    https://www.sephora.my/categories/skincare/cleanser
+
+Each retailer gets its own thread that works through its URLs in file order
+with that retailer's collector (scrape_category or scrape_single_product),
+so the retailers run side by side and the whole run takes about as long as
+the slowest retailer instead of the sum of all of them. One retailer's jobs
+run one after another because they append to the same output CSV; within a
+category job Watsons uses `workers` browsers.
+
+Requests to each retailer's domain are limited by domain_limits: at most
+`concurrency` requests in flight and `requests_per_second` request starts.
+With `adaptive` those are starting values that domain_limits raises while
+the site answers quickly and cuts on 429s, challenge pages, errors and empty
+extractions, up to `max_concurrency` / `max_requests_per_second`.
+Adding a retailer (Guardian, Lazada, Shopee) means a collector module with
+scrape_category/scrape_single_product and an entry in RETAILERS.
+"""
+import importlib
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import crawl_metrics
+import crawl_state
+import domain_limits
+import page_waits
+
+RETAILERS = {
+    "watsons": {
+        "module": "watsons_collector",
+        "domain": "watsons.com.my",
+        "product_path": "/p/",
+        "category_kwargs": {"workers": 2},  # browsers per category job
+        "finish": "close_workers",  # browsers and classification processes
+        "concurrency": 4,  # browsers + plain HTTP requests in flight
+        "requests_per_second": 2,
+        "adaptive": True,
+        "max_concurrency": 8,
+        "max_requests_per_second": 6,
+    },
+    "sephora": {
+        "module": "sephora_collector",
+        "domain": "sephora.my",
+        "product_path": "/products/",
+        "category_kwargs": {},  # the collector drives a single Chrome
+        "finish": "quit_driver",
+        "concurrency": 1,
+        "requests_per_second": 1,
+        "adaptive": True,
+        "max_concurrency": 1,  # one Chrome and no plain HTTP requests: only the rate adapts
+        "max_requests_per_second": 3,
+    },
+}
+
+def retailer_for(url):
+    """Key in RETAILERS for a URL, or None if no collector handles its host"""
+    host = (urlparse(url).hostname or "").lower()
+    for retailer, config in RETAILERS.items():
+        domain = config["domain"]
+        if host == domain or host.endswith("." + domain):
+            return retailer
+    return None
+
+def read_jobs(path):
+    """{retailer: [url, ...]} from a job file, in file order"""
+    jobs = {}
+    with open(path, "r", encoding="utf-8-sig") as f:
+        for line_number, line in enumerate(f, 1):
+            url = line.split("#", 1)[0].strip()
+            if not url:
+                continue
+            retailer = retailer_for(url)
+            if retailer is None:
+                print(f"Line {line_number}: no collector for {url}, skipped")
+                continue
+            jobs.setdefault(retailer, []).append(url)
+    return jobs
+
+class RetailerRun:
+    """Outcome of one retailer's jobs
+
+    The collectors handle (and print) their own product errors, so what
+    happened to the products is read from the crawl state afterwards:
+    products counts every product saved during the run by status. errors
+    counts the jobs that raised anyway (or couldn't start).
+    """
+
+    def __init__(self, retailer, urls):
+        self.retailer = retailer
+        self.urls = urls
+        self.errors = 0
+        self.products = {}
+        self.started = time.time()
+        self.seconds = 0.0
+
+def run_retailer(run):
+    """Work through one retailer's URLs with its collector (runs in the retailer's thread)"""
+    config = RETAILERS[run.retailer]
+    start = time.perf_counter()
+    run.started = time.time()
+    module = None
+    try:
+        module = importlib.import_module(config["module"])
+        for i, url in enumerate(run.urls, 1):
+            print(f"[{run.retailer} {i}/{len(run.urls)}] {url}")
+            try:
+                if config["product_path"] in url:
+                    module.scrape_single_product(url)
+                else:
+                    module.scrape_category(url, **config["category_kwargs"])
+            except Exception as e:
+                run.errors += 1
+                print(f"[{run.retailer}] Job failed: {url} - {e}")
+    except Exception as e:
+        run.errors = len(run.urls)
+        print(f"[{run.retailer}] Could not start the collector: {e}")
+    finally:
+        if module is not None:
+            try:
+                getattr(module, config["finish"])()
+            except Exception as e:
+                print(f"[{run.retailer}] Could not shut the collector down: {e}")
+        run.seconds = time.perf_counter() - start
+        try:
+            run.products = crawl_state.status_counts(crawl_state.get_state(), run.retailer, run.started)
+        except Exception as e:
+            print(f"[{run.retailer}] Could not read the crawl state: {e}")
+
+def run_jobs(jobs):
+    """Run every retailer's jobs in parallel; returns the RetailerRun of each retailer"""
+    runs = []
+    for retailer, urls in jobs.items():
+        config = RETAILERS[retailer]
+        domain_limits.configure(
+            config["domain"], config["concurrency"], config["requests_per_second"],
+            config.get("adaptive", False), config.get("max_concurrency"), config.get("max_requests_per_second"),
+        )
+        runs.append(RetailerRun(retailer, urls))
+
+    threads = [threading.Thread(target=run_retailer, args=(run,), name=run.retailer) for run in runs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return runs
+
+def print_summary(runs, elapsed):
+    print("\nScheduler summary:")
+    for run in runs:
+        products = ", ".join(f"{run.products.get(status, 0)} {status}"
+                             for status in ("scraped", "skipped", "failed", "removed") if status in run.products)
+        errors = f" ({run.errors} crashed)" if run.errors else ""
+        print(f"  {run.retailer:<10} {len(run.urls):>3} jobs{errors} in {run.seconds:.1f}s: "
+              f"{products or 'no products saved'}")
+    sequential = sum(run.seconds for run in runs)
+    print(f"  Wall time {elapsed:.1f}s (one retailer after another: {sequential:.1f}s)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python crawl_scheduler.py <jobs.txt>")
+        sys.exit(1)
+
+    jobs = read_jobs(sys.argv[1])
+    if not jobs:
+        print("No jobs to run.")
+        sys.exit(1)
+    print("Jobs: " + ", ".join(f"{retailer} {len(urls)}" for retailer, urls in jobs.items()))
+
+    crawl_metrics.start_run("+".join(jobs))
+    start = time.perf_counter()
+    runs = run_jobs(jobs)
+    elapsed = time.perf_counter() - start
+
+    crawl_state.close_state()
+    page_waits.print_timing_summary()
+    page_waits.save_timings()
+    crawl_metrics.finish_run()
+    print_summary(runs, elapsed)
@@ -0,0 +1,548 @@
+"""SQLite crawl state shared by the collectors.
+
+Every product URL a collector has handled is stored once per retailer with
+its status, the time it was scraped and the record that went into the CSV.
+Checking whether a URL was already scraped is an indexed lookup instead of
+re-reading the whole output CSV, and the CSV files can always be regenerated
+from the store with export_csv().
+
+Statuses:
+    scraped - record written to the CSV
+    skipped - bundle/combo, never needs scraping again
+    failed  - scraping raised an error, will be retried next run
+    removed - the page is gone (404/410) when refreshing
+
+Category runs are also checkpointed: the URL list found by category discovery
+is journaled together with each URL's attempts, so a run that was interrupted
+(Chrome crash, Ctrl+C, machine asleep) resumes where it stopped without
+paginating the category again. Failed URLs are retried with exponential
+backoff up to MAX_ATTEMPTS times in total.
+
+For incremental refreshes each product's validators are kept as well: the
+ETag / Last-Modified headers from the last fetch and a hash of the page
+content the record was extracted from, and page_cache points each product at
+its cached page snapshot (see page_cache).
+
+A record's ingredient text is not kept in its JSON (see ingredient_vocab):
+it is stored as the IDs of its canonical names, for indexing and queries,
+and compressed exactly as scraped, to be put back when the record is loaded.
+The inverted index of ingredients and detector columns (see
+ingredient_index) is updated with every saved product.
+"""
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import columnar_store
+import crawl_metrics
+import ingredient_index
+import ingredient_vocab
+
+STATE_DB = "crawl_state.db"
+
+# URLs with these statuses are not scraped again
+DONE_STATUSES = ("scraped", "skipped")
+
+# Attempts per URL within one category run, and the backoff between them (seconds)
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 30
+
+connections = {}
+vocabularies = {}  # connection -> ingredient_vocab.Vocabulary
+text_dictionaries = {}  # connection -> ingredient_vocab.TextDictionaries
+state_lock = threading.RLock()  # one connection is shared by all threads
+
+def get_state(db_path=STATE_DB):
+    """Open (once) and return the state database"""
+    with state_lock:
+        conn = connections.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS products (
+                    retailer   TEXT NOT NULL,
+                    url        TEXT NOT NULL,
+                    status     TEXT NOT NULL,
+                    scraped_at REAL NOT NULL,
+                    record     TEXT,
+                    error      TEXT,
+                    ingredient_ids BLOB,
+                    ingredient_text BLOB,
+                    PRIMARY KEY (retailer, url)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_cache (
+                    retailer     TEXT NOT NULL,
+                    url          TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    cached_at    REAL NOT NULL,
+                    PRIMARY KEY (retailer, url)
+                )
+            """)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(products)")]
+            if "ingredient_ids" not in columns:  # state from before ingredient IDs
+                conn.execute("ALTER TABLE products ADD COLUMN ingredient_ids BLOB")
+            if "ingredient_text" not in columns:  # state from before the text was compressed
+                conn.execute("ALTER TABLE products ADD COLUMN ingredient_text BLOB")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ingredients (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)"
+            )
+            new_index = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'postings'"
+            ).fetchone() is None
+            ingredient_index.create_tables(conn)
+            if new_index:  # state from before the index: index what is stored
+                ingredient_index.rebuild(conn)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS category_runs (
+                    retailer     TEXT NOT NULL,
+                    category_url TEXT NOT NULL,
+                    started_at   REAL NOT NULL,
+                    finished_at  REAL,
+                    PRIMARY KEY (retailer, category_url)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS run_urls (
+                    retailer     TEXT NOT NULL,
+                    category_url TEXT NOT NULL,
+                    position     INTEGER NOT NULL,
+                    url          TEXT NOT NULL,
+                    status       TEXT NOT NULL DEFAULT 'pending',
+                    attempts     INTEGER NOT NULL DEFAULT 0,
+                    error        TEXT,
+                    PRIMARY KEY (retailer, category_url, url)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS page_validators (
+                    retailer      TEXT NOT NULL,
+                    url           TEXT NOT NULL,
+                    etag          TEXT,
+                    last_modified TEXT,
+                    content_hash  TEXT,
+                    checked_at    REAL NOT NULL,
+                    PRIMARY KEY (retailer, url)
+                )
+            """)
+            conn.commit()
+            connections[db_path] = conn
+        return conn
+
+def close_state():
+    """Close every open state database"""
+    with state_lock:
+        for conn in connections.values():
+            conn.close()
+        connections.clear()
+        vocabularies.clear()
+        text_dictionaries.clear()
+
+def get_vocabulary(conn):
+    """The ingredient vocabulary of a state database"""
+    with state_lock:
+        vocabulary = vocabularies.get(conn)
+        if vocabulary is None:
+            vocabulary = vocabularies[conn] = ingredient_vocab.Vocabulary(conn, state_lock)
+        return vocabulary
+
+def get_text_dictionaries(conn):
+    """The dictionaries ingredient texts are compressed with in a state database"""
+    with state_lock:
+        dictionaries = text_dictionaries.get(conn)
+        if dictionaries is None:
+            dictionaries = text_dictionaries[conn] = ingredient_vocab.TextDictionaries(conn, state_lock)
+        return dictionaries
+
+def encode_record(conn, record):
+    """(record JSON, packed ingredient IDs, compressed ingredient text) for storing a record
+
+    An ingredient list is moved out of the JSON (which keeps the key, as
+    null, so the columns stay in order); a missing one ("", "N/A") stays in
+    the JSON and the other two are None.
+    """
+    if record is None:
+        return None, None, None
+    text = record.get(ingredient_vocab.INGREDIENT_FIELD)
+    ids = get_vocabulary(conn).encode(text)
+    if ids is None:
+        return json.dumps(record, ensure_ascii=False), None, None
+    record = dict(record)
+    record[ingredient_vocab.INGREDIENT_FIELD] = None
+    return (json.dumps(record, ensure_ascii=False),
+            ingredient_vocab.pack_ids(ids), get_text_dictionaries(conn).compress(text))
+
+def stored_terms(retailer, status, record_json, ingredient_ids):
+    """Index terms of a stored product row (none unless it is scraped)"""
+    if status != "scraped" or not record_json:
+        return set()
+    ids = ingredient_vocab.unpack_ids(ingredient_ids) if ingredient_ids is not None else None
+    return ingredient_index.product_terms(retailer, json.loads(record_json), ids)
+
+def decode_record(conn, record_json, ingredient_ids, ingredient_text=None):
+    """A stored record (JSON) as a dict, with its ingredient text put back
+
+    The text is decompressed exactly as scraped. Records saved while only the
+    canonical IDs were stored get the canonical names instead.
+    """
+    record = json.loads(record_json)
+    if record.get(ingredient_vocab.INGREDIENT_FIELD) is not None:  # no list, or stored before compaction
+        return record
+    if ingredient_text is not None:
+        record[ingredient_vocab.INGREDIENT_FIELD] = get_text_dictionaries(conn).decompress(ingredient_text)
+    elif ingredient_ids is not None:
+        ids = ingredient_vocab.unpack_ids(ingredient_ids)
+        record[ingredient_vocab.INGREDIENT_FIELD] = get_vocabulary(conn).decode(ids)
+    return record
+
+def is_done(conn, retailer, url):
+    """True if the URL was already scraped (or skipped as a bundle)"""
+    with state_lock:
+        row = conn.execute(
+            "SELECT status FROM products WHERE retailer = ? AND url = ?", (retailer, url)
+        ).fetchone()
+    return row is not None and row[0] in DONE_STATUSES
+
+def filter_new_urls(conn, retailer, urls):
+    """The URLs that still need scraping, in their original order"""
+    return [url for url in urls if not is_done(conn, retailer, url)]
+
+def count_products(conn, retailer, status="scraped"):
+    """Number of stored products with the given status"""
+    with state_lock:
+        return conn.execute(
+            "SELECT COUNT(*) FROM products WHERE retailer = ? AND status = ?", (retailer, status)
+        ).fetchone()[0]
+
+def status_counts(conn, retailer, since=0.0):
+    """{status: number of products} for the products saved at or after since (a time.time())"""
+    with state_lock:
+        rows = conn.execute(
+            "SELECT status, COUNT(*) FROM products WHERE retailer = ? AND scraped_at >= ? GROUP BY status",
+            (retailer, since),
+        ).fetchall()
+    return dict(rows)
+
+def save_product(conn, retailer, url, status, record=None, error=None):
+    """Insert or update one product's state"""
+    crawl_metrics.count(f"product_{status}", url)
+    with state_lock:
+        record_json, ingredient_ids, ingredient_text = encode_record(conn, record)
+        old = conn.execute(
+            "SELECT rowid, status, record, ingredient_ids FROM products WHERE retailer = ? AND url = ?",
+            (retailer, url),
+        ).fetchone()
+        cursor = conn.execute(
+            """
+            INSERT INTO products (retailer, url, status, scraped_at, record, error, ingredient_ids, ingredient_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (retailer, url) DO UPDATE SET
+                status = excluded.status,
+                scraped_at = excluded.scraped_at,
+                record = excluded.record,
+                error = excluded.error,
+                ingredient_ids = excluded.ingredient_ids,
+                ingredient_text = excluded.ingredient_text
+            """,
+            (retailer, url, status, time.time(), record_json,
+             str(error) if error is not None else None, ingredient_ids, ingredient_text),
+        )
+        ingredient_index.index_product(
+            conn, old[0] if old else cursor.lastrowid,
+            stored_terms(retailer, *old[1:]) if old else set(),
+            stored_terms(retailer, status, record_json, ingredient_ids),
+        )
+        conn.commit()
+
+def load_records(conn, retailer):
+    """All scraped records for a retailer, in the order they were scraped"""
+    with state_lock:
+        rows = conn.execute(
+            "SELECT record, ingredient_ids, ingredient_text FROM products WHERE retailer = ? AND status = 'scraped' "
+            "ORDER BY scraped_at, rowid",
+            (retailer,),
+        ).fetchall()
+    return [decode_record(conn, *row) for row in rows if row[0]]
+
+def load_record(conn, retailer, url):
+    """The stored record of one product, or None"""
+    with state_lock:
+        row = conn.execute(
+            "SELECT record, ingredient_ids, ingredient_text FROM products WHERE retailer = ? AND url = ?",
+            (retailer, url),
+        ).fetchone()
+    return decode_record(conn, *row) if row and row[0] else None
+
+def load_ingredient_ids(conn, retailer):
+    """{url: ingredient ID array} of the scraped products that have an ingredient list"""
+    with state_lock:
+        rows = conn.execute(
+            "SELECT url, ingredient_ids FROM products WHERE retailer = ? AND status = 'scraped' "
+            "AND ingredient_ids IS NOT NULL ORDER BY scraped_at, rowid",
+            (retailer,),
+        ).fetchall()
+    return {url: ingredient_vocab.unpack_ids(blob) for url, blob in rows}
+
+def compact_ingredients(conn):
+    """Recompress every stored ingredient text with a new dictionary built from all of them
+
+    Texts still kept in a record's JSON (stored before they were compressed)
+    are moved out of it as well. Returns the number of records rewritten.
+    """
+    dictionaries = get_text_dictionaries(conn)
+    with state_lock:
+        rows = conn.execute(
+            "SELECT rowid, retailer, status, record, ingredient_ids, ingredient_text FROM products "
+            "WHERE record IS NOT NULL"
+        ).fetchall()
+        records = []
+        for rowid, retailer, status, old_json, old_ids, old_text in rows:
+            record = decode_record(conn, old_json, old_ids, old_text)
+            if ingredient_vocab.canonical_names(record.get(ingredient_vocab.INGREDIENT_FIELD)) is not None:
+                records.append((rowid, retailer, status, old_json, old_ids, record))
+        if not records:
+            return 0
+
+        current = dictionaries.add(record[ingredient_vocab.INGREDIENT_FIELD] for *_, record in records)
+        for rowid, retailer, status, old_json, old_ids, record in records:
+            record_json, ingredient_ids, ingredient_text = encode_record(conn, record)
+            conn.execute(
+                "UPDATE products SET record = ?, ingredient_ids = ?, ingredient_text = ? WHERE rowid = ?",
+                (record_json, ingredient_ids, ingredient_text, rowid),
+            )
+            ingredient_index.index_product(
+                conn, rowid,
+                stored_terms(retailer, status, old_json, old_ids),
+                stored_terms(retailer, status, record_json, ingredient_ids),
+            )
+        dictionaries.remove_except(current)
+        conn.commit()
+    return len(records)
+
+def ensure_text_dictionary(conn):
+    """Compact the ingredient texts once, as soon as enough are stored to build a dictionary"""
+    if get_text_dictionaries(conn).current():
+        return
+    with state_lock:
+        stored = conn.execute("SELECT COUNT(*) FROM products WHERE ingredient_text IS NOT NULL").fetchone()[0]
+    if stored >= ingredient_vocab.DICTIONARY_SAMPLE:
+        compact_ingredients(conn)
+
+def stored_urls(conn, retailer, status="scraped"):
+    """URLs of the stored products with the given status, in the order they were scraped"""
+    with state_lock:
+        rows = conn.execute(
+            "SELECT url FROM products WHERE retailer = ? AND status = ? ORDER BY scraped_at, rowid",
+            (retailer, status),
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def import_csv(conn, retailer, csv_file, url_field):
+    """Load rows from an existing output CSV into the store (skips URLs already stored)"""
+    imported = 0
+    with open(csv_file, "r", encoding="utf-8", newline="") as f:
+        with state_lock:
+            for row in csv.DictReader(f):
+                url = row.get(url_field)
+                if not url:
+                    continue
+                record_json, ingredient_ids, ingredient_text = encode_record(conn, row)
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO products "
+                    "(retailer, url, status, scraped_at, record, ingredient_ids, ingredient_text) "
+                    "VALUES (?, ?, 'scraped', ?, ?, ?, ?)",
+                    (retailer, url, time.time(), record_json, ingredient_ids, ingredient_text),
+                )
+                imported += cursor.rowcount
+            conn.commit()
+            if imported:
+                ingredient_index.rebuild(conn)
+    ensure_text_dictionary(conn)
+    return imported
+
+def export_csv(conn, retailer, output_file, fieldnames):
+    """Regenerate the output CSV from the store"""
+    records = load_records(conn, retailer)
+    with open(output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(records)
+    return len(records)
+
+def export_parquet(conn, retailer, output_file, fieldnames):
+    """Rewrite the Parquet copy of the output CSV from the store (None without pyarrow)"""
+    return columnar_store.write_dataset(load_records(conn, retailer), output_file, fieldnames)
+
+def prepare_output(conn, retailer, output_file, fieldnames, url_field):
+    """Keep the store and the output CSV in step before appending new rows
+
+    The first time a retailer is used, rows from an existing CSV are imported.
+    If the CSV is missing but the store has products, the CSV is exported
+    from the store. Returns True if the CSV exists (append, no header needed).
+
+    The store is keyed by retailer, not by output file: a retailer's products
+    all belong to one CSV, and export_csv() writes every one of them.
+    """
+    ensure_text_dictionary(conn)
+    stored = count_products(conn, retailer)
+    if os.path.exists(output_file):
+        if stored == 0:
+            imported = import_csv(conn, retailer, output_file, url_field)
+            print(f"Imported {imported} existing products from {output_file} into {STATE_DB}")
+        else:
+            print(f"Found {stored} existing products in {STATE_DB}")
+        return True
+
+    if stored > 0:
+        exported = export_csv(conn, retailer, output_file, fieldnames)
+        print(f"Exported {exported} stored products to {output_file}")
+        return True
+
+    print("No existing CSV file found. Creating new file.")
+    return False
+
+def load_checkpoint(conn, retailer, category_url):
+    """URLs discovered by an unfinished run of this category, or None if there is none"""
+    with state_lock:
+        run = conn.execute(
+            "SELECT finished_at FROM category_runs WHERE retailer = ? AND category_url = ?",
+            (retailer, category_url),
+        ).fetchone()
+        if run is None or run[0] is not None:
+            return None
+        rows = conn.execute(
+            "SELECT url FROM run_urls WHERE retailer = ? AND category_url = ? ORDER BY position",
+            (retailer, category_url),
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def start_checkpoint(conn, retailer, category_url, urls):
+    """Journal the URLs found by category discovery as a new run"""
+    with state_lock:
+        conn.execute(
+            "DELETE FROM run_urls WHERE retailer = ? AND category_url = ?", (retailer, category_url)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO category_runs (retailer, category_url, started_at, finished_at) "
+            "VALUES (?, ?, ?, NULL)",
+            (retailer, category_url, time.time()),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO run_urls (retailer, category_url, position, url) VALUES (?, ?, ?, ?)",
+            [(retailer, category_url, position, url) for position, url in enumerate(urls)],
+        )
+        conn.commit()
+
+def checkpoint_remaining(conn, retailer, category_url):
+    """URLs of the run still to scrape: not done, attempts left, not already in the store"""
+    with state_lock:
+        rows = conn.execute(
+            """
+            SELECT r.url FROM run_urls r
+            LEFT JOIN products p ON p.retailer = r.retailer AND p.url = r.url
+            WHERE r.retailer = ? AND r.category_url = ?
+              AND r.status != 'done' AND r.attempts < ?
+              AND (p.status IS NULL OR p.status NOT IN (?, ?))
+            ORDER BY r.position
+            """,
+            (retailer, category_url, MAX_ATTEMPTS) + DONE_STATUSES,
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def checkpoint_attempts(conn, retailer, category_url, url):
+    """How many times the URL has failed in this run"""
+    with state_lock:
+        row = conn.execute(
+            "SELECT attempts FROM run_urls WHERE retailer = ? AND category_url = ? AND url = ?",
+            (retailer, category_url, url),
+        ).fetchone()
+    return row[0] if row else 0
+
+def record_attempt(conn, retailer, category_url, url, error=None):
+    """Mark a run URL done, or count a failed attempt when error is given"""
+    with state_lock:
+        if error is None:
+            conn.execute(
+                "UPDATE run_urls SET status = 'done', error = NULL "
+                "WHERE retailer = ? AND category_url = ? AND url = ?",
+                (retailer, category_url, url),
+            )
+        else:
+            conn.execute(
+                "UPDATE run_urls SET status = 'failed', attempts = attempts + 1, error = ? "
+                "WHERE retailer = ? AND category_url = ? AND url = ?",
+                (str(error), retailer, category_url, url),
+            )
+        conn.commit()
+
+def finish_checkpoint(conn, retailer, category_url):
+    """Close the run once nothing is left to retry; returns the URLs that gave up"""
+    if checkpoint_remaining(conn, retailer, category_url):
+        return None
+    with state_lock:
+        conn.execute(
+            "UPDATE category_runs SET finished_at = ? WHERE retailer = ? AND category_url = ?",
+            (time.time(), retailer, category_url),
+        )
+        conn.commit()
+        rows = conn.execute(
+            "SELECT url FROM run_urls WHERE retailer = ? AND category_url = ? AND status = 'failed' "
+            "ORDER BY position",
+            (retailer, category_url),
+        ).fetchall()
+    return [row[0] for row in rows]
+
+def retry_delay(attempt):
+    """Seconds to wait after the given failed attempt (exponential, capped)"""
+    return min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+
+def scrape_with_retries(conn, retailer, category_url, url, scrape, on_error=None):
+    """Call scrape(url), retrying failures with backoff until the run's attempts are used up
+
+    Every failure is journaled. on_error(error) is called before each retry,
+    e.g. to restart a crashed browser. The last error is raised.
+    """
+    attempts = checkpoint_attempts(conn, retailer, category_url, url)
+    while True:
+        try:
+            return scrape(url)
+        except Exception as e:
+            record_attempt(conn, retailer, category_url, url, error=e)
+            attempts += 1
+            if attempts >= MAX_ATTEMPTS:
+                crawl_metrics.count("gave_up", url)
+                raise
+            crawl_metrics.count("retry", url)
+            delay = retry_delay(attempts)
+            print(f"Attempt {attempts}/{MAX_ATTEMPTS} failed for {url}: {e} - retrying in {delay}s")
+            if on_error is not None:
+                on_error(e)
+            time.sleep(delay)
+
+def get_validators(conn, retailer, url):
+    """{"etag", "last_modified", "content_hash"} saved for a product, or {} if none"""
+    with state_lock:
+        row = conn.execute(
+            "SELECT etag, last_modified, content_hash FROM page_validators WHERE retailer = ? AND url = ?",
+            (retailer, url),
+        ).fetchone()
+    if row is None:
+        return {}
+    return {"etag": row[0], "last_modified": row[1], "content_hash": row[2]}
+
+def save_validators(conn, retailer, url, etag=None, last_modified=None, content_hash=None):
+    """Remember a product's validators after checking it"""
+    with state_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO page_validators "
+            "(retailer, url, etag, last_modified, content_hash, checked_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (retailer, url, etag, last_modified, content_hash, time.time()),
+        )
+        conn.commit()
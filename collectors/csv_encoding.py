@@ -0,0 +1,143 @@
+"""Encoding and delimiter detection for the CSV files the scripts read.
+
+brandlist.csv and the product lists come from Excel as often as from the
+collectors, so they may be UTF-8 (with or without a BOM), UTF-16 or a
+Windows code page. Instead of parsing the whole file once per candidate
+encoding, the encoding is worked out from the first SAMPLE_BYTES bytes:
+
+- a BOM decides it (UTF-8, UTF-16 LE/BE)
+- NUL bytes in every other position mean UTF-16 without a BOM
+- a sample that decodes as UTF-8 means UTF-8
+- otherwise cp1252 (Excel's "CSV" on Windows), or latin-1 if the sample uses
+  bytes cp1252 doesn't define
+
+and the file is parsed once. A byte past the sample that doesn't fit the
+encoding (one cp1252 "®" deep inside an otherwise UTF-8 file, say) is read
+as latin-1 - what the old try-every-encoding loop ended up doing for the
+whole file - instead of starting over. Results are cached in CACHE_FILE by
+path, size and modification time, so an unchanged file is never sniffed
+twice.
+
+    df = csv_encoding.read_csv("brandlist.csv")
+    encoding, delimiter = csv_encoding.detect("brandlist.csv")
+"""
+import codecs
+import json
+import os
+
+CACHE_FILE = "csv_encodings.json"
+SAMPLE_BYTES = 64 * 1024
+
+DELIMITERS = [",", ";", "\t", "|"]
+
+cache = None
+fallback_bytes = 0  # bytes read as latin-1 by the error handler
+
+def load_cache():
+    global cache
+    if cache is None:
+        try:
+            with open(CACHE_FILE, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except Exception:
+            cache = {}
+    return cache
+
+def save_cache():
+    try:
+        with open(CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=1)
+    except Exception as e:
+        print(f"Could not save {CACHE_FILE}: {e}")
+
+def file_key(path):
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime
+
+def sniff_encoding(sample):
+    """Best guess at the encoding of a file from its first bytes"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16"
+
+    # ASCII text in UTF-16 has a NUL next to every character
+    pairs = sample[:4096]
+    if len(pairs) >= 2:
+        even_nuls = pairs[0::2].count(0)
+        odd_nuls = pairs[1::2].count(0)
+        if odd_nuls > len(pairs) // 4 and even_nuls == 0:
+            return "utf-16-le"
+        if even_nuls > len(pairs) // 4 and odd_nuls == 0:
+            return "utf-16-be"
+
+    # A multi-byte character may be cut off at the end of the sample
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    try:
+        sample.decode("cp1252")
+        return "cp1252"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+def sniff_delimiter(sample, encoding):
+    """The delimiter that appears most in the header row (comma if none does)"""
+    text = codecs.getincrementaldecoder(encoding)(errors="replace").decode(sample, final=False)
+    header = text.lstrip("\ufeff").splitlines()[0] if text.strip() else ""
+    counts = {delimiter: header.count(delimiter) for delimiter in DELIMITERS}
+    best = max(DELIMITERS, key=lambda delimiter: counts[delimiter])
+    return best if counts[best] else ","
+
+def detect(path):
+    """(encoding, delimiter) of a CSV file, from the cache or a sample of its first bytes"""
+    path_key, size, mtime = file_key(path)
+    entry = load_cache().get(path_key)
+    if entry and entry["size"] == size and entry["mtime"] == mtime:
+        return entry["encoding"], entry["delimiter"]
+
+    with open(path, "rb") as f:
+        sample = f.read(SAMPLE_BYTES)
+    encoding = sniff_encoding(sample)
+    delimiter = sniff_delimiter(sample, encoding)
+    remember(path, encoding, delimiter)
+    return encoding, delimiter
+
+def remember(path, encoding, delimiter):
+    path_key, size, mtime = file_key(path)
+    load_cache()[path_key] = {"size": size, "mtime": mtime, "encoding": encoding, "delimiter": delimiter}
+    save_cache()
+
+def decode_as_latin1(error):
+    """Codec error handler: bytes that don't fit the encoding are read as latin-1"""
+    global fallback_bytes
+    fallback_bytes += error.end - error.start
+    return error.object[error.start:error.end].decode("latin-1"), error.end
+
+codecs.register_error("latin1_fallback", decode_as_latin1)
+
+def read_csv(path, **kwargs):
+    """pandas.read_csv with the detected encoding and delimiter, or None if it can't be read"""
+    import pandas as pd
+    global fallback_bytes
+
+    name = os.path.basename(path)
+    encoding, delimiter = detect(path)
+    kwargs.setdefault("on_bad_lines", "warn")
+    fallback_bytes = 0
+    try:
+        df = pd.read_csv(path, encoding=encoding, encoding_errors="latin1_fallback", sep=delimiter, **kwargs)
+    except Exception as e:
+        print(f"✗ Failed to read {name}: {e}")
+        return None
+    print(f"✓ Read {name} with {encoding} encoding")
+    if fallback_bytes:
+        print(f"⚠ {fallback_bytes} byte(s) in {name} were not {encoding} and were read as latin-1")
+    return df
+
+def open_text(path):
+    """Open a CSV for reading as text with its detected encoding; returns (file, delimiter)"""
+    encoding, delimiter = detect(path)
+    return open(path, "r", encoding=encoding, errors="latin1_fallback", newline=""), delimiter
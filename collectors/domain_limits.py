@@ -0,0 +1,247 @@
+"""Per-domain concurrency and request-rate limits, fixed or adaptive.
+
+Every page request the collectors make (Chrome navigations in
+page_waits.load_page, plain HTTP fetches in watsons_http and the listing API
+in watsons_listing) goes through request(url). For a domain with limits
+configured, request() holds one of the domain's concurrency slots while the
+request runs and spaces request starts at least 1/requests_per_second apart,
+across every thread talking to that domain. Domains without limits are not
+slowed down at all, so the interactive collectors behave as before.
+
+    domain_limits.configure("watsons.com.my", concurrency=2, requests_per_second=2)
+    with domain_limits.request(url):
+        response = session.get(url)
+    domain_limits.report(url, domain_limits.classify_response(response.status_code, response.text), seconds)
+
+A limit for "watsons.com.my" also covers its subdomains (www., api.).
+
+With adaptive=True the limits follow the site (AIMD, like TCP congestion
+control). The collectors report how each request went:
+
+- ok: after INCREASE_AFTER successes in a row, one more concurrent request
+  and RATE_STEP more requests per second (up to the configured maximums)
+- throttled (HTTP 429, challenge/captcha page): concurrency and rate are
+  halved at once, and a Retry-After header pauses the domain
+- error, timeout or empty (an extraction that found nothing, every field
+  "N/A"): halved when more than ERROR_RATE of the last WINDOW requests failed
+- latency: halved when the average response time climbs to LATENCY_FACTOR
+  times the fastest average seen (the site is queueing our requests)
+
+After a decrease, further decreases wait COOLDOWN seconds so the requests
+already in flight don't halve the limits again for the same trouble.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+import crawl_metrics
+
+INCREASE_AFTER = 10    # successes in a row before each additive increase
+RATE_STEP = 0.25       # requests per second added per increase
+DECREASE_FACTOR = 0.5  # multiplicative decrease
+WINDOW = 20            # recent outcomes used for the error rate
+ERROR_RATE = 0.25
+LATENCY_FACTOR = 3.0
+LATENCY_SMOOTHING = 0.2  # weight of the newest response time in the average
+COOLDOWN = 5.0
+MIN_REQUESTS_PER_SECOND = 0.1
+
+# Titles of block / challenge pages served with a 200 or 403/503
+CHALLENGE_MARKERS = (
+    "just a moment", "attention required", "access denied", "are you a robot",
+    "verify you are human", "request unsuccessful", "too many requests",
+)
+FAILED_OUTCOMES = ("error", "timeout", "empty")
+
+limits = {}  # domain -> DomainLimit
+limits_lock = threading.Lock()
+
+class DomainLimit:
+    """Concurrency slots and request spacing for one domain"""
+
+    def __init__(self, domain, concurrency, requests_per_second, adaptive=False,
+                 max_concurrency=None, max_requests_per_second=None):
+        self.domain = domain
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.adaptive = adaptive
+        self.max_concurrency = max_concurrency or concurrency * 4
+        self.max_requests_per_second = max_requests_per_second or (requests_per_second or 1) * 4
+        self.in_flight = 0
+        self.slot_free = threading.Condition()
+        self.lock = threading.Lock()
+        self.next_start = 0.0
+        self.successes = 0
+        self.recent = deque(maxlen=WINDOW)
+        self.latency = None
+        self.best_latency = None
+        self.last_decrease = 0.0
+        self.changes = 0
+
+    def acquire(self):
+        with self.slot_free:
+            while self.in_flight >= self.concurrency:
+                self.slot_free.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self.slot_free:
+            self.in_flight -= 1
+            self.slot_free.notify_all()
+
+    def wait_turn(self):
+        """Sleep until this request may start"""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            if self.requests_per_second:
+                self.next_start = start + 1 / self.requests_per_second
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds):
+        """Start no request for the next seconds (Retry-After)"""
+        with self.lock:
+            self.next_start = max(self.next_start, time.monotonic() + seconds)
+
+    def set_limits(self, concurrency, requests_per_second, reason):
+        if (concurrency, requests_per_second) == (self.concurrency, self.requests_per_second):
+            return
+        self.concurrency = concurrency
+        self.requests_per_second = requests_per_second
+        self.changes += 1
+        crawl_metrics.count("rate_change")
+        rate = f"{requests_per_second:.2f} req/s" if requests_per_second else "no request spacing"
+        print(f"[{self.domain}] {reason}: {concurrency} concurrent, {rate}")
+        with self.slot_free:
+            self.slot_free.notify_all()
+
+    def increase(self):
+        rate = self.requests_per_second
+        if rate is not None:  # no spacing stays no spacing, only concurrency grows
+            rate = min(self.max_requests_per_second, rate + RATE_STEP)
+        self.set_limits(min(self.max_concurrency, self.concurrency + 1), rate, "healthy, speeding up")
+
+    def decrease(self, reason):
+        now = time.monotonic()
+        if now - self.last_decrease < COOLDOWN:
+            return
+        self.last_decrease = now
+        self.successes = 0
+        self.recent.clear()
+        rate = self.requests_per_second or self.max_requests_per_second
+        self.set_limits(
+            max(1, int(self.concurrency * DECREASE_FACTOR)),
+            max(MIN_REQUESTS_PER_SECOND, rate * DECREASE_FACTOR),
+            reason,
+        )
+
+    def record(self, outcome, seconds=None, retry_after=None):
+        """Adjust the limits after one request (adaptive limits only)"""
+        if outcome != "ok":
+            crawl_metrics.count(f"request_{outcome}")
+        if not self.adaptive:
+            return
+        if retry_after:
+            self.pause(retry_after)
+        with self.lock:
+            self.recent.append(outcome)
+            if outcome == "throttled":
+                self.decrease("throttled")
+                return
+            if outcome in FAILED_OUTCOMES:
+                self.successes = 0
+                failed = sum(1 for recent in self.recent if recent in FAILED_OUTCOMES)
+                if len(self.recent) >= WINDOW // 2 and failed / len(self.recent) > ERROR_RATE:
+                    self.decrease(f"{failed} of the last {len(self.recent)} requests failed")
+                return
+
+            if seconds is not None:
+                self.latency = seconds if self.latency is None else (
+                    LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * self.latency)
+                if len(self.recent) >= WINDOW // 2:
+                    self.best_latency = min(self.best_latency or self.latency, self.latency)
+                if self.best_latency and self.latency > LATENCY_FACTOR * self.best_latency:
+                    self.decrease(f"responses slowed to {self.latency:.2f}s")
+                    return
+            self.successes += 1
+            if self.successes >= INCREASE_AFTER:
+                self.successes = 0
+                self.increase()
+
+def configure(domain, concurrency=1, requests_per_second=None, adaptive=False,
+              max_concurrency=None, max_requests_per_second=None):
+    """Limit requests to domain (and its subdomains); requests_per_second None = no spacing
+
+    With adaptive=True the limits start at concurrency / requests_per_second
+    and move between 1 / MIN_REQUESTS_PER_SECOND and the maximums.
+    """
+    with limits_lock:
+        limits[domain] = DomainLimit(domain, concurrency, requests_per_second, adaptive,
+                                     max_concurrency, max_requests_per_second)
+    return limits[domain]
+
+def clear():
+    with limits_lock:
+        limits.clear()
+
+def domain_limit(url):
+    """The DomainLimit that applies to url, or None"""
+    host = (urlparse(url).hostname or "").lower()
+    with limits_lock:
+        for domain, limit in limits.items():
+            if host == domain or host.endswith("." + domain):
+                return limit
+    return None
+
+@contextmanager
+def request(url):
+    """Hold a concurrency slot for url's domain and wait for its next request slot"""
+    limit = domain_limit(url)
+    if limit is None:
+        yield
+        return
+    limit.acquire()
+    try:
+        limit.wait_turn()
+        yield
+    finally:
+        limit.release()
+
+def is_challenge(title_or_html):
+    """True if a page title (or the start of its HTML) looks like a block/challenge page"""
+    text = (title_or_html or "")[:3000].lower()
+    if "<title" in text:
+        text = text.split("<title", 1)[1].split("</title", 1)[0]
+    return any(marker in text for marker in CHALLENGE_MARKERS)
+
+def classify_response(status_code, html=None):
+    """Outcome of an HTTP response for report()"""
+    if status_code == 429:
+        return "throttled"
+    if status_code in (403, 503) or status_code == 200:
+        if html and is_challenge(html):
+            return "throttled"
+    if status_code >= 500 or status_code == 403:
+        return "error"
+    return "ok"
+
+def retry_after_seconds(headers):
+    """Retry-After in seconds from response headers (None if absent or a date)"""
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def report(url, outcome, seconds=None, retry_after=None):
+    """Tell url's domain how a request went: ok, throttled, error, timeout or empty"""
+    limit = domain_limit(url)
+    if limit is not None:
+        limit.record(outcome, seconds, retry_after)
+
+def report_response(url, response, seconds):
+    """report() for a requests Response"""
+    report(url, classify_response(response.status_code, response.text), seconds,
+           retry_after_seconds(response.headers))
@@ -0,0 +1,398 @@
+"""Inverted index of the crawl state: ingredient -> products, column value -> products.
+
+crawl_state.save_product() keeps the index up to date as the collectors
+store rows, so it grows with every scrape_category run. Each term has a
+posting bitmap with one bit per product (bit n = the product with rowid n):
+
+    ingredient:<id>        products listing the ingredient
+    babyProduct=no         products whose column has the value
+    retailer:watsons       every scraped product of the retailer
+
+Bitmaps are stored in CHUNK_BITS-product chunks (1 KB blobs), so storing a
+product only rewrites one small chunk per term. VACUUM may renumber rowids;
+run `python ingredient_index.py rebuild` after one.
+
+Queries combine ingredients and detector columns with AND, OR, NOT and
+brackets. Words next to each other are one ingredient name, in any spelling
+ingredient_vocab folds to the same name (quotes work too); * matches any
+text in a name; column=value matches a detector column (bodyParts and
+productFunction match any one of their values):
+
+    python ingredient_index.py query "niacinamide AND NOT fragrance AND babyProduct=No"
+    python ingredient_index.py query "(*paraben OR phenoxyethanol) AND eczemaProduct=Yes" --retailer watsons
+    python ingredient_index.py query "sodium lauryl sulfate" --limit 0 --csv sls.csv
+    python ingredient_index.py rebuild
+
+A query reads the few chunks of each term and combines them as integers
+(&, |, and-not), so it takes milliseconds even with 100k products.
+"""
+import csv
+import fnmatch
+import re
+import sys
+import time
+
+import ingredient_vocab
+
+# Products per bitmap chunk
+CHUNK_BITS = 8192
+
+# Detector columns that get postings
+ATTRIBUTE_COLUMNS = [
+    "brandName", "categoryType", "babyProduct", "eczemaProduct", "country",
+    "bodyParts", "productFunction",
+]
+# Columns holding a ", " separated list of values
+LIST_COLUMNS = {"bodyParts", "productFunction"}
+
+OPERATORS = ("AND", "OR", "NOT")
+
+TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|([^\s()"]+))')
+
+def create_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS postings (
+            term  TEXT NOT NULL,
+            chunk INTEGER NOT NULL,
+            bits  BLOB NOT NULL,
+            PRIMARY KEY (term, chunk)
+        ) WITHOUT ROWID
+    """)
+
+def fold_value(value):
+    return " ".join(str(value).split()).lower()
+
+def ingredient_term(ingredient_id):
+    return f"ingredient:{ingredient_id}"
+
+def retailer_term(retailer):
+    return f"retailer:{retailer}"
+
+def attribute_term(column, value):
+    return f"{column}={fold_value(value)}"
+
+def product_terms(retailer, record, ingredient_ids=None):
+    """Every term a stored product is indexed under"""
+    terms = {retailer_term(retailer)}
+    terms.update(ingredient_term(ingredient_id) for ingredient_id in ingredient_ids or ())
+    for column in ATTRIBUTE_COLUMNS:
+        value = record.get(column)
+        if value is None or str(value).strip() in ("", "N/A"):
+            continue
+        values = str(value).split(",") if column in LIST_COLUMNS else [value]
+        terms.update(attribute_term(column, item) for item in values if str(item).strip())
+    return terms
+
+def set_bit(conn, term, product_id, on):
+    chunk, bit = divmod(product_id, CHUNK_BITS)
+    row = conn.execute("SELECT bits FROM postings WHERE term = ? AND chunk = ?", (term, chunk)).fetchone()
+    bits = bytearray(row[0]) if row else bytearray(CHUNK_BITS // 8)
+    if on:
+        bits[bit >> 3] |= 1 << (bit & 7)
+    else:
+        bits[bit >> 3] &= ~(1 << (bit & 7)) & 0xFF
+    if any(bits):
+        conn.execute("INSERT OR REPLACE INTO postings (term, chunk, bits) VALUES (?, ?, ?)", (term, chunk, bytes(bits)))
+    elif row:
+        conn.execute("DELETE FROM postings WHERE term = ? AND chunk = ?", (term, chunk))
+
+def index_product(conn, product_id, old_terms, new_terms):
+    """Move one product from the postings of old_terms to those of new_terms
+
+    Called by crawl_state.save_product inside its transaction, with the terms
+    of the stored row before and after the update.
+    """
+    for term in old_terms - new_terms:
+        set_bit(conn, term, product_id, False)
+    for term in new_terms - old_terms:
+        set_bit(conn, term, product_id, True)
+
+def rebuild(conn):
+    """Rebuild the index from the stored products; returns the number indexed"""
+    import crawl_state
+
+    with crawl_state.state_lock:
+        rows = conn.execute(
+            "SELECT rowid, retailer, record, ingredient_ids FROM products "
+            "WHERE status = 'scraped' AND record IS NOT NULL"
+        ).fetchall()
+        bitmaps = {}
+        for product_id, retailer, record_json, ingredient_ids in rows:
+            for term in crawl_state.stored_terms(retailer, "scraped", record_json, ingredient_ids):
+                bitmaps[term] = bitmaps.get(term, 0) | (1 << product_id)
+
+        conn.execute("DELETE FROM postings")
+        chunk_mask = (1 << CHUNK_BITS) - 1
+        for term, bitmap in bitmaps.items():
+            chunk = 0
+            while bitmap:
+                bits = bitmap & chunk_mask
+                if bits:
+                    conn.execute("INSERT INTO postings (term, chunk, bits) VALUES (?, ?, ?)",
+                                 (term, chunk, bits.to_bytes(CHUNK_BITS // 8, "little")))
+                bitmap >>= CHUNK_BITS
+                chunk += 1
+        conn.commit()
+    return len(rows)
+
+# Set bit positions of every byte value
+BYTE_BITS = [[bit for bit in range(8) if value >> bit & 1] for value in range(256)]
+
+def bitmap_ids(bitmap, limit=None):
+    """Product IDs (set bits) of a bitmap, ascending; the first limit only if given"""
+    ids = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for index, byte in enumerate(data):
+        if byte:
+            base = index * 8
+            ids.extend(base + bit for bit in BYTE_BITS[byte])
+            if limit is not None and len(ids) >= limit:
+                return ids[:limit]
+    return ids
+
+def bitmap_count(bitmap):
+    return bin(bitmap).count("1")
+
+# Query parsing: a list of tokens -> nested tuples
+#   ("and", a, b) / ("or", a, b) / ("not", a) / ("ingredient", name) / ("attribute", column, value)
+
+def tokenize(query):
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKEN_PATTERN.match(query, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Can't read the query at: {query[position:]}")
+        position = match.end()
+        opening, closing, quoted, word = match.groups()
+        if opening:
+            tokens.append(("(", None))
+        elif closing:
+            tokens.append((")", None))
+        elif quoted is not None:
+            tokens.append(("word", quoted))
+        elif word.upper() in OPERATORS:
+            tokens.append((word.upper(), None))
+        else:
+            tokens.append(("word", word))
+    return tokens
+
+class QueryParser:
+    """OR binds loosest, then AND, then NOT; brackets group"""
+
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position][0] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("Empty query")
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise ValueError(f"Unexpected {self.tokens[self.position][1] or self.tokens[self.position][0]}")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.peek() == "OR":
+            self.take()
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.peek() == "AND":
+            self.take()
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.peek() == "NOT":
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_term()
+
+    def parse_term(self):
+        kind = self.peek()
+        if kind == "(":
+            self.take()
+            node = self.parse_or()
+            if self.peek() != ")":
+                raise ValueError("Missing )")
+            self.take()
+            return node
+        if kind != "word":
+            raise ValueError(f"Expected an ingredient or column=value, got {kind or 'the end of the query'}")
+
+        words = []
+        while self.peek() == "word":
+            words.append(self.take()[1])
+        text = " ".join(words)
+        if "=" in text:
+            column, value = text.split("=", 1)
+            return ("attribute", column.strip(), value.strip())
+        return ("ingredient", text)
+
+def parse_query(query):
+    return QueryParser(query).parse()
+
+class IndexQuery:
+    """Evaluates parsed queries against the index of one state database"""
+
+    def __init__(self, conn, retailer=None):
+        self.conn = conn
+        self.retailer = retailer
+        self.vocabulary = ingredient_vocab.Vocabulary(conn)
+        self.columns = {column.lower(): column for column in ATTRIBUTE_COLUMNS}
+        self.all_products = None
+        self.notes = []
+
+    def bitmap(self, terms):
+        """Bitmap of the products indexed under any of the terms"""
+        bitmap = 0
+        for start in range(0, len(terms), 500):
+            batch = terms[start:start + 500]
+            for chunk, bits in self.conn.execute(
+                f"SELECT chunk, bits FROM postings WHERE term IN ({','.join('?' * len(batch))})", batch
+            ):
+                bitmap |= int.from_bytes(bits, "little") << (chunk * CHUNK_BITS)
+        return bitmap
+
+    def universe(self):
+        """Every scraped product (of the retailer)"""
+        if self.all_products is None:
+            if self.retailer:
+                terms = [retailer_term(self.retailer)]
+            else:
+                terms = [row[0] for row in self.conn.execute(
+                    "SELECT DISTINCT term FROM postings WHERE term >= 'retailer:' AND term < 'retailer;'")]
+            self.all_products = self.bitmap(terms)
+        return self.all_products
+
+    def ingredient_ids(self, text):
+        """IDs of the ingredients a term names (every match for a * pattern)"""
+        if "*" in text:
+            pattern = " ".join(text.upper().split())
+            return [ingredient_id for name, ingredient_id in self.vocabulary.load().items()
+                    if fnmatch.fnmatchcase(name, pattern)]
+        ingredient_id = self.vocabulary.lookup(text)
+        return [] if ingredient_id is None else [ingredient_id]
+
+    def postings(self, node):
+        kind = node[0]
+        if kind == "ingredient":
+            ids = self.ingredient_ids(node[1])
+            if not ids:
+                self.notes.append(f"No stored product lists the ingredient '{node[1]}'")
+            return self.bitmap([ingredient_term(ingredient_id) for ingredient_id in ids])
+        if kind == "attribute":
+            column = self.columns.get(node[1].lower())
+            if column is None:
+                raise ValueError(f"Unknown column {node[1]} (use one of: {', '.join(ATTRIBUTE_COLUMNS)})")
+            return self.bitmap([attribute_term(column, node[2])])
+        raise ValueError(f"Unknown query node {kind}")
+
+    def evaluate(self, node):
+        """Bitmap of the products matching a parsed query"""
+        kind = node[0]
+        if kind == "and":
+            return self.evaluate(node[1]) & self.evaluate(node[2])
+        if kind == "or":
+            return self.evaluate(node[1]) | self.evaluate(node[2])
+        if kind == "not":
+            return self.universe() & ~self.evaluate(node[1])
+        return self.postings(node) & self.universe()
+
+    def run(self, query):
+        """Bitmap of the products matching a query string (see bitmap_ids)"""
+        self.notes = []
+        return self.evaluate(parse_query(query))
+
+def load_products(conn, product_ids):
+    """Stored records of the given product IDs, in that order"""
+    import crawl_state
+
+    records = []
+    with crawl_state.state_lock:
+        for start in range(0, len(product_ids), 500):
+            batch = product_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT rowid, record, ingredient_ids, ingredient_text FROM products "
+                f"WHERE rowid IN ({','.join('?' * len(batch))})",
+                batch,
+            ).fetchall()
+            by_id = {row[0]: crawl_state.decode_record(conn, *row[1:]) for row in rows if row[1]}
+            records.extend(by_id[product_id] for product_id in batch if product_id in by_id)
+    return records
+
+def save_csv(records, output_file):
+    fieldnames = []
+    for record in records:
+        fieldnames.extend(key for key in record if key not in fieldnames)
+    with open(output_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(records)
+    print(f"Saved {len(records)} products to {output_file}")
+
+def print_products(records):
+    for record in records:
+        brand = record.get("brandName") or record.get("brand_name") or ""
+        name = record.get("productName") or record.get("product_name") or ""
+        url = record.get("productURL") or record.get("url") or ""
+        print(f"  {brand[:25]:<25} {name[:50]:<50} {url}")
+
+def option(args, name, default=None):
+    if name in args:
+        index = args.index(name)
+        if index + 1 < len(args):
+            return args[index + 1]
+    return default
+
+if __name__ == "__main__":
+    import crawl_state
+
+    args = sys.argv[1:]
+    if not args or args[0] not in ("query", "rebuild") or (args[0] == "query" and len(args) < 2):
+        print('Usage: python ingredient_index.py query "<query>" [--retailer name] [--limit 20] [--csv file]')
+        print("       python ingredient_index.py rebuild")
+        sys.exit(1)
+
+    state = crawl_state.get_state()
+    try:
+        if args[0] == "rebuild":
+            start = time.perf_counter()
+            indexed = rebuild(state)
+            print(f"Indexed {indexed} products in {time.perf_counter() - start:.1f}s")
+        if args[0] == "query":
+            searcher = IndexQuery(state, option(args, "--retailer"))
+            start = time.perf_counter()
+            try:
+                matches = searcher.run(args[1])
+            except ValueError as e:
+                print(f"Bad query: {e}")
+                sys.exit(1)
+            count = bitmap_count(matches)
+            elapsed = (time.perf_counter() - start) * 1000
+            for note in searcher.notes:
+                print(f"⚠ {note}")
+            print(f"{count} of {bitmap_count(searcher.universe())} products match ({elapsed:.1f} ms)")
+
+            limit = int(option(args, "--limit", "20"))
+            shown = bitmap_ids(matches, limit if limit > 0 else None)
+            if option(args, "--csv"):
+                save_csv(load_products(state, bitmap_ids(matches)), option(args, "--csv"))
+            print_products(load_products(state, shown))
+            if len(shown) < count:
+                print(f"  ... {count - len(shown)} more (--limit 0 shows all)")
+    finally:
+        crawl_state.close_state()
@@ -0,0 +1,330 @@
+"""Normalized ingredient names and the shared ingredient vocabulary.
+
+productIngredient is free text as the page shows it ("Aqua, Glycerin,
+...", "AQUA/WATER/EAU, GLYCERIN, ..."), and the same few hundred
+ingredients repeat across thousands of products. normalize_text() turns it
+into a canonical list:
+
+- one entry per ingredient, split on commas/semicolons outside brackets
+  (the comma in "1,2-HEXANEDIOL" is kept)
+- upper case (the INCI convention), single spaces, no spaces around "/",
+  no trailing full stops, an "Ingredients:" label removed
+- known aliases folded to one name (WATER, AQUA/WATER/EAU -> AQUA)
+
+The crawl state does not keep the text in a record's JSON. It stores:
+
+- the canonical list, as IDs into the `ingredients` table (Vocabulary).
+  Working with it (counting, comparing, searching products by ingredient)
+  is integer work.
+- the text exactly as scraped (that is what the CSV gets), compressed with
+  a preset zlib dictionary (TextDictionaries) made of the most common pieces
+  ("Aqua,", " Glycerin,") of the stored texts. The same pieces repeat across
+  products, so each text shrinks to a fraction of its size.
+
+    python ingredient_vocab.py stats    # vocabulary size, most used, storage
+    python ingredient_vocab.py compact  # recompress all texts with a fresh dictionary
+"""
+import re
+import struct
+import sys
+import threading
+import unicodedata
+import zlib
+from array import array
+from collections import Counter
+
+INGREDIENT_FIELD = "productIngredient"
+
+# zlib only uses the last 32 KB of a preset dictionary
+DICTIONARY_SIZE = 32 * 1024
+# Stored ingredient texts needed before a dictionary is built from them
+DICTIONARY_SAMPLE = 50
+
+# Values the detectors return when no ingredient list was found
+MISSING_VALUES = ("", "N/A")
+
+# Folded spellings of the same ingredient -> canonical name
+ALIASES = {
+    "WATER": "AQUA",
+    "EAU": "AQUA",
+    "PURIFIED WATER": "AQUA",
+    "AQUA/WATER": "AQUA",
+    "WATER/AQUA": "AQUA",
+    "AQUA/WATER/EAU": "AQUA",
+    "WATER/AQUA/EAU": "AQUA",
+    "WATER/EAU": "AQUA",
+    "AQUA (WATER)": "AQUA",
+    "WATER (AQUA)": "AQUA",
+    "FRAGRANCE": "PARFUM",
+    "PARFUM/FRAGRANCE": "PARFUM",
+    "FRAGRANCE/PARFUM": "PARFUM",
+    "PARFUM (FRAGRANCE)": "PARFUM",
+    "FRAGRANCE (PARFUM)": "PARFUM",
+    "GLYCERINE": "GLYCERIN",
+    "VITAMIN E": "TOCOPHEROL",
+}
+
+LABEL_PATTERN = re.compile(r"^\s*(?:full\s+)?ingredients?\s*(?:list)?\s*[:\-]\s*", re.IGNORECASE)
+
+def separator_positions(text):
+    """Positions of the , and ; that separate entries (outside brackets, not the comma in 1,2-...)"""
+    positions = []
+    depth = 0
+    for i, char in enumerate(text):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth = max(0, depth - 1)
+        elif char in ",;" and depth == 0:
+            between_digits = (char == "," and 0 < i < len(text) - 1
+                              and text[i - 1].isdigit() and text[i + 1].isdigit())
+            if not between_digits:
+                positions.append(i)
+    return positions
+
+def split_ingredients(text):
+    """The ingredient entries of a list, split on , and ; outside brackets"""
+    text = LABEL_PATTERN.sub("", text)
+    entries = []
+    start = 0
+    for i in separator_positions(text):
+        entries.append(text[start:i])
+        start = i + 1
+    entries.append(text[start:])
+    return [entry for entry in entries if entry.strip()]
+
+def split_pieces(text):
+    """The text cut after each separator; the pieces join back to exactly the text"""
+    pieces = []
+    start = 0
+    for i in separator_positions(text):
+        pieces.append(text[start:i + 1])
+        start = i + 1
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+def build_dictionary(texts):
+    """Preset zlib dictionary from ingredient texts: their repeated pieces, the most common last"""
+    counts = Counter(piece for text in texts for piece in split_pieces(text))
+    pieces = []
+    size = 0
+    for piece, count in counts.most_common():
+        if count < 2 or size >= DICTIONARY_SIZE:
+            break
+        pieces.append(piece)
+        size += len(piece.encode("utf-8"))
+    return "".join(reversed(pieces)).encode("utf-8")[-DICTIONARY_SIZE:]
+
+def canonical_name(entry):
+    """Canonical form of one ingredient entry ("" if nothing is left)"""
+    name = unicodedata.normalize("NFKC", entry).upper()
+    name = " ".join(name.split())
+    name = re.sub(r"\s*/\s*", "/", name)
+    name = re.sub(r"\s*\(\s*", " (", name)
+    name = re.sub(r"\s*\)", ")", name)
+    name = name.strip(" .*").strip()
+    return ALIASES.get(name, name)
+
+def canonical_names(text):
+    """Canonical names of the ingredients in a list, or None if the text is missing"""
+    if text is None or text.strip() in MISSING_VALUES:
+        return None
+    # NFKC first so full-width commas (，) split like ASCII ones
+    text = unicodedata.normalize("NFKC", text)
+    names = [name for name in (canonical_name(entry) for entry in split_ingredients(text)) if name]
+    return names or None
+
+def normalize_text(text):
+    """The ingredient list with every entry in canonical form (missing values unchanged)"""
+    names = canonical_names(text)
+    return text if names is None else ", ".join(names)
+
+def pack_ids(ids):
+    """ID list -> bytes for storage (4 bytes per ID)"""
+    return array("I", ids).tobytes()
+
+def unpack_ids(blob):
+    ids = array("I")
+    ids.frombytes(blob)
+    return ids
+
+class Vocabulary:
+    """The shared ingredient names of a state database, interned to integer IDs
+
+    All names are loaded on first use; new names are inserted as they are
+    first seen.
+    """
+
+    def __init__(self, conn, lock=None):
+        self.conn = conn
+        self.lock = lock or threading.RLock()
+        self.ids = None
+        self.names = {}
+
+    def load(self):
+        if self.ids is None:
+            with self.lock:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ingredients (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)"
+                )
+                rows = self.conn.execute("SELECT id, name FROM ingredients").fetchall()
+                self.names = dict(rows)
+                self.ids = {name: ingredient_id for ingredient_id, name in rows}
+        return self.ids
+
+    def intern(self, name):
+        """ID of a canonical name, added to the vocabulary if it is new"""
+        ingredient_id = self.load().get(name)
+        if ingredient_id is None:
+            with self.lock:
+                ingredient_id = self.ids.get(name)
+                if ingredient_id is None:
+                    ingredient_id = self.conn.execute(
+                        "INSERT INTO ingredients (name) VALUES (?)", (name,)
+                    ).lastrowid
+                    self.ids[name] = ingredient_id
+                    self.names[ingredient_id] = name
+        return ingredient_id
+
+    def encode(self, text):
+        """ID list of an ingredient text, or None if the text is missing"""
+        names = canonical_names(text)
+        if names is None:
+            return None
+        return [self.intern(name) for name in names]
+
+    def decode(self, ids):
+        """Ingredient text (canonical names) of an ID list"""
+        self.load()
+        return ", ".join(self.names.get(ingredient_id, "?") for ingredient_id in ids)
+
+    def lookup(self, name):
+        """ID of an ingredient name in any spelling, or None if it was never seen"""
+        return self.load().get(canonical_name(name))
+
+class TextDictionaries:
+    """The preset zlib dictionaries ingredient texts are compressed with
+
+    Kept in the ingredient_dictionaries table. Texts are compressed with the
+    newest dictionary and each compressed text starts with the ID of its
+    dictionary (0 = none), so texts compressed with an older one still
+    decompress until compact_ingredients() recompresses them.
+    """
+
+    def __init__(self, conn, lock=None):
+        self.conn = conn
+        self.lock = lock or threading.RLock()
+        self.dictionaries = None
+
+    def load(self):
+        if self.dictionaries is None:
+            with self.lock:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ingredient_dictionaries (id INTEGER PRIMARY KEY, data BLOB NOT NULL)"
+                )
+                self.dictionaries = dict(self.conn.execute("SELECT id, data FROM ingredient_dictionaries"))
+        return self.dictionaries
+
+    def current(self):
+        """ID of the newest dictionary, 0 if there is none yet"""
+        return max(self.load(), default=0)
+
+    def add(self, texts):
+        """Build a dictionary from texts and make it the current one; returns its ID"""
+        data = build_dictionary(texts)
+        with self.lock:
+            self.load()
+            dictionary_id = self.conn.execute(
+                "INSERT INTO ingredient_dictionaries (data) VALUES (?)", (data,)
+            ).lastrowid
+            self.dictionaries[dictionary_id] = data
+        return dictionary_id
+
+    def remove_except(self, keep):
+        """Delete every dictionary but keep (once no stored text uses them)"""
+        with self.lock:
+            for dictionary_id in [key for key in self.load() if key != keep]:
+                self.conn.execute("DELETE FROM ingredient_dictionaries WHERE id = ?", (dictionary_id,))
+                del self.dictionaries[dictionary_id]
+
+    def compress(self, text):
+        """Ingredient text -> bytes for storage"""
+        dictionary_id = self.current()
+        if dictionary_id:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=self.dictionaries[dictionary_id])
+        else:
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+        data = compressor.compress(text.encode("utf-8")) + compressor.flush()
+        return struct.pack("<I", dictionary_id) + data
+
+    def decompress(self, blob):
+        """The exact ingredient text of compress()ed bytes"""
+        (dictionary_id,) = struct.unpack_from("<I", blob)
+        if dictionary_id:
+            decompressor = zlib.decompressobj(-15, zdict=self.load()[dictionary_id])
+        else:
+            decompressor = zlib.decompressobj(-15)
+        return (decompressor.decompress(blob[4:]) + decompressor.flush()).decode("utf-8")
+
+def print_stats(conn, vocabulary, retailer=None):
+    """Vocabulary size, the most used ingredients and the bytes ingredient lists take in the store"""
+    import crawl_state
+
+    retailers = [retailer] if retailer else [
+        row[0] for row in conn.execute("SELECT DISTINCT retailer FROM products")
+    ]
+    usage = Counter()
+    products = 0
+    text_bytes = 0    # the ingredient texts as scraped
+    inline_bytes = 0  # texts still kept in the record JSON (not compacted yet)
+    id_bytes = 0      # canonical ID lists
+    packed_bytes = 0  # compressed texts
+    for name in retailers:
+        rows = conn.execute(
+            "SELECT record, ingredient_ids, ingredient_text FROM products "
+            "WHERE retailer = ? AND status = 'scraped' AND record IS NOT NULL",
+            (name,),
+        ).fetchall()
+        for record_json, ingredient_ids, ingredient_text in rows:
+            text = crawl_state.decode_record(conn, record_json, ingredient_ids, ingredient_text).get(INGREDIENT_FIELD)
+            if canonical_names(text) is None:
+                continue
+            products += 1
+            text_bytes += len(text.encode("utf-8"))
+            if ingredient_text is None:
+                inline_bytes += len(text.encode("utf-8"))
+            if ingredient_ids is not None:
+                usage.update(set(unpack_ids(ingredient_ids)))
+                id_bytes += len(ingredient_ids)
+            packed_bytes += len(ingredient_text or b"")
+
+    print(f"{len(vocabulary.load())} ingredients in the vocabulary, {products} products with an ingredient list")
+    if products:
+        # The names and dictionaries are shared by all retailers
+        names_bytes = sum(len(name.encode("utf-8")) for name in vocabulary.names.values())
+        dictionary_bytes = sum(len(data) for data in crawl_state.get_text_dictionaries(conn).load().values())
+        stored = inline_bytes + packed_bytes + dictionary_bytes + id_bytes + names_bytes
+        print(f"Ingredient text {text_bytes / 1024:.1f} KB, stored in {stored / 1024:.1f} KB:")
+        print(f"  {packed_bytes / 1024:>8.1f} KB compressed text + {dictionary_bytes / 1024:.1f} KB dictionaries")
+        print(f"  {id_bytes / 1024:>8.1f} KB canonical ID lists + {names_bytes / 1024:.1f} KB names")
+        if inline_bytes:
+            print(f"  {inline_bytes / 1024:>8.1f} KB text still in records (run compact)")
+        print("Most used:")
+        for ingredient_id, count in usage.most_common(15):
+            print(f"  {count:>6}  {vocabulary.names[ingredient_id]}")
+
+if __name__ == "__main__":
+    import crawl_state
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("stats", "compact"):
+        print("Usage: python ingredient_vocab.py stats [retailer]")
+        print("       python ingredient_vocab.py compact")
+        sys.exit(1)
+
+    state = crawl_state.get_state()
+    if sys.argv[1] == "compact":
+        moved = crawl_state.compact_ingredients(state)
+        print(f"Recompressed the ingredient text of {moved} stored products")
+    print_stats(state, crawl_state.get_vocabulary(state), sys.argv[2] if len(sys.argv) > 2 else None)
+    crawl_state.close_state()
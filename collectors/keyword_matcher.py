@@ -0,0 +1,95 @@
+"""Aho-Corasick keyword matcher.
+
+Finds every occurrence of every keyword (including overlapping ones such as
+"dermatitis" inside "atopic dermatitis") in a single pass over the text, so
+the detectors don't rescan the page once per keyword.
+"""
+from bisect import bisect_left
+from collections import deque
+
+class KeywordMatcher:
+    """Keyword automaton built once from a list of lowercase keywords"""
+
+    def __init__(self, keywords):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        self.max_length = 0
+
+        # Build the trie
+        for keyword in dict.fromkeys(keywords):
+            if not keyword:
+                continue
+            state = 0
+            for ch in keyword:
+                next_state = self.goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][ch] = next_state
+                state = next_state
+            self.output[state] += (keyword,)
+            self.max_length = max(self.max_length, len(keyword))
+
+        # Breadth-first pass to set failure links and merge outputs
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for ch, next_state in self.goto[state].items():
+                pending.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.output[next_state] += self.output[self.fail[next_state]]
+
+    def find_all(self, text):
+        """List of (start, keyword) for every occurrence, ordered by end position"""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        hits = []
+        for index, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                for keyword in output[state]:
+                    hits.append((index - len(keyword) + 1, keyword))
+        return hits
+
+    def search(self, text):
+        """Scan text once and return its KeywordHits"""
+        return KeywordHits(self.find_all(text))
+
+class KeywordHits:
+    """Start offsets of every keyword found in one text"""
+
+    def __init__(self, hits):
+        # Hits come ordered by end position, so each keyword's starts are already sorted
+        self.positions = {}
+        for start, keyword in hits:
+            self.positions.setdefault(keyword, []).append(start)
+
+    def __contains__(self, keyword):
+        return keyword in self.positions
+
+    def first(self, keyword):
+        """Offset of the first occurrence (like str.find), or -1"""
+        starts = self.positions.get(keyword)
+        return starts[0] if starts else -1
+
+    def any_within(self, keywords, start, end):
+        """True if any of the keywords occurs entirely inside text[start:end]"""
+        for keyword in keywords:
+            starts = self.positions.get(keyword)
+            if not starts:
+                continue
+            i = bisect_left(starts, start)
+            if i < len(starts) and starts[i] + len(keyword) <= end:
+                return True
+        return False
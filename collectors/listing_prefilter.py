@@ -0,0 +1,99 @@
+"""Listing-level prefilter for discovered products.
+
+The category listing already shows each product's name and brand, so bundles
+and products that are already taken in brandlist.csv can be dropped before
+any product page is opened, instead of after scraping (combo checks) or in
+the offline filter scripts (brandlist). prefilter_listing() uses the same
+rules as those checks and filterW.py: a product is taken when its name and a
+brandlist product name contain one another. Brands are not matched on their
+own, since brandlist.csv lists individual products of a brand.
+"""
+import csv
+import os
+import re
+
+import csv_encoding
+from brandlist_matcher import BrandlistIndex
+
+BRANDLIST_FILE = "brandlist.csv"
+
+# Keywords that indicate combos/bundles in URLs. "multi" and "N-in-1" are not
+# used: they name single multi-purpose products ("multi-purpose-balm",
+# "3-in-1-foam") far more often than bundles
+COMBO_URL_KEYWORDS = [
+    'combo', 'bundle', 'pack', 'set',
+    'trio', 'calendar', 'kit', 'collection',
+    'duo', 'pair', 'twin'
+]
+
+def is_combo_url(url):
+    """Check if URL contains combo/bundle keywords to filter out early"""
+    url_lower = url.lower()
+
+    # Check for combo keywords in the URL path
+    for keyword in COMBO_URL_KEYWORDS:
+        if keyword in url_lower:
+            # Make sure it's not part of another word
+            pattern = r'[^a-z]' + keyword + r'[^a-z]|^' + keyword + r'[^a-z]|[^a-z]' + keyword + r'$'
+            if re.search(pattern, url_lower):
+                return True
+
+    # Check for patterns like "2x", "3x", etc.
+    if re.search(r'/\d+\s*x\s*\d+/', url_lower):
+        return True
+
+    return False
+
+def find_column(fieldnames, candidates):
+    """First column whose (stripped, lowercased) name is one of the candidates"""
+    for name in fieldnames or []:
+        if name and name.strip().lower() in candidates:
+            return name
+    return None
+
+def load_brandlist(brandlist_file=BRANDLIST_FILE):
+    """BrandlistIndex of the products in brandlist.csv, or None if the file is missing"""
+    if not os.path.exists(brandlist_file):
+        print(f"{brandlist_file} not found - brandlist products will not be prefiltered")
+        return None
+
+    # brandlist.csv is often saved from Excel: detect its encoding instead of assuming UTF-8
+    f, delimiter = csv_encoding.open_text(brandlist_file)
+    with f:
+        rows = list(csv.DictReader(f, delimiter=delimiter))
+
+    fieldnames = rows[0].keys() if rows else []
+    product_column = find_column(fieldnames, ("products", "product", "product name", "product_name"))
+    if product_column is None:
+        print(f"No product column in {brandlist_file} - brandlist products will not be prefiltered")
+        return None
+
+    products = {row[product_column].strip().lower() for row in rows if row.get(product_column)}
+    print(f"Brandlist: {len(products)} taken products")
+    return BrandlistIndex(sorted(products), skip_empty=True)
+
+def prefilter_listing(products, is_single_product, brandlist=None):
+    """Drop bundles and brandlist-taken products from a listing
+
+    products is a list of (url, name, brand); a name of "N/A" (not shown on
+    the listing) is left for the product page to decide. Returns the
+    remaining products in the same order.
+    """
+    kept = []
+    bundles = 0
+    for url, name, brand in products:
+        if is_combo_url(url) or (name != "N/A" and not is_single_product(name)):
+            bundles += 1
+            continue
+        kept.append((url, name, brand))
+
+    taken = 0
+    if brandlist is not None and kept:
+        names = [name.strip().lower() if name != "N/A" else "" for _, name, _ in kept]
+        marks = brandlist.mark_taken(names)
+        taken = sum(marks)
+        kept = [product for product, is_taken in zip(kept, marks) if not is_taken]
+
+    print(f"Listing prefilter: {bundles} bundles and {taken} brandlist products skipped, "
+          f"{len(kept)} of {len(products)} products left to open")
+    return kept
@@ -0,0 +1,151 @@
+"""Compressed, content-addressed cache of the product pages the collectors read.
+
+Every product page the Watsons collector classifies is kept as its
+PageSnapshot (the page text every detector reads), zlib-compressed and named
+by the snapshot's content hash:
+
+    page_cache/objects/3f/3f8a...c1.json.z
+
+Pages with the same content share one file. The page_cache table in the
+crawl state maps each (retailer, url) to the hash of its latest snapshot.
+When the objects grow past MAX_BYTES the least recently used ones are
+deleted until the cache is back under EVICT_TO of the limit.
+
+With the cache filled, changing a keyword table in watsons_detectors no
+longer means scraping every page again: the collector's "reparse" mode runs
+the detectors on the cached snapshots and rewrites the CSV without touching
+the network.
+
+    python page_cache.py stats
+"""
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+import crawl_state
+from page_snapshot import PageSnapshot
+
+CACHE_DIR = "page_cache"
+MAX_BYTES = 1024 * 1024 * 1024  # 1 GB of compressed snapshots
+EVICT_TO = 0.9
+COMPRESSION_LEVEL = 6
+
+cache_lock = threading.Lock()
+total_bytes = None  # size of every object, counted on first use
+
+def object_path(content_hash):
+    return os.path.join(CACHE_DIR, "objects", content_hash[:2], content_hash + ".json.z")
+
+def object_files():
+    """(path, size, last used) of every cached object"""
+    files = []
+    root = os.path.join(CACHE_DIR, "objects")
+    if not os.path.isdir(root):
+        return files
+    for folder in os.scandir(root):
+        if folder.is_dir():
+            for entry in os.scandir(folder.path):
+                stat = entry.stat()
+                files.append((entry.path, stat.st_size, stat.st_mtime))
+    return files
+
+def cached_bytes():
+    global total_bytes
+    if total_bytes is None:
+        total_bytes = sum(size for _, size, _ in object_files())
+    return total_bytes
+
+def store(conn, retailer, snapshot):
+    """Cache a snapshot and point its URL at it; returns the content hash"""
+    global total_bytes
+    content_hash = snapshot.content_hash()
+    path = object_path(content_hash)
+    with cache_lock:
+        if os.path.exists(path):
+            os.utime(path)  # still in use
+        else:
+            data = snapshot.to_dict()
+            del data["url"]  # the same content may sit at several URLs
+            blob = zlib.compress(json.dumps(data, ensure_ascii=False).encode("utf-8"), COMPRESSION_LEVEL)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(blob)
+            os.replace(temp_path, path)
+            total_bytes = cached_bytes() + len(blob)
+
+    with crawl_state.state_lock:
+        conn.execute(
+            "INSERT OR REPLACE INTO page_cache (retailer, url, content_hash, cached_at) VALUES (?, ?, ?, ?)",
+            (retailer, snapshot.url, content_hash, time.time()),
+        )
+        conn.commit()
+
+    if cached_bytes() > MAX_BYTES:
+        evict(conn)
+    return content_hash
+
+def load(conn, retailer, url):
+    """The cached snapshot of a URL, or None if it was never cached or has been evicted"""
+    with crawl_state.state_lock:
+        row = conn.execute(
+            "SELECT content_hash FROM page_cache WHERE retailer = ? AND url = ?", (retailer, url)
+        ).fetchone()
+    if row is None:
+        return None
+    path = object_path(row[0])
+    try:
+        with open(path, "rb") as f:
+            data = json.loads(zlib.decompress(f.read()).decode("utf-8"))
+        os.utime(path)
+    except (OSError, ValueError, zlib.error):
+        return None
+    data["url"] = url
+    return PageSnapshot.from_dict(data)
+
+def evict(conn, max_bytes=None):
+    """Delete the least recently used objects until the cache is under EVICT_TO of max_bytes"""
+    global total_bytes
+    limit = (max_bytes or MAX_BYTES) * EVICT_TO
+    with cache_lock:
+        files = sorted(object_files(), key=lambda item: item[2])
+        total_bytes = sum(size for _, size, _ in files)
+        evicted = []
+        for path, size, _ in files:
+            if total_bytes <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            evicted.append(os.path.basename(path).split(".")[0])
+
+    if evicted:
+        with crawl_state.state_lock:
+            for start in range(0, len(evicted), 500):
+                batch = evicted[start:start + 500]
+                conn.execute(f"DELETE FROM page_cache WHERE content_hash IN ({','.join('?' * len(batch))})", batch)
+            conn.commit()
+        print(f"Page cache: evicted {len(evicted)} pages, {total_bytes / 1024 / 1024:.1f} MB left")
+    return len(evicted)
+
+def print_stats(conn):
+    files = object_files()
+    size = sum(item[1] for item in files)
+    with crawl_state.state_lock:
+        rows = conn.execute("SELECT retailer, COUNT(*) FROM page_cache GROUP BY retailer").fetchall()
+    print(f"{len(files)} cached pages, {size / 1024 / 1024:.1f} MB of {MAX_BYTES / 1024 / 1024:.0f} MB in {CACHE_DIR}")
+    for retailer, count in rows:
+        print(f"  {retailer}: {count} URLs")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "stats":
+        print("Usage: python page_cache.py stats")
+        sys.exit(1)
+    state = crawl_state.get_state()
+    print_stats(state)
+    crawl_state.close_state()
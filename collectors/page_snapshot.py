@@ -0,0 +1,147 @@
+"""Per-page snapshot of everything the Watsons detectors read.
+
+The browser path captures a snapshot with a single execute_script call
+(capture_snapshot) and the HTTP path builds one from the raw HTML
+(watsons_http.snapshot_from_html). The detectors in watsons_detectors.py only
+ever look at the snapshot, so they run in pure Python and can be checked
+without a browser.
+"""
+import hashlib
+import json
+
+import watsons_detectors as detectors
+
+# Collects the page in one WebDriver round trip instead of one per detector.
+# arguments[0] is the list of description selectors.
+CAPTURE_SCRIPT = """
+const ownText = el => {
+    for (const node of el.childNodes) {
+        if (node.nodeType === Node.TEXT_NODE && node.textContent.trim()) return node.textContent;
+    }
+    return '';
+};
+const textOf = el => (el ? el.innerText : null);
+const nameEl = document.querySelector('.product-name');
+const brandEl = document.querySelector('.brand-group .product-brand a');
+
+const description = [];
+for (const selector of arguments[0]) {
+    for (const el of document.querySelectorAll(selector)) {
+        const cls = (el.getAttribute('class') || '').toLowerCase();
+        if (!cls.includes('footer') && !cls.includes('nav')) description.push(el.innerText);
+    }
+}
+
+const sections = [];
+for (const el of document.querySelectorAll('body *')) {
+    const tag = el.tagName.toLowerCase();
+    const heading = ownText(el);
+    const label = heading.toLowerCase();
+    const isHeading = /^h[1-6]$/.test(tag);
+    if (!isHeading && !label.includes('ingredient') && !label.includes('composition')) continue;
+    if (!heading) continue;
+
+    let nextParagraph = null;
+    for (let sib = el.nextElementSibling; sib; sib = sib.nextElementSibling) {
+        if (sib.tagName === 'P') { nextParagraph = sib.innerText; break; }
+    }
+    let sibling = null;
+    if (el.parentElement) {
+        for (const sib of el.parentElement.children) {
+            if (sib !== el && sib.innerText && sib.innerText.trim()) { sibling = sib.innerText; break; }
+        }
+    }
+    sections.push({
+        tag: tag,
+        heading: heading,
+        next_paragraph: nextParagraph,
+        next_element: textOf(el.nextElementSibling),
+        sibling: sibling
+    });
+}
+
+return {
+    body_text: document.body ? document.body.innerText : '',
+    product_name: textOf(nameEl),
+    brand_name: textOf(brandEl),
+    description: description,
+    sections: sections
+};
+"""
+
+class PageSnapshot:
+    """Text of one product page, captured once and shared by every detector
+
+    sections is a list of dicts, one per heading (h1-h6) or ingredient label:
+        tag            - lowercase tag name of the heading element
+        heading        - the element's own text
+        next_paragraph - text of the first following <p> sibling (or None)
+        next_element   - text of the next sibling element (or None)
+        sibling        - text of the first non-empty sibling in the same parent (or None)
+    """
+
+    def __init__(self, url, body_text, product_name="N/A", brand_name="N/A",
+                 description_text="", sections=None):
+        self.url = url
+        self.body_text = body_text.lower()
+        self.product_name = product_name
+        self.brand_name = brand_name
+        self.description_text = description_text.lower()
+        self.sections = sections or []
+        self.keyword_hits = {}  # text name -> KeywordHits, filled in by watsons_detectors
+
+    def find_sections(self, words, tag="h4"):
+        """Sections whose heading contains any of the lowercase words (tag=None for any element)"""
+        return [
+            section for section in self.sections
+            if (tag is None or section["tag"] == tag)
+            and any(word in section["heading"].lower() for word in words)
+        ]
+
+    def has_required_fields(self):
+        """True when the product name and brand were found on the page"""
+        return self.product_name != "N/A" and self.brand_name != "N/A"
+
+    def to_dict(self):
+        """Plain dict form of the snapshot"""
+        return {
+            "url": self.url,
+            "body_text": self.body_text,
+            "product_name": self.product_name,
+            "brand_name": self.brand_name,
+            "description_text": self.description_text,
+            "sections": self.sections,
+        }
+
+    def content_hash(self):
+        """Hash of everything the detectors read, to tell if a page's content changed"""
+        data = self.to_dict()
+        del data["url"]
+        return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a snapshot from to_dict() output"""
+        return cls(
+            data["url"],
+            data["body_text"],
+            product_name=data.get("product_name", "N/A"),
+            brand_name=data.get("brand_name", "N/A"),
+            description_text=data.get("description_text", ""),
+            sections=data.get("sections", []),
+        )
+
+def capture_snapshot(driver, url):
+    """Capture the loaded page in the browser with a single script call"""
+    data = driver.execute_script(CAPTURE_SCRIPT, detectors.DESCRIPTION_SELECTORS)
+
+    product_name = data.get("product_name")
+    brand_name = data.get("brand_name")
+    return PageSnapshot(
+        url,
+        data.get("body_text") or "",
+        product_name=product_name if product_name is not None else "N/A",
+        brand_name=brand_name if brand_name is not None else "N/A",
+        description_text="".join(" " + text for text in data.get("description", []) if text),
+        sections=data.get("sections") or [],
+    )
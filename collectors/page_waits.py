@@ -0,0 +1,251 @@
+"""Event-driven page waits with per-page timings.
+
+Instead of sleeping a fixed time after every driver.get() or scroll, the
+collectors wait for a readiness condition that fits the page type:
+
+    text_present(...)      - product pages: product name and brand have text (then a
+                             short capped settle, see load_page's settle argument)
+    grid_settled(selector) - listing pages: the product grid stopped changing
+    network_idle()         - no new resources loaded for a quiet period
+    ScrolledMore(height)   - after a scroll: the page grew, or went idle without growing
+
+Each page waits exactly as long as it needs (up to a timeout). Every load and
+wait is recorded with its page type, so print_timing_summary() and the
+page_timings.csv written by save_timings() show where the time goes.
+"""
+import csv
+import os
+import threading
+import time
+
+import crawl_metrics
+import domain_limits
+from selenium.common.exceptions import JavascriptException, TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+DEFAULT_TIMEOUT = 10
+POLL_INTERVAL = 0.1
+QUIET_PERIOD = 0.5   # seconds a grid / the network must stay unchanged to count as settled
+EMPTY_GRACE = 2      # seconds an empty listing is given before accepting it really is empty
+SCROLL_TIMEOUT = 5
+PRODUCT_SETTLE = 1.5  # max seconds a product page may keep loading after its fields rendered
+RESOURCE_BUFFER = 5000  # browsers stop adding resource timings after 250 entries by default
+
+TIMINGS_FILE = "page_timings.csv"
+TIMING_FIELDS = ["recordedAt", "pageType", "url", "loadSeconds", "waitSeconds", "outcome"]
+
+timings = []
+timings_lock = threading.Lock()  # pool workers record timings concurrently
+
+TEXT_PRESENT_SCRIPT = """
+return arguments[0].every(selector => {
+    const el = document.querySelector(selector);
+    return !!(el && el.innerText && el.innerText.trim());
+});
+"""
+
+GRID_COUNT_SCRIPT = """
+if (document.readyState !== 'complete') return -1;
+return document.querySelectorAll(arguments[0]).length;
+"""
+
+RESOURCE_COUNT_SCRIPT = """
+if (document.readyState !== 'complete') return -1;
+if (!window.__resourceBuffer) {
+    performance.setResourceTimingBufferSize(arguments[0]);
+    window.__resourceBuffer = true;
+}
+return performance.getEntriesByType('resource').length;
+"""
+
+SCROLL_STATE_SCRIPT = """
+if (!window.__resourceBuffer) {
+    performance.setResourceTimingBufferSize(arguments[0]);
+    window.__resourceBuffer = true;
+}
+return [document.body.scrollHeight, performance.getEntriesByType('resource').length];
+"""
+
+def document_ready(driver):
+    """Condition: the document and its subresources have loaded"""
+    return driver.execute_script("return document.readyState") == "complete"
+
+def text_present(*selectors):
+    """Condition: every selector matches an element with visible text"""
+    selectors = list(selectors)
+
+    def condition(driver):
+        return driver.execute_script(TEXT_PRESENT_SCRIPT, selectors)
+    return condition
+
+class Settled:
+    """Condition: a counter read by a script stays the same for QUIET_PERIOD
+
+    A negative value means "not ready yet". A zero value is only accepted once
+    empty_grace seconds have passed since the first ready reading, so a grid
+    that has not rendered yet isn't mistaken for an empty one. (The grace
+    starts there rather than when the condition is built, because callers
+    build it before load_page queues for the domain and navigates.)
+    """
+
+    def __init__(self, script, args=(), quiet=QUIET_PERIOD, empty_grace=0):
+        self.script = script
+        self.args = args
+        self.quiet = quiet
+        self.empty_grace = empty_grace
+        self.started = None  # time of the first non-negative reading
+        self.last_value = None
+        self.changed_at = time.perf_counter()
+
+    def __call__(self, driver):
+        value = driver.execute_script(self.script, *self.args)
+        now = time.perf_counter()
+        if self.started is None and value >= 0:
+            self.started = now
+        if value != self.last_value:
+            self.last_value = value
+            self.changed_at = now
+            return False
+        if value < 0 or now - self.changed_at < self.quiet:
+            return False
+        return value > 0 or now - self.started >= self.empty_grace
+
+def grid_settled(selector, quiet=QUIET_PERIOD):
+    """Condition: the number of product links matching selector stopped changing"""
+    return Settled(GRID_COUNT_SCRIPT, (selector,), quiet=quiet, empty_grace=EMPTY_GRACE)
+
+def network_idle(quiet=QUIET_PERIOD):
+    """Condition: no new resource (XHR, image, script...) finished loading for quiet seconds"""
+    return Settled(RESOURCE_COUNT_SCRIPT, (RESOURCE_BUFFER,), quiet=quiet)
+
+class ScrolledMore:
+    """Condition after scrolling: "grew" once the page is taller than before,
+    "idle" if the network settles without the page growing"""
+
+    def __init__(self, previous_height, quiet=QUIET_PERIOD):
+        self.previous_height = previous_height
+        self.quiet = quiet
+        self.last_resources = None
+        self.changed_at = time.perf_counter()
+
+    def __call__(self, driver):
+        height, resources = driver.execute_script(SCROLL_STATE_SCRIPT, RESOURCE_BUFFER)
+        if height > self.previous_height:
+            return "grew"
+        now = time.perf_counter()
+        if resources != self.last_resources:
+            self.last_resources = resources
+            self.changed_at = now
+            return False
+        return "idle" if now - self.changed_at >= self.quiet else False
+
+def all_of(*conditions):
+    """Condition: every condition holds (checked in order)"""
+    return EC.all_of(*conditions)
+
+def wait_for(driver, condition, timeout=DEFAULT_TIMEOUT):
+    """Wait until condition(driver) is truthy; returns its value, or None on timeout"""
+    try:
+        return WebDriverWait(
+            driver, timeout, poll_frequency=POLL_INTERVAL,
+            ignored_exceptions=(JavascriptException,),
+        ).until(condition)
+    except TimeoutException:
+        return None
+
+def timed_wait(driver, page_type, url, condition, timeout=DEFAULT_TIMEOUT):
+    """wait_for() that records how long the page took to become ready"""
+    start = time.perf_counter()
+    result = wait_for(driver, condition, timeout)
+    record_timing(page_type, url, 0, time.perf_counter() - start,
+                  "ready" if result is not None else "timeout")
+    return result
+
+def load_page(driver, page_type, url, condition, timeout=DEFAULT_TIMEOUT, settle=0):
+    """driver.get(url), then wait for the page type's readiness condition
+
+    Returns the condition's value, or None if the page never became ready
+    (the caller carries on with whatever has loaded, like the old sleeps did).
+
+    With settle, a ready page is then given up to settle seconds for the
+    network to go idle (late sections such as ingredients). This happens after
+    the domain slot is released, and running out of settle time is not
+    reported to domain_limits: the page already has what it needs.
+    """
+    with domain_limits.request(url):
+        start = time.perf_counter()
+        driver.get(url)
+        loaded = time.perf_counter()
+        result = wait_for(driver, condition, timeout)
+    if result is not None:
+        domain_limits.report(url, "ok", time.perf_counter() - start)
+        if settle:
+            wait_for(driver, network_idle(), settle)
+    else:
+        domain_limits.report(url, "throttled" if page_is_challenge(driver) else "timeout")
+    record_timing(page_type, url, loaded - start, time.perf_counter() - loaded,
+                  "ready" if result is not None else "timeout")
+    return result
+
+def page_is_challenge(driver):
+    """True if the open page is a block / challenge page instead of the site"""
+    try:
+        return domain_limits.is_challenge(driver.title)
+    except Exception:
+        return False
+
+def record_timing(page_type, url, load_seconds, wait_seconds, outcome):
+    """Remember one page's timing (also reported to crawl_metrics)"""
+    if load_seconds:
+        crawl_metrics.observe(f"{page_type}.navigation", load_seconds, url)
+    if wait_seconds:
+        crawl_metrics.observe(f"{page_type}.wait", wait_seconds, url)
+    if outcome == "timeout":
+        crawl_metrics.count("wait_timeout", url)
+    with timings_lock:
+        timings.append({
+            "recordedAt": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "pageType": page_type,
+            "url": url,
+            "loadSeconds": round(load_seconds, 3),
+            "waitSeconds": round(wait_seconds, 3),
+            "outcome": outcome,
+        })
+
+def print_timing_summary():
+    """Print pages, average/max time and timeouts per page type"""
+    with timings_lock:
+        rows = list(timings)
+    if not rows:
+        return
+
+    by_type = {}
+    for row in rows:
+        by_type.setdefault(row["pageType"], []).append(row)
+
+    print("\nPage timings (seconds):")
+    print(f"  {'page type':<16}{'pages':>7}{'avg load':>10}{'avg wait':>10}{'max total':>11}{'timeouts':>10}")
+    for page_type, type_rows in by_type.items():
+        loads = [row["loadSeconds"] for row in type_rows]
+        waits = [row["waitSeconds"] for row in type_rows]
+        totals = [load + wait for load, wait in zip(loads, waits)]
+        timeouts = sum(1 for row in type_rows if row["outcome"] == "timeout")
+        print(f"  {page_type:<16}{len(type_rows):>7}{sum(loads) / len(loads):>10.2f}"
+              f"{sum(waits) / len(waits):>10.2f}{max(totals):>11.2f}{timeouts:>10}")
+
+def save_timings(output_file=TIMINGS_FILE):
+    """Append the recorded timings to a CSV file and clear them"""
+    with timings_lock:
+        rows = list(timings)
+        timings.clear()
+    if not rows:
+        return
+
+    file_exists = os.path.exists(output_file)
+    with open(output_file, "a" if file_exists else "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=TIMING_FIELDS)
+        if not file_exists:
+            writer.writeheader()
+        writer.writerows(rows)
+    print(f"Page timings saved to: {output_file}")
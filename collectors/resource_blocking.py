@@ -0,0 +1,154 @@
+"""Network blocking profile for the collectors' Chrome instances.
+
+The collectors only read text, so images, fonts, video and every third-party
+host (trackers, ad tags, chat widgets, analytics) are blocked by default:
+
+- third-party hosts: Chrome's host resolver fails every host that is not in
+  the profile's allowed_hosts (so nothing is even looked up)
+- images: disabled through Chrome prefs
+- fonts, media and images served under other names: blocked by URL pattern
+  through the DevTools Network domain
+
+CSS and first-party scripts still load because the page text and layout
+depend on them. If a page needs another host (a CDN serving its scripts, say),
+add it to the profile's allowed_hosts.
+
+Check a profile on saved or live pages - the extracted fields should be the
+same with fewer bytes and less time:
+    python resource_blocking.py watsons <url> [<url> ...]
+Saved pages should be served over HTTP (python -m http.server) so byte counts
+are real; localhost is always allowed.
+"""
+import sys
+import time
+
+PROFILES = {
+    "watsons": {"allowed_hosts": ("watsons.com.my",)},
+    "sephora": {"allowed_hosts": ("sephora.my", "sephora-asia.net")},  # + the regional asset CDN
+}
+
+# Always reachable (local test servers)
+LOCAL_HOSTS = ("localhost", "127.0.0.1")
+
+BLOCKED_URL_PATTERNS = [
+    # Images
+    "*.jpg*", "*.jpeg*", "*.png*", "*.gif*", "*.webp*", "*.avif*", "*.ico*", "*.bmp*",
+    # Fonts
+    "*.woff*", "*.ttf*", "*.otf*", "*.eot*",
+    # Video / audio
+    "*.mp4*", "*.webm*", "*.m3u8*", "*.mp3*", "*.ogg*",
+]
+
+CHROME_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.default_content_setting_values.notifications": 2,
+}
+
+# Bytes and load time of the current page, from the Resource Timing API
+PAGE_COST_SCRIPT = """
+const nav = performance.getEntriesByType('navigation')[0];
+let bytes = nav ? nav.transferSize : 0;
+const resources = performance.getEntriesByType('resource');
+for (const entry of resources) bytes += entry.transferSize || 0;
+return [bytes, resources.length];
+"""
+
+def host_resolver_rules(allowed_hosts):
+    """Chrome --host-resolver-rules value that fails every host except the allowed ones"""
+    rules = ["MAP * ~NOTFOUND"]
+    for host in allowed_hosts:
+        rules.append(f"EXCLUDE {host}")
+        rules.append(f"EXCLUDE *.{host}")
+    for host in LOCAL_HOSTS:
+        rules.append(f"EXCLUDE {host}")
+    return " , ".join(rules)
+
+def apply_options(options, profile_name):
+    """Add the profile's prefs and host rules to Chrome Options (before the driver starts)"""
+    profile = PROFILES[profile_name]
+    options.add_experimental_option("prefs", CHROME_PREFS)
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.add_argument(f"--host-resolver-rules={host_resolver_rules(profile['allowed_hosts'])}")
+    return options
+
+def apply_driver(driver):
+    """Block fonts/media/images by URL pattern on a started driver"""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+    except Exception as e:
+        print(f"Could not set blocked URLs (Chrome DevTools unavailable?): {e}")
+    return driver
+
+def page_cost(driver):
+    """(bytes transferred, resources loaded) for the page currently open"""
+    transferred, resources = driver.execute_script(PAGE_COST_SCRIPT)
+    return int(transferred or 0), int(resources or 0)
+
+def extract_fields(driver, profile_name, url):
+    """The fields the collector would extract from the open page"""
+    if profile_name == "watsons":
+        import watsons_detectors as detectors
+        from page_snapshot import capture_snapshot
+        return detectors.build_record(capture_snapshot(driver, url))
+    return driver.execute_script("""
+        const text = selector => {
+            const el = document.querySelector(selector);
+            return el ? el.innerText.trim() : 'N/A';
+        };
+        return {productName: text('.product-heading h1'), brandName: text('.product-brand')};
+    """)
+
+def measure(profile_name, urls, blocked):
+    """Load each URL in a fresh headless Chrome; list of (seconds, bytes, resources, fields)"""
+    import page_waits
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+
+    options = Options()
+    options.add_argument("--headless=new")
+    if blocked:
+        apply_options(options, profile_name)
+    driver = webdriver.Chrome(options=options)
+    if blocked:
+        apply_driver(driver)
+
+    results = []
+    try:
+        for url in urls:
+            start = time.perf_counter()
+            driver.get(url)
+            page_waits.wait_for(driver, page_waits.all_of(page_waits.document_ready, page_waits.network_idle()))
+            seconds = time.perf_counter() - start
+            transferred, resources = page_cost(driver)
+            results.append((seconds, transferred, resources, extract_fields(driver, profile_name, url)))
+    finally:
+        driver.quit()
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in PROFILES:
+        print(f"Usage: python resource_blocking.py {{{'|'.join(PROFILES)}}} <url> [<url> ...]")
+        sys.exit(1)
+
+    profile_name, urls = sys.argv[1], sys.argv[2:]
+    full = measure(profile_name, urls, blocked=False)
+    lean = measure(profile_name, urls, blocked=True)
+
+    mismatches = 0
+    print(f"{'page':<50}{'full KB':>10}{'blocked KB':>12}{'full s':>8}{'blocked s':>11}  fields")
+    for url, (full_s, full_b, _, full_fields), (lean_s, lean_b, _, lean_fields) in zip(urls, full, lean):
+        same = full_fields == lean_fields
+        mismatches += not same
+        print(f"{url[-50:]:<50}{full_b / 1024:>10.0f}{lean_b / 1024:>12.0f}{full_s:>8.2f}{lean_s:>11.2f}  "
+              f"{'same' if same else 'DIFFERENT'}")
+        if not same:
+            for key in full_fields:
+                if full_fields.get(key) != lean_fields.get(key):
+                    print(f"    {key}: {full_fields.get(key)!r} -> {lean_fields.get(key)!r}")
+
+    total_full = sum(row[1] for row in full)
+    total_lean = sum(row[1] for row in lean)
+    print(f"\nBytes: {total_full / 1024:.0f} KB -> {total_lean / 1024:.0f} KB, "
+          f"time: {sum(row[0] for row in full):.1f}s -> {sum(row[0] for row in lean):.1f}s, "
+          f"{mismatches} page(s) with different fields")
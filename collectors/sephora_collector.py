@@ -2,28 +2,101 @@ from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import time
 import csv
 import winsound
 import os
+import columnar_store
+import crawl_metrics
+import crawl_state
+import domain_limits
+import page_waits
+import resource_blocking
 
 # Setup ChromeDriver
 service = Service(r"C:\Users\User\Desktop\python testing\chromedriver-win64\chromedriver.exe")
 options = Options()
 options.headless = True
 
+# Key for this collector's products in the crawl state database
+RETAILER = "sephora"
+
+# Block images, fonts, media and third-party hosts (see resource_blocking.py)
+BLOCK_RESOURCES = True
+
+if BLOCK_RESOURCES:
+    resource_blocking.apply_options(options, RETAILER)
 driver = webdriver.Chrome(service=service, options=options)
+if BLOCK_RESOURCES:
+    resource_blocking.apply_driver(driver)
 
-def wait_for_page_load(timeout=10):
-    """Wait for page to load by checking for specific elements"""
-    try:
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".product-heading h1, [class*='product'], [data-at='product_name']"))
-        )
-    except:
-        pass
+FIELDNAMES = ["brandName", "productName", "productURL"]
+
+# Also write a Parquet copy of the output (sephora_products.parquet/, needs pyarrow)
+PARQUET_OUTPUT = False
+
+# What "ready" means for each page type
+PRODUCT_LINK_SELECTOR = "a[href*='/products/']"
+PRODUCT_READY_SELECTORS = (".product-heading h1", ".product-brand")
+
+# Listing grid: containers, and the selectors tried in order for each field
+CONTAINER_SELECTOR = "[class*='product'], article, .product-card, .product-tile, [data-comp*='Product']"
+NAME_SELECTORS = [
+    "h1, h2, h3, h4",
+    "[class*='name']",
+    "[data-at='product_name']",
+    ".product-name",
+    ".css-1l5oobi",
+    "a span",
+    ".title",
+]
+BRAND_SELECTORS = ["[data-at='product_brand']", "[class*='brand']"]
+
+# Reads the whole grid in one WebDriver round trip instead of several per
+# container. Containers are nested (the selector is broad), so products are
+# merged by URL, keeping the first name and brand found for each.
+# arguments: container selector, name selectors, brand selectors
+LISTING_SCRIPT = """
+const [containerSelector, nameSelectors, brandSelectors] = arguments;
+const visible = el => el.getClientRects().length > 0;
+const firstText = (container, selectors) => {
+    for (const selector of selectors) {
+        for (const el of container.querySelectorAll(selector)) {
+            const text = visible(el) ? el.innerText.trim() : '';
+            if (text) return text;
+        }
+    }
+    return '';
+};
+
+const containers = document.querySelectorAll(containerSelector);
+const products = new Map();
+for (const container of containers) {
+    const link = container.querySelector('a');
+    if (!link || !link.href) continue;
+    const name = firstText(container, nameSelectors);
+    const brand = firstText(container, brandSelectors);
+    const product = products.get(link.href);
+    if (!product) {
+        products.set(link.href, {url: link.href, name: name, brand: brand});
+    } else {
+        product.name = product.name || name;
+        product.brand = product.brand || brand;
+    }
+}
+return {containers: containers.length, products: Array.from(products.values())};
+"""
+
+def load_listing_page(url):
+    """Open a category page and wait until its product grid stops changing"""
+    page_waits.load_page(driver, "listing", url, page_waits.grid_settled(PRODUCT_LINK_SELECTOR))
+
+def load_product_page(url):
+    """Open a product page and wait until the product name and brand are rendered"""
+    page_waits.load_page(driver, "product", url, page_waits.text_present(*PRODUCT_READY_SELECTORS))
+
+def quit_driver():
+    """Close the collector's Chrome"""
+    driver.quit()
 
 def play_completion_sound():
     """Play a sound to indicate scraping is complete"""
@@ -57,10 +130,24 @@ def is_combo_product(product_name):
     
     return False
 
+def extract_listing_products(url):
+    """Product containers on the open listing page and its [{url, name, brand}], in one round trip"""
+    with crawl_metrics.timed("listing_extract", url):
+        data = driver.execute_script(LISTING_SCRIPT, CONTAINER_SELECTOR, NAME_SELECTORS, BRAND_SELECTORS)
+    return data["containers"], data["products"]
+
+def product_url(href):
+    """Full Sephora product URL for a listing link, or None if it isn't one"""
+    if not href or ('/products/' not in href and '/product/' not in href):
+        return None
+    if 'sephora.my' not in href and not href.startswith('/'):
+        return None
+    full_url = f"https://www.sephora.my{href}" if href.startswith('/') else href
+    return full_url if '/products/' in full_url else None
+
 def get_all_product_links(category_url):
     """Get all product links from category page, filter combo products immediately"""
-    driver.get(category_url)
-    wait_for_page_load()
+    load_listing_page(category_url)
     
     all_links = set()
     page = 1
@@ -69,82 +156,43 @@ def get_all_product_links(category_url):
     while True:
         print(f"\nScraping page {page}...")
         
-        # Scroll to load all products
+        # Scroll to load all products, until a scroll no longer grows the page
         last_height = driver.execute_script("return document.body.scrollHeight")
         scrolls = 0
         while scrolls < 3:
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
+            grew = page_waits.timed_wait(driver, "listing_scroll", driver.current_url,
+                                         page_waits.ScrolledMore(last_height), page_waits.SCROLL_TIMEOUT)
+            if grew != "grew":
                 break
-            last_height = new_height
+            last_height = driver.execute_script("return document.body.scrollHeight")
             scrolls += 1
 
-        # Find all product containers on the page
-        product_containers = driver.find_elements(By.CSS_SELECTOR, 
-            "[class*='product'], article, .product-card, .product-tile, [data-comp*='Product']"
-        )
+        # Read every product container on the page at once
+        try:
+            container_count, listed_products = extract_listing_products(driver.current_url)
+        except Exception as e:
+            print(f"Could not read the product grid: {e}")
+            container_count, listed_products = 0, []
         
         current_page_links = 0
         page_combo_count = 0
         
-        print(f"Found {len(product_containers)} product containers on page {page}")
+        print(f"Found {container_count} product containers ({len(listed_products)} products) on page {page}")
         
-        for container in product_containers:
-            try:
-                # Try to extract product name from the listing
-                product_name = ""
-                
-                # Try different selectors for product name on listing page
-                name_selectors = [
-                    "h1, h2, h3, h4",
-                    "[class*='name']",
-                    "[data-at='product_name']",
-                    ".product-name",
-                    ".css-1l5oobi",
-                    "a span",
-                    ".title"
-                ]
-                
-                for selector in name_selectors:
-                    try:
-                        name_elements = container.find_elements(By.CSS_SELECTOR, selector)
-                        for name_element in name_elements:
-                            if name_element.text.strip():
-                                product_name = name_element.text.strip()
-                                break
-                        if product_name:
-                            break
-                    except:
-                        continue
-                
-                # If we found a product name, check if it's a combo
-                if product_name:
-                    if is_combo_product(product_name):
-                        page_combo_count += 1
-                        continue  # Skip this combo product
-                
-                # Get the product link
-                link_element = container.find_element(By.TAG_NAME, "a")
-                href = link_element.get_attribute("href")
-                
-                if href and ('/products/' in href or '/product/' in href):
-                    if 'sephora.my' in href or href.startswith('/'):
-                        # Format URL
-                        if href.startswith('/'):
-                            full_url = f"https://www.sephora.my{href}"
-                        else:
-                            full_url = href
-                        
-                        # Make sure it's a product URL and not already collected
-                        if full_url not in all_links and '/products/' in full_url:
-                            all_links.add(full_url)
-                            current_page_links += 1
-                            
-            except Exception as e:
-                # If we can't process this container, skip it
+        for product in listed_products:
+            full_url = product_url(product["url"])
+            if full_url is None:
+                continue
+            
+            # Skip combos by the name shown in the grid
+            if is_combo_product(product["name"]):
+                page_combo_count += 1
                 continue
+            
+            if full_url not in all_links:
+                all_links.add(full_url)
+                current_page_links += 1
         
         total_combo_skipped += page_combo_count
         
@@ -173,8 +221,7 @@ def get_all_product_links(category_url):
         
         # Try loading next page
         try:
-            driver.get(next_page_url)
-            wait_for_page_load()
+            load_listing_page(next_page_url)
             
             # Check if we're on a different page
             current_url = driver.current_url
@@ -199,8 +246,7 @@ def get_all_product_links(category_url):
 
 def parse_product(url):
     """Extract brand and product name from product page"""
-    driver.get(url)
-    wait_for_page_load()
+    load_product_page(url)
 
     try:
         product_name = driver.find_element(By.CSS_SELECTOR, ".product-heading h1").text
@@ -221,6 +267,9 @@ def parse_product(url):
         except:
             brand_name = "N/A"
 
+    if product_name == "N/A" and brand_name == "N/A":
+        domain_limits.report(url, "empty")  # blank or blocked page
+
     return {
         "brandName": brand_name,
         "productName": product_name,
@@ -231,20 +280,10 @@ def scrape_single_product(product_url, output_file="sephora_products.csv"):
     """Scrape a single product URL"""
     print(f"Scraping single product: {product_url}")
     
-    existing_urls = set()
-    file_exists = False
-    
-    try:
-        with open(output_file, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                existing_urls.add(row["productURL"])
-            file_exists = True
-            print(f"Found {len(existing_urls)} existing products in CSV")
-    except FileNotFoundError:
-        print("Creating new CSV file.")
+    state = crawl_state.get_state()
+    file_exists = crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "productURL")
     
-    if product_url in existing_urls:
+    if crawl_state.is_done(state, RETAILER, product_url):
         print("Product already exists. Skipping.")
         return
     
@@ -253,63 +292,87 @@ def scrape_single_product(product_url, output_file="sephora_products.csv"):
         if data is not None:
             mode = "a" if file_exists else "w"
             with open(output_file, mode, newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=["brandName", "productName", "productURL"])
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
                 
                 if not file_exists:
                     writer.writeheader()
                 
-                writer.writerow(data)
-                print(f"✓ Scraped: {data['brandName']} - {data['productName']}")
+                with crawl_metrics.timed("csv_write", product_url):
+                    writer.writerow(data)
+            crawl_state.save_product(state, RETAILER, product_url, "scraped", data)
+            print(f"✓ Scraped: {data['brandName']} - {data['productName']}")
         else:
+            crawl_state.save_product(state, RETAILER, product_url, "skipped")
             print("Skipped combo product")
     except Exception as e:
+        crawl_state.save_product(state, RETAILER, product_url, "failed", error=e)
         print(f"✗ Failed to scrape {product_url}: {e}")
 
 def scrape_category(category_url, output_file="sephora_products.csv"):
     """Scrape all products from a category"""
-    print("Getting product links from category...")
-    product_urls = get_all_product_links(category_url)
-    print(f"\nFound {len(product_urls)} individual products (combo products already filtered out).")
+    state = crawl_state.get_state()
 
-    existing_urls = set()
-    file_exists = False
-    
-    try:
-        with open(output_file, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                existing_urls.add(row["productURL"])
-            file_exists = True
-            print(f"Found {len(existing_urls)} existing products in CSV")
-    except FileNotFoundError:
-        print("Creating new CSV file.")
+    # Resume an interrupted run from its checkpoint instead of paginating the category again
+    product_urls = crawl_state.load_checkpoint(state, RETAILER, category_url)
+    if product_urls is not None:
+        print(f"Resuming unfinished run: {len(product_urls)} products from checkpoint.")
+    else:
+        print("Getting product links from category...")
+        product_urls = get_all_product_links(category_url)
+        crawl_state.start_checkpoint(state, RETAILER, category_url, product_urls)
+        print(f"\nFound {len(product_urls)} individual products (combo products already filtered out).")
+
+    file_exists = crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "productURL")
     
-    new_product_urls = [url for url in product_urls if url not in existing_urls]
+    new_product_urls = crawl_state.checkpoint_remaining(state, RETAILER, category_url)
     print(f"Found {len(new_product_urls)} new products to scrape")
     
     if not new_product_urls:
+        crawl_state.finish_checkpoint(state, RETAILER, category_url)
         print("No new products to add.")
         return
 
+    if PARQUET_OUTPUT and file_exists and not columnar_store.is_current(output_file):
+        crawl_state.export_parquet(state, RETAILER, output_file, FIELDNAMES)
+
     mode = "a" if file_exists else "w"
-    with open(output_file, mode, newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["brandName", "productName", "productURL"])
+    with columnar_store.parquet_output(output_file, FIELDNAMES, PARQUET_OUTPUT) as parquet, \
+            open(output_file, mode, newline="", encoding="utf-8") as f:
+        writer = columnar_store.TeeWriter(csv.DictWriter(f, fieldnames=FIELDNAMES), parquet)
         
         if not file_exists:
             writer.writeheader()
         
         for i, url in enumerate(new_product_urls, 1):
             try:
-                data = parse_product(url)
+                data = crawl_state.scrape_with_retries(state, RETAILER, category_url, url, parse_product)
                 if data is not None:
-                    writer.writerow(data)
+                    with crawl_metrics.timed("csv_write", url):
+                        writer.writerow(data)
+                    crawl_state.save_product(state, RETAILER, url, "scraped", data)
                     print(f"[{i}/{len(new_product_urls)}] ✓ {data['brandName']} - {data['productName']}")
                 else:
+                    crawl_state.save_product(state, RETAILER, url, "skipped")
                     print(f"[{i}/{len(new_product_urls)}] Skipped combo product")
+                crawl_state.record_attempt(state, RETAILER, category_url, url)
             except Exception as e:
+                crawl_state.save_product(state, RETAILER, url, "failed", error=e)
                 print(f"[{i}/{len(new_product_urls)}] ✗ Failed: {url} - Error: {e}")
-            
-            time.sleep(0.3)
+
+    gave_up = crawl_state.finish_checkpoint(state, RETAILER, category_url)
+    if gave_up:
+        print(f"{len(gave_up)} products still failing after {crawl_state.MAX_ATTEMPTS} attempts "
+              f"(retried on the next run):")
+        for url in gave_up:
+            print(f"  {url}")
+
+def export_products(output_file="sephora_products.csv"):
+    """Regenerate the output CSV (and the Parquet copy if enabled) from the crawl state"""
+    state = crawl_state.get_state()
+    count = crawl_state.export_csv(state, RETAILER, output_file, FIELDNAMES)
+    print(f"Exported {count} products to {output_file}")
+    if PARQUET_OUTPUT and crawl_state.export_parquet(state, RETAILER, output_file, FIELDNAMES) is not None:
+        print(f"Exported {count} products to {columnar_store.dataset_path(output_file)}")
 
 if __name__ == "__main__":
     print("=" * 50)
@@ -318,10 +381,15 @@ if __name__ == "__main__":
     print("\nEnter URL to scrape:")
     print("1. Category URL (e.g., https://www.sephora.my/categories/skincare/cleanser)")
     print("2. Single Product URL (e.g., https://www.sephora.my/products/fresh-soy-face-cleanser/v/150ml)")
+    print("Or type 'export' to rebuild the CSV from the crawl state")
     print()
     
     user_url = input("URL: ").strip()
     
+    if user_url.lower() == "export":
+        export_products()
+        exit()
+    
     if not user_url:
         print("Error: No URL provided!")
         exit()
@@ -332,13 +400,18 @@ if __name__ == "__main__":
     
     print(f"\nStarting to scrape: {user_url}")
     print("Please wait...\n")
+    crawl_metrics.start_run(RETAILER)
     
     if '/products/' in user_url:
         scrape_single_product(user_url)
     else:
         scrape_category(user_url)
     
-    driver.quit()
+    quit_driver()
+    crawl_state.close_state()
+    page_waits.print_timing_summary()
+    page_waits.save_timings()
+    crawl_metrics.finish_run()
     
     print("\n" + "=" * 50)
     print("SCRAPING COMPLETED!")
@@ -0,0 +1,221 @@
+"""Chunked brandlist filtering for product lists of any size.
+
+The filter scripts (filter.py, filterW.py, filterWcombine.py) load the whole
+product CSV into pandas and copy it several times (cleaned copy, remaining /
+removed splits, combined file, sorted copies). In streaming mode they call
+filter_products() instead, which:
+
+- reads the product CSV CHUNK_SIZE rows at a time
+- marks each chunk against the brandlist index built once up front
+- appends each chunk's rows to the remaining / removed / combined outputs
+  straight away, or, when the outputs are sorted, sorts the chunk and saves
+  it as a run in a temporary folder; the runs are merged into the output
+  files at the end (heapq.merge reads one row of each run at a time)
+
+Memory use depends on CHUNK_SIZE and the brandlist, not on the number of
+products. Only the brand counts of removed products and a few sample rows
+are kept for the summary.
+
+    result = streaming_filter.filter_products(
+        "watsons_products_simple.csv", taken_index, "product_name", "brand_name",
+        remaining_file="watsons_products_remaining.csv",
+        removed_file="watsons_products_removed.csv")
+"""
+import csv
+import heapq
+import os
+import shutil
+import tempfile
+from collections import Counter
+
+import columnar_store
+import csv_encoding
+
+CHUNK_SIZE = 5000
+SAMPLE_ROWS = 5
+
+# Extra columns at the front of the combined file
+TAKEN_COLUMN = "✔ Taken?"
+STATUS_COLUMN = "Status"
+TAKEN_MARK = "✅"
+NOT_TAKEN_MARK = "□"
+
+# Cells pandas reads as NaN ("", "N/A", ...): sorted last, not counted and
+# written as empty cells, like the pandas path does
+MISSING_VALUES = frozenset(columnar_store.MISSING_VALUES)
+
+def iter_chunks(path, chunk_size=CHUNK_SIZE):
+    """(fieldnames, rows) for every chunk_size rows of a CSV; column names are stripped"""
+    f, delimiter = csv_encoding.open_text(path)
+    with f:
+        reader = csv.reader(f, delimiter=delimiter)
+        fieldnames = [name.strip() for name in next(reader, [])]
+        chunk = []
+        chunks = 0
+        for values in reader:
+            if not any(values):
+                continue
+            chunk.append(dict(zip(fieldnames, values)))
+            if len(chunk) >= chunk_size:
+                yield fieldnames, chunk
+                chunks += 1
+                chunk = []
+        if chunk or not chunks:
+            yield fieldnames, chunk
+
+def read_fieldnames(path):
+    """Stripped column names from the header row of a CSV"""
+    f, delimiter = csv_encoding.open_text(path)
+    with f:
+        return [name.strip() for name in next(csv.reader(f, delimiter=delimiter), [])]
+
+def clean(value):
+    return (value or "").strip().lower()
+
+def blank_missing(row):
+    return {name: "" if value in MISSING_VALUES else value for name, value in row.items()}
+
+def sort_key(columns):
+    """Row key for sorting by the columns in order, missing values last"""
+    def key(row):
+        return tuple((row.get(column, "") in MISSING_VALUES, row.get(column, "")) for column in columns)
+    return key
+
+class RowWriter:
+    """One output CSV, written as chunks arrive or sorted through on-disk runs
+
+    The file is only created when a row is written, unless keep_empty is set
+    (then an empty file with just the header is written). Rows are written
+    like DataFrame.to_csv: LF line endings, MISSING_VALUES as empty cells.
+    """
+
+    def __init__(self, path, fieldnames, sort_columns=None, keep_empty=True):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.key = sort_key(sort_columns) if sort_columns else None
+        self.keep_empty = keep_empty
+        self.rows = 0
+        self.file = None
+        self.writer = None
+        self.run_dir = None
+        self.runs = []
+
+    def open(self):
+        self.file = open(self.path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=self.fieldnames, extrasaction="ignore",
+                                     lineterminator="\n")
+        self.writer.writeheader()
+
+    def add(self, rows):
+        if not rows:
+            return
+        self.rows += len(rows)
+        if self.key is None:
+            if self.writer is None:
+                self.open()
+            self.writer.writerows(blank_missing(row) for row in rows)
+            return
+
+        # Sorted output: save the chunk as a sorted run for the final merge
+        if self.run_dir is None:
+            self.run_dir = tempfile.mkdtemp(prefix="filter_runs_")
+        run_path = os.path.join(self.run_dir, f"run_{len(self.runs):05d}.csv")
+        with open(run_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            for row in sorted(rows, key=self.key):
+                writer.writerow([row.get(name, "") for name in self.fieldnames])
+        self.runs.append(run_path)
+
+    def read_run(self, f):
+        for values in csv.reader(f):
+            yield dict(zip(self.fieldnames, values))
+
+    def close(self):
+        try:
+            if self.runs:
+                self.open()
+                files = [open(path, "r", newline="", encoding="utf-8") for path in self.runs]
+                try:
+                    merged = heapq.merge(*(self.read_run(f) for f in files), key=self.key)
+                    self.writer.writerows(blank_missing(row) for row in merged)
+                finally:
+                    for f in files:
+                        f.close()
+            elif self.writer is None and self.keep_empty:
+                self.open()
+        finally:
+            if self.file is not None:
+                self.file.close()
+            if self.run_dir is not None:
+                shutil.rmtree(self.run_dir, ignore_errors=True)
+
+class FilterResult:
+    """Counts, removed-brand counts and sample rows of a streaming filter run"""
+
+    def __init__(self):
+        self.fieldnames = []
+        self.total = 0
+        self.remaining = 0
+        self.removed = 0
+        self.removed_brands = Counter()
+        self.remaining_sample = []
+        self.removed_sample = []
+
+def filter_products(product_file, taken_index, name_column, brand_column=None,
+                    remaining_file=None, removed_file=None, combined_file=None,
+                    sort_columns=None, chunk_size=CHUNK_SIZE):
+    """Split product_file into remaining / removed (and combined) CSVs chunk by chunk
+
+    A product is removed when taken_index.mark_taken() marks its cleaned name
+    (and brand, if brand_column is given). Outputs set to None are not written.
+    With sort_columns the outputs are sorted by those columns. The combined
+    file has the taken checkbox and status in front of every row: removed
+    products first, then remaining ones (unless it is sorted).
+    """
+    result = FilterResult()
+    writers = None
+    try:
+        for fieldnames, rows in iter_chunks(product_file, chunk_size):
+            if writers is None:
+                result.fieldnames = fieldnames
+                lead = [column for column in (brand_column, name_column) if column]
+                combined_fields = [TAKEN_COLUMN, STATUS_COLUMN] + lead + [
+                    column for column in fieldnames if column not in lead
+                ]
+                outputs = (
+                    ("remaining", remaining_file, fieldnames, True),
+                    ("removed", removed_file, fieldnames, False),
+                    ("combined", combined_file, combined_fields, True),
+                )
+                writers = {
+                    name: RowWriter(path, fields, sort_columns, keep_empty)
+                    for name, path, fields, keep_empty in outputs if path
+                }
+
+            names = [clean(row.get(name_column)) for row in rows]
+            brands = [clean(row.get(brand_column)) for row in rows] if brand_column else None
+            marks = taken_index.mark_taken(names, brands)
+
+            remaining = [row for row, taken in zip(rows, marks) if not taken]
+            removed = [row for row, taken in zip(rows, marks) if taken]
+            result.total += len(rows)
+            result.remaining += len(remaining)
+            result.removed += len(removed)
+            if brand_column:
+                result.removed_brands.update(row[brand_column] for row in removed if row.get(brand_column, "") not in MISSING_VALUES)
+            result.remaining_sample.extend(remaining[:SAMPLE_ROWS - len(result.remaining_sample)])
+            result.removed_sample.extend(removed[:SAMPLE_ROWS - len(result.removed_sample)])
+
+            if "remaining" in writers:
+                writers["remaining"].add(remaining)
+            if "removed" in writers:
+                writers["removed"].add(removed)
+            if "combined" in writers:
+                writers["combined"].add(
+                    [dict(row, **{TAKEN_COLUMN: TAKEN_MARK, STATUS_COLUMN: "Already Taken"}) for row in removed]
+                    + [dict(row, **{TAKEN_COLUMN: NOT_TAKEN_MARK, STATUS_COLUMN: "Not Taken"}) for row in remaining]
+                )
+    finally:
+        for writer in (writers or {}).values():
+            writer.close()
+    return result
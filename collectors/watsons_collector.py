@@ -1,19 +1,133 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
 import time
 import csv
 import winsound  # For Windows sound
 import os
+import queue
+import threading
+import classify_pool
+import columnar_store
+import crawl_metrics
+import crawl_state
+import domain_limits
+import listing_prefilter
+import page_cache
+import page_waits
+import resource_blocking
+import watsons_detectors as detectors
+import watsons_http
+import watsons_listing
+from page_snapshot import capture_snapshot
+from watsons_detectors import is_single_product
 
 # Setup ChromeDriver
 # put the location of the Chrome Driver
-service = Service(r" ")
-options = Options()
-options.headless = True
+CHROMEDRIVER_PATH = r" "
 
-driver = webdriver.Chrome(service=service, options=options)
+# Key for this collector's products in the crawl state database
+RETAILER = "watsons"
+
+FIELDNAMES = [
+    "brandName", "productName", "categoryType", "bodyParts", 
+    "productFunction", "babyProduct", "eczemaProduct", 
+    "country", "productIngredient", "productURL"
+]
+
+# Block images, fonts, media and third-party hosts (see resource_blocking.py)
+BLOCK_RESOURCES = True
+
+# Number of Chrome instances used by scrape_category (1 = one browser, no parallelism)
+DEFAULT_WORKERS = 1
+
+# Read product pages with a plain HTTP request first and only open Chrome
+# when the server-rendered HTML is missing the product name or brand
+HTTP_FIRST = True
+
+# Discover category products from the listing's search JSON (64 per request)
+# and only scroll the category pages in Chrome when the API can't be used or
+# fails part way (the endpoint is not verified yet, see watsons_listing.py)
+LISTING_API_FIRST = True
+
+# Also write a Parquet copy of the output (watsons_products.parquet/, needs pyarrow)
+# so the filter scripts can read brand/product name without parsing the CSV
+PARQUET_OUTPUT = False
+
+# Keep every product page's snapshot in the compressed page cache (page_cache/)
+# so "reparse" can re-run the detectors without fetching anything
+PAGE_CACHE = True
+
+# Classify product pages in worker processes (see classify_pool.py) while the
+# browsers load the next pages; False runs the detectors on the browser threads
+CLASSIFY_IN_PROCESSES = True
+
+# What "ready" means for each page type (replaces the fixed sleeps)
+PRODUCT_LINK_SELECTOR = "a[href*='/p/']"
+PRODUCT_READY_SELECTORS = (".product-name", ".brand-group .product-brand a")
+
+# Every product link on a listing page with its text, in one round trip
+LISTING_LINKS_SCRIPT = """
+return Array.from(document.querySelectorAll(arguments[0]), a => [a.href, (a.innerText || '').trim()]);
+"""
+
+# Taken products are skipped at the listing (brandlist.csv next to the script)
+BRANDLIST_FILE = listing_prefilter.BRANDLIST_FILE
+
+def create_driver():
+    """Start a new headless Chrome instance"""
+    options = Options()
+    options.headless = True
+    options.add_argument("--headless=new")
+    if BLOCK_RESOURCES:
+        resource_blocking.apply_options(options, RETAILER)
+    new_driver = webdriver.Chrome(service=Service(CHROMEDRIVER_PATH), options=options)
+    if BLOCK_RESOURCES:
+        resource_blocking.apply_driver(new_driver)
+    return new_driver
+
+# Each thread (the main thread and every pool worker) gets its own browser,
+# started the first time it is actually needed
+browser_local = threading.local()
+open_drivers = []
+drivers_lock = threading.Lock()
+
+def get_driver():
+    """Get this thread's Chrome instance, starting it on first use"""
+    if getattr(browser_local, "driver", None) is None:
+        browser_local.driver = create_driver()
+        with drivers_lock:
+            open_drivers.append(browser_local.driver)
+    return browser_local.driver
+
+def quit_driver():
+    """Close this thread's Chrome instance if one was started"""
+    thread_driver = getattr(browser_local, "driver", None)
+    if thread_driver is not None:
+        browser_local.driver = None
+        with drivers_lock:
+            open_drivers.remove(thread_driver)
+        try:
+            thread_driver.quit()
+        except Exception:
+            pass  # Chrome already crashed
+
+def quit_all_drivers():
+    """Close every Chrome instance that is still open"""
+    with drivers_lock:
+        drivers = list(open_drivers)
+        open_drivers.clear()
+    for open_driver in drivers:
+        try:
+            open_driver.quit()
+        except Exception:
+            pass
+    browser_local.driver = None
+
+def close_workers():
+    """Close every Chrome instance and stop the classification processes"""
+    quit_all_drivers()
+    classify_pool.shutdown()
 
 def play_completion_sound():
     """Play a sound to indicate scraping is complete"""
@@ -34,10 +148,20 @@ def play_completion_sound():
         print(f"Scraping complete! ✓ (Sound error: {e})")
 
 def get_all_product_links(category_url):
-    driver.get(category_url)
-    time.sleep(2)
+    """Every product on the category as (url, name, brand), in listing order
 
-    all_links = set()
+    Name or brand is "N/A" when the listing doesn't show it.
+    """
+    if LISTING_API_FIRST:
+        products = watsons_listing.harvest_listing(category_url)
+        if products:
+            return products
+        print("Listing API unavailable, scrolling the category pages instead")
+
+    driver = get_driver()
+    page_waits.load_page(driver, "listing", category_url, page_waits.grid_settled(PRODUCT_LINK_SELECTOR))
+
+    all_links = {}  # url -> name, in discovery order so output is deterministic
     page_count = 0  # Start from 0
     
     # Extract base URL without existing query parameters
@@ -46,24 +170,27 @@ def get_all_product_links(category_url):
     while True:
         print(f"Scraping page {page_count + 1}...")
         
-        # Scroll to load all products
+        # Scroll to load all products, until a scroll no longer grows the page
         last_height = driver.execute_script("return document.body.scrollHeight")
         while True:
             driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-            time.sleep(1)
-            new_height = driver.execute_script("return document.body.scrollHeight")
-            if new_height == last_height:
+            grew = page_waits.timed_wait(driver, "listing_scroll", driver.current_url,
+                                         page_waits.ScrolledMore(last_height), page_waits.SCROLL_TIMEOUT)
+            if grew != "grew":
                 break
-            last_height = new_height
+            last_height = driver.execute_script("return document.body.scrollHeight")
 
-        # Collect product links from current page
-        elements = driver.find_elements(By.CSS_SELECTOR, "a[href*='/p/']")
+        # Collect product links (and the name shown on the tile) from current page
         current_page_links = 0
-        for el in elements:
-            href = el.get_attribute("href")
-            if href and href not in all_links:
-                all_links.add(href)
+        for href, text in driver.execute_script(LISTING_LINKS_SCRIPT, PRODUCT_LINK_SELECTOR):
+            if not href:
+                continue
+            if href not in all_links:
+                all_links[href] = ""
                 current_page_links += 1
+            if text and not all_links[href]:
+                # Image links have no text; the name link for the same product does
+                all_links[href] = text
         
         print(f"Found {current_page_links} new products on page {page_count + 1}")
         print(f"Total unique products so far: {len(all_links)}")
@@ -78,8 +205,7 @@ def get_all_product_links(category_url):
         next_page_url = f"{base_url}?pageSize=64&currentPage={next_page_count}"
         
         # Check if next page exists by trying to load it
-        driver.get(next_page_url)
-        time.sleep(2)
+        page_waits.load_page(driver, "listing", next_page_url, page_waits.grid_settled(PRODUCT_LINK_SELECTOR))
         
         # Check if we're still on the same page (no next page) by comparing URLs
         current_url = driver.current_url
@@ -95,498 +221,74 @@ def get_all_product_links(category_url):
             break
 
     print(f"Total unique products found: {len(all_links)}")
-    return list(all_links)
-
-def is_single_product(product_name):
-    """Check if the product is a single item (not a bundle/combo)"""
-    # Indicators of multiple products in one listing
-    multi_product_indicators = [
-        ' combo', ' bundle', ' pack', ' set',
-        ' twin', ' duo', ' pair', ' kit', ' collection'
-    ]
-    
-    # Check for size combinations that indicate multiple products
-    # Pattern: number+unit number+unit (e.g., "473ml 454g", "100ml 200ml")
-    import re
-    size_pattern = r'\d+\s*(ml|g|oz|l)\s+\d+\s*(ml|g|oz|l)'
-    
-    product_lower = product_name.lower()
-    
-    # Check for multi-product indicators
-    for indicator in multi_product_indicators:
-        if indicator in product_lower:
-            return False
-    
-    # Check for multiple size patterns
-    if re.search(size_pattern, product_lower):
-        return False
-    
-    return True
-
-def check_for_eczema(driver):
-    """Check if the product description mentions eczema in a positive context"""
-    try:
-        # Get all text content from the page
-        page_text = driver.find_element(By.TAG_NAME, "body").text.lower()
-        
-        # Comprehensive eczema-related keywords
-        eczema_keywords = [
-            # Medical terms
-            'eczema', 'atopic dermatitis', 'dermatitis', 'contact dermatitis', 
-            'seborrheic dermatitis', 'nummular eczema', 'dyshidrotic eczema',
-            'neurodermatitis', 'stasis dermatitis', 'xerotic eczema',
-            
-            # Symptoms (more specific combinations)
-            'itchy skin', 'skin itch', 'pruritus', 'skin inflammation',
-            'skin rash', 'red patches', 'dry skin condition', 'flaky skin',
-            'scaly skin', 'skin flaking', 'skin scaling', 'rough skin',
-            'cracked skin', 'skin fissures', 'skin weeping', 'oozing skin',
-            'skin crusting', 'skin blisters', 'skin bumps', 'skin irritation',
-            'extremely dry skin', 'severely dry skin', 'chronically dry skin',
-            'dry itchy skin',
-        ]
-        
-        # Negative indicators (mentions that mean NOT for eczema)
-        negative_indicators = [
-            'do not use', 'avoid', 'not for', 'not recommended', 'warning',
-            'if you have', 'consult your doctor', 'see a doctor', 'discontinue use'
-        ]
-        
-        # Positive indicators (mentions that mean FOR eczema)
-        positive_indicators = [
-            'for eczema', 'treats eczema', 'eczema relief', 'eczema care',
-            'eczema treatment', 'soothe eczema', 'calm eczema', 'relieve eczema',
-            'manage eczema', 'eczema-prone', 'suitable for eczema', 'eczema-friendly'
-        ]
-        
-        # Check if any eczema-related keyword appears in the text
-        for keyword in eczema_keywords:
-            if keyword in page_text:
-                # Check context around the keyword to determine if it's positive or negative
-                keyword_index = page_text.find(keyword)
-                if keyword_index >= 0:
-                    # Get broader context around the keyword
-                    start = max(0, keyword_index - 150)
-                    end = min(len(page_text), keyword_index + len(keyword) + 150)
-                    context = page_text[start:end]
-                    
-                    # Check for explicit positive context first
-                    if any(positive in context for positive in positive_indicators):
-                        return "Yes"  # Explicit positive mention
-                    
-                    # Check for negative context
-                    if any(negative in context for negative in negative_indicators):
-                        return "No"  # Negative mention (warning/avoid)
-                    
-                    # For general mentions without clear context, check if it's in a list of conditions
-                    # If it's just listed among other conditions without positive context, assume No
-                    condition_indicators = ['condition', 'disease', 'disorder', 'problem', 'issue']
-                    if any(indicator in context for indicator in condition_indicators):
-                        return "No"  # Likely just listing conditions, not treating them
-                    
-                    # If no clear context but mentions symptoms, check if product description suggests treatment
-                    symptom_keywords = ['itchy', 'rash', 'redness', 'dryness', 'flaky', 'scaly']
-                    if any(symptom in keyword for symptom in symptom_keywords):
-                        # Check if product description suggests it helps with these symptoms
-                        treatment_indicators = ['relieve', 'soothe', 'calm', 'reduce', 'help with', 'improve']
-                        if any(treatment in context for treatment in treatment_indicators):
-                            return "Yes"
-                        else:
-                            return "No"  # Just mentioning symptoms without treatment context
-                    
-                    # Default to No for ambiguous mentions
-                    return "No"
-        
-        return "No"
-        
-    except Exception as e:
-        print(f"Error checking for eczema: {e}")
-        return "No"
-
-def check_for_baby(driver):
-    """Check if the product description mentions it's for babies"""
-    try:
-        # Get all text content from the page
-        page_text = driver.find_element(By.TAG_NAME, "body").text.lower()
-        
-        # More specific baby keywords to avoid false positives
-        baby_keywords = [
-            'for baby', 'for babies', 'for infant', 'for newborns',
-            'baby care', 'baby skin', 'baby formula', 
-            'baby shampoo', 'baby lotion', 'baby cream', 'baby oil',
-            'infant care', 'newborn care', 'toddler care'
-        ]
-        
-        # Check if any baby-related keyword appears in the text
-        for keyword in baby_keywords:
-            if keyword in page_text:
-                return "Yes"
-        
-        return "No"
-        
-    except Exception as e:
-        print(f"Error checking for baby: {e}")
-        return "No"
+    return [(url, name or "N/A", "N/A") for url, name in all_links.items()]
 
-def detect_country(driver):
-    """Detect the country of origin from the product page"""
-    try:
-        # Method 1: Look for "Origin" heading and get the next paragraph
-        headings = driver.find_elements(By.XPATH, "//h4[contains(translate(text(), 'ORIGIN', 'origin'), 'origin')]")
-        
-        for heading in headings:
-            try:
-                # Try to find the next sibling paragraph
-                next_element = heading.find_element(By.XPATH, "./following-sibling::p[1]")
-                country = next_element.text.strip()
-                if country and len(country) < 50:  # Reasonable length for country name
-                    return country
-            except:
-                continue
-        
-        # Method 2: Look for other country indicators in the page text
-        page_text = driver.find_element(By.TAG_NAME, "body").text.lower()
-        
-        country_indicators = [
-            'made in', 'product of', 'origin:', 'from', 'formulated in',
-            'manufactured in', 'produced in'
-        ]
-        
-        common_countries = [
-            'usa', 'united states', 'japan', 'korea', 'south korea', 'france',
-            'germany', 'united kingdom', 'uk', 'china', 'taiwan', 'malaysia',
-            'thailand', 'australia', 'canada', 'italy', 'spain', 'switzerland'
-        ]
-        
-        for indicator in country_indicators:
-            if indicator in page_text:
-                # Find the context around the indicator
-                indicator_index = page_text.find(indicator)
-                if indicator_index >= 0:
-                    start = max(0, indicator_index)
-                    end = min(len(page_text), indicator_index + len(indicator) + 30)
-                    context = page_text[start:end]
-                    
-                    # Look for country names in the context
-                    for country in common_countries:
-                        if country in context:
-                            return country.title()
-        
-        return ""  # Return empty string if no country found
-        
-    except Exception as e:
-        print(f"Error detecting country: {e}")
-        return ""
+def browser_snapshot(url, driver=None):
+    """Load a product page in Chrome and capture its snapshot"""
+    if driver is None:
+        driver = get_driver()
+    # Name and brand rendered, then give late sections (ingredients etc.) a capped settle
+    page_waits.load_page(driver, "product", url, page_waits.text_present(*PRODUCT_READY_SELECTORS),
+                         settle=page_waits.PRODUCT_SETTLE)
+    return capture_snapshot(driver, url)
 
-def detect_body_parts(driver):
-    """Detect which body parts the product is used for"""
+def cache_snapshot(snapshot):
+    """Save a product page's snapshot in the page cache (if enabled)"""
+    if not PAGE_CACHE:
+        return
     try:
-        # Get text from specific sections only (not entire page)
-        page_text = ""
-        
-        # Try to get product description specifically (avoid footer, navigation, etc.)
-        try:
-            # Focus on main product content areas
-            content_selectors = [
-                ".product-description", 
-                ".description", 
-                "[class*='description']", 
-                "[class*='detail']",
-                ".product-details",
-                ".specifications"
-            ]
-            
-            for selector in content_selectors:
-                elements = driver.find_elements(By.CSS_SELECTOR, selector)
-                for element in elements:
-                    if "footer" not in element.get_attribute("class").lower() and "nav" not in element.get_attribute("class").lower():
-                        page_text += " " + element.text.lower()
-        except:
-            pass
-        
-        # Also check product usage section specifically
-        try:
-            usage_headings = driver.find_elements(By.XPATH, "//h4[contains(translate(text(), 'USAGE', 'usage'), 'usage') or contains(translate(text(), 'HOW TO USE', 'how to use'), 'how to use') or contains(translate(text(), 'PRODUCT USAGE', 'product usage'), 'product usage')]")
-            for heading in usage_headings:
-                try:
-                    next_element = heading.find_element(By.XPATH, "./following-sibling::p[1]")
-                    page_text += " " + next_element.text.lower()
-                except:
-                    pass
-        except:
-            pass
-        
-        # If no specific content found, fall back to entire page but be more careful
-        if not page_text.strip():
-            page_text = driver.find_element(By.TAG_NAME, "body").text.lower()
-        
-        # Body part keywords (skin removed)
-        body_part_keywords = {
-            'face': ['face', 'facial', 'forehead', 'cheek', 'chin', 'nose'],
-            'body': ['body', 'bodily', 'full body', 'whole body', 'shower'],
-            'hair': ['hair', 'shampoo', 'conditioner', 'scalp'],
-            'neck': ['neck', 'neckline', 'decollete'],
-            'arms': ['arm', 'arms', 'underarm', 'armpit'],
-            'legs': ['leg', 'legs', 'thigh', 'calf'],
-            'feet': ['foot', 'toes', 'sole', 'heel'],
-            'lips': ['lip', 'lips', 'lip care'],
-            'eye': ['eye', 'eyes', 'eyelid', 'under eye', 'eye area']
-        }
-        
-        detected_parts = []
-        
-        # First priority: Check product name (most reliable)
-        try:
-            product_name = driver.find_element(By.CLASS_NAME, "product-name").text.lower()
-            for part, keywords in body_part_keywords.items():
-                for keyword in keywords:
-                    if keyword in product_name:
-                        if part not in detected_parts:
-                            detected_parts.append(part)
-                        break
-        except:
-            pass
-        
-        # For cleansing products, assume face if not specified otherwise
-        if not detected_parts:
-            cleansing_indicators = ['cleansing', 'cleanser', 'cleanse', 'face wash', 'facial wash', 'makeup remover', 'makeup removal']
-            product_name_lower = product_name.lower() if 'product_name' in locals() else ""
-            
-            if any(indicator in product_name_lower for indicator in cleansing_indicators):
-                if 'face' not in detected_parts:
-                    detected_parts.append('face')
-        
-        # Second priority: Check description with context
-        for part, keywords in body_part_keywords.items():
-            for keyword in keywords:
-                if keyword in page_text:
-                    # Context checking - look for usage context but be less strict
-                    keyword_index = page_text.find(keyword)
-                    if keyword_index >= 0:
-                        # Get context around the keyword
-                        start = max(0, keyword_index - 50)
-                        end = min(len(page_text), keyword_index + len(keyword) + 50)
-                        context = page_text[start:end]
-                        
-                        # Check if it's likely to be about product usage
-                        usage_indicators = ['for', 'use', 'cleanse', 'wash', 'care', 'treatment', 'apply', 'on', 'clean', 'gentle', 'remove', 'massage', 'makeup']
-                        negative_indicators = ['ingredient', 'extract', 'oil', 'acid', 'chemical', 'footer', 'copyright', 'nav', 'menu']  # Avoid non-usage mentions
-                        
-                        # For face-related terms in cleansing context, be more lenient
-                        if part == 'face' and any(indicator in context for indicator in ['cleansing', 'cleanse', 'makeup']):
-                            if part not in detected_parts:
-                                detected_parts.append(part)
-                            break
-                        # For other parts, require usage indicators AND no negative indicators
-                        elif (any(indicator in context for indicator in usage_indicators) and 
-                              not any(negative in context for negative in negative_indicators)):
-                            if part not in detected_parts:
-                                detected_parts.append(part)
-                            break
-        
-        return ", ".join(detected_parts) if detected_parts else "Not specified"
-        
+        page_cache.store(crawl_state.get_state(), RETAILER, snapshot)
     except Exception as e:
-        print(f"Error detecting body parts: {e}")
-        return "Not specified"
+        print(f"Could not cache {snapshot.url}: {e}")
 
-def detect_product_function(driver):
-    """Detect what the product does (its function)"""
-    try:
-        # Get all text content from the page
-        page_text = driver.find_element(By.TAG_NAME, "body").text.lower()
-        
-        # Product function keywords
-        function_keywords = {
-            'cleansing': ['cleanse', 'cleansing', 'purify', 'purifying', 'remove dirt', 'deep clean'],
-            'moisturizing': ['moisturize', 'moisturizing', 'hydrate', 'hydrating', 'hydration'],
-            'exfoliating': ['exfoliate', 'exfoliating', 'scrub', 'scrubbing', 'remove dead skin'],
-            'rejuvenating': ['rejuvenate', 'rejuvenating', 'revitalize', 'revitalizing', 'renew'],
-            'nourishing': ['nourish', 'nourishing', 'nutrient', 'nutritious', 'feed skin'],
-            'brightening': ['brighten', 'brightening', 'glow', 'radiance', 'luminous'],
-            'anti-aging': ['anti-aging', 'anti aging', 'wrinkle', 'fine lines', 'age spot'],
-            'acne treatment': ['acne', 'pimple', 'breakout', 'blemish', 'clear skin'],
-            'soothing': ['soothe', 'soothing', 'calm', 'calming', 'relieve irritation'],
-            'protecting': ['protect', 'protecting', 'shield', 'defend', 'barrier'],
-            'repairing': ['repair', 'repairing', 'restore', 'restoring', 'heal'],
-            'firming': ['firm', 'firming', 'tighten', 'tightening', 'lift'],
-            'whitening': ['whiten', 'whitening', 'lighten', 'lightening', 'even tone']
-        }
-        
-        detected_functions = []
-        for function, keywords in function_keywords.items():
-            for keyword in keywords:
-                if keyword in page_text:
-                    if function not in detected_functions:
-                        detected_functions.append(function)
-                    break
-        
-        return ", ".join(detected_functions) if detected_functions else "Not specified"
-        
-    except Exception as e:
-        print(f"Error detecting product function: {e}")
-        return "Not specified"
+def product_snapshot(url, driver=None):
+    """Load a product page once (HTTP first, Chrome if needed) and cache its snapshot"""
+    snapshot = None
+    if HTTP_FIRST:
+        start = time.perf_counter()
+        snapshot = watsons_http.fetch_snapshot(url)
+        page_waits.record_timing("product_http", url, time.perf_counter() - start, 0,
+                                 "ready" if snapshot is not None else "fallback")
 
-def detect_category_type(product_name, driver):
-    """Detect the product type/category based on name and description"""
-    try:
-        # Get all text content from the page
-        page_text = driver.find_element(By.TAG_NAME, "body").text.lower()
-        combined_text = (product_name + " " + page_text).lower()
-        
-        # Product type keywords and patterns
-        category_types = {
-            'cleanser': ['cleanser', 'cleansing', 'face wash', 'facial wash'],
-            'moisturizer': ['moisturizer', 'moisturising', 'moisturizing', 'cream', 'lotion'],
-            'serum': ['serum', 'essence', 'concentrate', 'ampoule'],
-            'toner': ['toner', 'toning', 'freshener', 'astringent'],
-            'mask': ['mask', 'masque', 'sheet mask', 'pack', 'eye mask'],
-            'sunscreen': ['sunscreen', 'sunblock', 'spf', 'uv protection'],
-            'treatment': ['treatment', 'treatment cream', 'spot treatment'],
-            'scrub': ['scrub', 'exfoliator', 'polishing', 'gommage'],
-            'oil': ['oil', 'facial oil', 'body oil', 'hair oil'],
-            'gel': ['gel', 'gel cleanser', 'gel moisturizer'],
-            'foam': ['foam', 'foaming', 'cleansing foam'],
-            'balm': ['balm', 'ointment', 'salve'],
-            'spray': ['spray', 'mist', 'aerosol'],
-            'powder': ['powder', 'talc', 'dusting powder'],
-            'stick': ['stick', 'roll-on', 'applicator stick'],
-            'body wash': ['body wash', 'shower gel', 'body shower'],
-            'shampoo': ['shampoo', 'hair wash', 'dry shampoo'],
-            'conditioner': ['conditioner', 'hair conditioner'],
-            'soap': ['soap', 'bar soap', 'bath soap'],
-            'tonic': ['tonic', 'hair tonic', 'skin tonic']
-        }
-        
-        # Check for matches in the combined text
-        for category, keywords in category_types.items():
-            for keyword in keywords:
-                if keyword in combined_text:
-                    return category
-        
-        return "Not specified"
-        
-    except Exception as e:
-        print(f"Error detecting category type: {e}")
-        return "Not specified"
+    if snapshot is None:
+        snapshot = browser_snapshot(url, driver)
+        if snapshot.product_name == "N/A" and snapshot.brand_name == "N/A":
+            domain_limits.report(url, "empty")  # blank or blocked page
 
-def parse_product(url):
-    driver.get(url)
-    time.sleep(3)
+    cache_snapshot(snapshot)
+    return snapshot
 
-    try:
-        product_name = driver.find_element(By.CLASS_NAME, "product-name").text
-    except:
-        product_name = "N/A"
+def parse_product(url, driver=None):
+    """Load a product page once and run every detector on its snapshot"""
+    snapshot = product_snapshot(url, driver)
 
     # Check if this is a single product (not a bundle/combo)
-    if not is_single_product(product_name):
-        print(f"Skipping multi-product bundle: {product_name}")
+    if not is_single_product(snapshot.product_name):
+        print(f"Skipping multi-product bundle: {snapshot.product_name}")
         return None
 
-    try:
-        # Extract product brand
-        brand_element = driver.find_element(By.CSS_SELECTOR, ".brand-group .product-brand a")
-        brand_name = brand_element.text
-    except:
-        brand_name = "N/A"
-
-    # Check for eczema mention
-    eczema_product = check_for_eczema(driver)
-    
-    # Check for baby mention
-    baby_product = check_for_baby(driver)
-    
-    # Detect country of origin
-    country = detect_country(driver)
-    
-    # Detect body parts
-    body_parts = detect_body_parts(driver)
-    
-    # Detect product function
-    product_function = detect_product_function(driver)
-    
-    # Detect category type
-    category_type = detect_category_type(product_name, driver)
+    return detectors.build_record(snapshot)
 
-    try:
-        # IMPROVED: More flexible approach to find ingredients
-        product_ingredient = "N/A"
-        
-        # Method 1: Look for any heading containing "ingredient" (case insensitive)
-        headings = driver.find_elements(By.XPATH, "//h4[contains(translate(text(), 'INGREDIENT', 'ingredient'), 'ingredient')]")
-        
-        if not headings:
-            # Method 2: Look for any element containing "ingredient"
-            headings = driver.find_elements(By.XPATH, "//*[contains(translate(text(), 'INGREDIENT', 'ingredient'), 'ingredient')]")
-        
-        for heading in headings:
-            try:
-                # Try to find the next sibling paragraph or div
-                next_element = heading.find_element(By.XPATH, "./following-sibling::p[1]")
-                if next_element.text.strip():
-                    product_ingredient = next_element.text
-                    break
-            except:
-                try:
-                    # Try finding next div or any following element with text
-                    next_element = heading.find_element(By.XPATH, "./following-sibling::*[1]")
-                    if next_element.text.strip():
-                        product_ingredient = next_element.text
-                        break
-                except:
-                    continue
-        
-        # Method 3: If still not found, try to find any element with ingredient information
-        if product_ingredient == "N/A":
-            all_elements = driver.find_elements(By.XPATH, "//*[contains(translate(text(), 'INGREDIENT', 'ingredient'), 'ingredient') or contains(translate(text(), 'COMPOSITION', 'composition'), 'composition')]")
-            for element in all_elements:
-                parent = element.find_element(By.XPATH, "..")
-                siblings = parent.find_elements(By.XPATH, "./*")
-                for sibling in siblings:
-                    if sibling.text.strip() and sibling != element:
-                        product_ingredient = sibling.text
-                        break
-                if product_ingredient != "N/A":
-                    break
-                    
-    except Exception as e:
-        print(f"Error extracting ingredients from {url}: {e}")
-        product_ingredient = "N/A"
-
-    return {
-        "brandName": brand_name,
-        "productName": product_name,
-        "categoryType": category_type,
-        "bodyParts": body_parts,
-        "productFunction": product_function,
-        "babyProduct": baby_product,
-        "eczemaProduct": eczema_product,
-        "country": country,
-        "productIngredient": product_ingredient,
-        "productURL": url
-    }
+def print_product_details(data):
+    """Print the detected fields of a scraped product"""
+    print(f"     Category: {data['categoryType']}")
+    print(f"     Body Parts: {data['bodyParts']}")
+    print(f"     Function: {data['productFunction']}")
+    print(f"     Baby Product: {data['babyProduct']}")
+    print(f"     Eczema Product: {data['eczemaProduct']}")
+    print(f"     Country: {data['country']}")
+    print(f"     Ingredients: {data['productIngredient'][:50]}...")
 
 def scrape_single_product(product_url, output_file="watsons_products.csv"):
     """Scrape a single product URL"""
     print(f"Scraping single product: {product_url}")
     
-    # Check if file exists and read existing products
-    existing_urls = set()
-    file_exists = False
-    
-    try:
-        with open(output_file, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                existing_urls.add(row["productURL"])
-            file_exists = True
-            print(f"Found {len(existing_urls)} existing products in CSV")
-    except FileNotFoundError:
-        print("No existing CSV file found. Creating new file.")
+    # Check the crawl state instead of re-reading the CSV
+    state = crawl_state.get_state()
+    file_exists = crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "productURL")
     
     # Check if product already exists
-    if product_url in existing_urls:
+    if crawl_state.is_done(state, RETAILER, product_url):
         print("Product already exists in CSV. Skipping.")
         return
     
@@ -596,87 +298,293 @@ def scrape_single_product(product_url, output_file="watsons_products.csv"):
         if data is not None:  # Only write if it's a single product (not None)
             mode = "a" if file_exists else "w"
             with open(output_file, mode, newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=[
-                    "brandName", "productName", "categoryType", "bodyParts", 
-                    "productFunction", "babyProduct", "eczemaProduct", 
-                    "country", "productIngredient", "productURL"
-                ])
+                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
                 
                 # Write header only if new file
                 if not file_exists:
                     writer.writeheader()
                 
-                writer.writerow(data)
-                print(f"Scraped: {data['brandName']} - {data['productName']}")
-                print(f"     Category: {data['categoryType']}")
-                print(f"     Body Parts: {data['bodyParts']}")
-                print(f"     Function: {data['productFunction']}")
-                print(f"     Baby Product: {data['babyProduct']}")
-                print(f"     Eczema Product: {data['eczemaProduct']}")
-                print(f"     Country: {data['country']}")
-                print(f"     Ingredients: {data['productIngredient'][:50]}...")
+                with crawl_metrics.timed("csv_write", product_url):
+                    writer.writerow(data)
+            crawl_state.save_product(state, RETAILER, product_url, "scraped", data)
+            print(f"Scraped: {data['brandName']} - {data['productName']}")
+            print_product_details(data)
         else:
+            crawl_state.save_product(state, RETAILER, product_url, "skipped")
             print("Skipped multi-product bundle")
     except Exception as e:
+        crawl_state.save_product(state, RETAILER, product_url, "failed", error=e)
         print(f"Failed to scrape {product_url}: {e}")
 
-def scrape_category(category_url, output_file="watsons_products.csv"):
-    print("Getting product links from category...")
-    product_urls = get_all_product_links(category_url)
-    print(f"Found {len(product_urls)} products.")
+def scrape_products_parallel(product_urls, writer, category_url, workers=DEFAULT_WORKERS):
+    """Scrape product URLs with a pool of browsers, writing rows in the original URL order
 
-    # Check if file exists and read existing products
-    existing_urls = set()
-    file_exists = False
-    
+    Every URL is checkpointed under category_url; failures are retried with backoff
+    (on a fresh browser) before being given up for this run. With
+    CLASSIFY_IN_PROCESSES the workers only fetch pages and the detectors run
+    in classify_pool's processes.
+    """
+    workers = max(1, min(workers, len(product_urls)))
+    total = len(product_urls)
+    state = crawl_state.get_state()
+
+    # Shared queue of (position, url) that every browser pulls from
+    url_queue = queue.Queue()
+    for index, url in enumerate(product_urls):
+        url_queue.put((index, url))
+    result_queue = queue.Queue()
+
+    def worker():
+        # Each worker starts its own browser the first time a page needs one
+        try:
+            while True:
+                try:
+                    index, url = url_queue.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    if CLASSIFY_IN_PROCESSES:
+                        snapshot = crawl_state.scrape_with_retries(
+                            state, RETAILER, category_url, url, product_snapshot,
+                            on_error=lambda error: quit_driver(),
+                        )
+                        # The record is collected in order below; this browser moves on
+                        data = classify_pool.submit(snapshot)
+                    else:
+                        data = crawl_state.scrape_with_retries(
+                            state, RETAILER, category_url, url, parse_product,
+                            on_error=lambda error: quit_driver(),
+                        )
+                    result_queue.put((index, url, data, None))
+                except Exception as e:
+                    result_queue.put((index, url, None, e))
+        finally:
+            quit_driver()
+
+    if workers > 1:
+        print(f"Started {workers} workers")
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    # Results arrive out of order; hold them until every earlier URL has been written
+    pending = {}
+    next_index = 0
     try:
-        with open(output_file, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                existing_urls.add(row["productURL"])
-            file_exists = True
-            print(f"Found {len(existing_urls)} existing products in CSV")
-    except FileNotFoundError:
-        print("No existing CSV file found. Creating new file.")
+        for _ in range(total):
+            index, url, data, error = result_queue.get()
+            pending[index] = (url, data, error)
+            while next_index in pending:
+                url, data, error = pending.pop(next_index)
+                next_index += 1
+                if error is None and CLASSIFY_IN_PROCESSES:
+                    try:
+                        data = classify_pool.result(data, url)
+                    except Exception as e:
+                        crawl_state.record_attempt(state, RETAILER, category_url, url, error=e)
+                        error = e
+                if error is not None:
+                    crawl_state.save_product(state, RETAILER, url, "failed", error=error)
+                    print(f"Failed to scrape {url}: {error}")
+                    continue
+                if data is not None:  # Only write if it's a single product (not None)
+                    with crawl_metrics.timed("csv_write", url):
+                        writer.writerow(data)
+                    crawl_state.save_product(state, RETAILER, url, "scraped", data)
+                    print(f"[{next_index}/{total}] Scraped: {data['brandName']} - {data['productName']}")
+                    print_product_details(data)
+                else:
+                    crawl_state.save_product(state, RETAILER, url, "skipped")
+                    print(f"[{next_index}/{total}] Skipped multi-product bundle")
+                crawl_state.record_attempt(state, RETAILER, category_url, url)
+    finally:
+        # Stop handing out URLs (e.g. after Ctrl+C) and let in-flight pages finish
+        while True:
+            try:
+                url_queue.get_nowait()
+            except queue.Empty:
+                break
+        for thread in threads:
+            thread.join()
+
+def scrape_category(category_url, output_file="watsons_products.csv", workers=DEFAULT_WORKERS):
+    state = crawl_state.get_state()
+
+    # Resume an interrupted run from its checkpoint instead of paginating the category again
+    product_urls = crawl_state.load_checkpoint(state, RETAILER, category_url)
+    if product_urls is not None:
+        print(f"Resuming unfinished run: {len(product_urls)} products from checkpoint.")
+    else:
+        print("Getting product links from category...")
+        products = get_all_product_links(category_url)
+        print(f"Found {len(products)} products.")
+
+        # Drop bundles and already-taken products before opening any product page
+        products = listing_prefilter.prefilter_listing(
+            products, is_single_product, listing_prefilter.load_brandlist(BRANDLIST_FILE)
+        )
+        product_urls = [url for url, name, brand in products]
+        crawl_state.start_checkpoint(state, RETAILER, category_url, product_urls)
+
+    # Check the crawl state instead of re-reading the CSV
+    file_exists = crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "productURL")
     
-    # Filter out products that already exist in CSV
-    new_product_urls = [url for url in product_urls if url not in existing_urls]
+    # Products not scraped yet (and failed ones with attempts left)
+    new_product_urls = crawl_state.checkpoint_remaining(state, RETAILER, category_url)
     print(f"Found {len(new_product_urls)} new products to scrape")
     
     if not new_product_urls:
+        crawl_state.finish_checkpoint(state, RETAILER, category_url)
         print("No new products to add. Exiting.")
         return
 
+    # The Parquet copy starts from everything already in the store
+    if PARQUET_OUTPUT and file_exists and not columnar_store.is_current(output_file):
+        crawl_state.export_parquet(state, RETAILER, output_file, FIELDNAMES)
+
     # Open file in append mode if it exists, write mode if new
     mode = "a" if file_exists else "w"
-    with open(output_file, mode, newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            "brandName", "productName", "categoryType", "bodyParts", 
-            "productFunction", "babyProduct", "eczemaProduct", 
-            "country", "productIngredient", "productURL"
-        ])
+    with columnar_store.parquet_output(output_file, FIELDNAMES, PARQUET_OUTPUT) as parquet, \
+            open(output_file, mode, newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
         
         # Write header only if new file
         if not file_exists:
             writer.writeheader()
         
-        for i, url in enumerate(new_product_urls, 1):
-            try:
-                data = parse_product(url)
-                if data is not None:  # Only write if it's a single product (not None)
-                    writer.writerow(data)
-                    print(f"[{i}/{len(new_product_urls)}] Scraped: {data['brandName']} - {data['productName']}")
-                    print(f"     Category: {data['categoryType']}")
-                    print(f"     Body Parts: {data['bodyParts']}")
-                    print(f"     Function: {data['productFunction']}")
-                    print(f"     Baby Product: {data['babyProduct']}")
-                    print(f"     Eczema Product: {data['eczemaProduct']}")
-                    print(f"     Country: {data['country']}")
-                    print(f"     Ingredients: {data['productIngredient'][:50]}...")
-                else:
-                    print(f"[{i}/{len(new_product_urls)}] Skipped multi-product bundle")
-            except Exception as e:
-                print(f"Failed to scrape {url}: {e}")
+        scrape_products_parallel(new_product_urls, columnar_store.TeeWriter(writer, parquet), category_url, workers)
+
+    gave_up = crawl_state.finish_checkpoint(state, RETAILER, category_url)
+    if gave_up:
+        print(f"{len(gave_up)} products still failing after {crawl_state.MAX_ATTEMPTS} attempts "
+              f"(kept as failed in {crawl_state.STATE_DB}, retried on the next run):")
+        for url in gave_up:
+            print(f"  {url}")
+
+def refresh_product(state, url):
+    """Re-check one stored product, re-running the detectors only if its page changed
+
+    Returns "unchanged", "changed", "removed" or "failed".
+    """
+    validators = crawl_state.get_validators(state, RETAILER, url)
+    status, html, etag, last_modified = watsons_http.fetch_if_changed(
+        url, validators.get("etag"), validators.get("last_modified")
+    )
+    if status == "failed":
+        return "failed"
+    if status == "gone":
+        crawl_state.save_product(state, RETAILER, url, "removed")
+        return "removed"
+    if status == "unchanged":  # 304: nothing downloaded
+        crawl_state.save_validators(state, RETAILER, url, etag, last_modified, validators.get("content_hash"))
+        return "unchanged"
+
+    snapshot = watsons_http.snapshot_from_html(html, url)
+    if not snapshot.has_required_fields():
+        snapshot = browser_snapshot(url)
+    cache_snapshot(snapshot)
+
+    # Same content as last time: the detectors would give the same record
+    content_hash = snapshot.content_hash()
+    if content_hash == validators.get("content_hash"):
+        crawl_state.save_validators(state, RETAILER, url, etag, last_modified, content_hash)
+        return "unchanged"
+
+    if not is_single_product(snapshot.product_name):
+        crawl_state.save_product(state, RETAILER, url, "skipped")
+        crawl_state.save_validators(state, RETAILER, url, etag, last_modified, content_hash)
+        return "changed"
+
+    record = detectors.build_record(snapshot)
+    changed = record != crawl_state.load_record(state, RETAILER, url)
+    if changed:
+        crawl_state.save_product(state, RETAILER, url, "scraped", record)
+    crawl_state.save_validators(state, RETAILER, url, etag, last_modified, content_hash)
+    return "changed" if changed else "unchanged"
+
+def refresh_products(output_file="watsons_products.csv"):
+    """Incremental refresh: re-check every stored product and rewrite the CSV
+
+    Pages the server reports as unchanged (ETag/Last-Modified) are not
+    downloaded, and pages whose content hash is unchanged are not re-parsed,
+    so a refresh costs roughly one conditional request per product plus full
+    extraction only for the products that changed.
+    """
+    state = crawl_state.get_state()
+    crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "productURL")
+    urls = crawl_state.stored_urls(state, RETAILER)
+    print(f"Refreshing {len(urls)} stored products...")
+
+    counts = {"unchanged": 0, "changed": 0, "removed": 0, "failed": 0}
+    start = time.perf_counter()
+    for i, url in enumerate(urls, 1):
+        try:
+            result = refresh_product(state, url)
+        except Exception as e:
+            print(f"Failed to refresh {url}: {e}")
+            result = "failed"
+        counts[result] += 1
+        if result != "unchanged":
+            print(f"[{i}/{len(urls)}] {result}: {url}")
+
+    print(f"Refresh done in {time.perf_counter() - start:.1f}s: " +
+          ", ".join(f"{count} {name}" for name, count in counts.items()))
+    if counts["changed"] or counts["removed"]:
+        export_products(output_file)
+
+def reparse_products(output_file="watsons_products.csv"):
+    """Re-run the detectors on the cached page of every stored product and rewrite the CSV
+
+    Nothing is fetched: products whose page isn't in the page cache keep
+    their stored record. Use after changing a keyword table or detector.
+    """
+    state = crawl_state.get_state()
+    crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "productURL")
+    urls = [(url, "scraped") for url in crawl_state.stored_urls(state, RETAILER)]
+    urls += [(url, "skipped") for url in crawl_state.stored_urls(state, RETAILER, "skipped")]
+    print(f"Re-parsing {len(urls)} stored products from {page_cache.CACHE_DIR}...")
+
+    counts = {"changed": 0, "unchanged": 0, "not cached": 0}
+    start = time.perf_counter()
+
+    def cached_snapshots():
+        for url, status in urls:
+            snapshot = page_cache.load(state, RETAILER, url)
+            if snapshot is None:
+                counts["not cached"] += 1
+            else:
+                yield (url, status), snapshot
+
+    if CLASSIFY_IN_PROCESSES:
+        classified = classify_pool.classify_many(cached_snapshots())
+    else:
+        classified = ((key, detectors.classify_snapshot(snapshot)) for key, snapshot in cached_snapshots())
+
+    for (url, status), record in classified:
+        if record is None:  # multi-product bundle
+            result = "unchanged" if status == "skipped" else "changed"
+            if result == "changed":
+                crawl_state.save_product(state, RETAILER, url, "skipped")
+        else:
+            result = "unchanged"
+            if status != "scraped" or record != crawl_state.load_record(state, RETAILER, url):
+                crawl_state.save_product(state, RETAILER, url, "scraped", record)
+                result = "changed"
+        counts[result] += 1
+        if result == "changed":
+            print(f"Changed: {url}")
+
+    print(f"Re-parse done in {time.perf_counter() - start:.1f}s: " +
+          ", ".join(f"{count} {name}" for name, count in counts.items()))
+    export_products(output_file)
+
+def export_products(output_file="watsons_products.csv"):
+    """Regenerate the output CSV (and the Parquet copy if enabled) from the crawl state"""
+    state = crawl_state.get_state()
+    count = crawl_state.export_csv(state, RETAILER, output_file, FIELDNAMES)
+    print(f"Exported {count} products to {output_file}")
+    if PARQUET_OUTPUT and crawl_state.export_parquet(state, RETAILER, output_file, FIELDNAMES) is not None:
+        print(f"Exported {count} products to {columnar_store.dataset_path(output_file)}")
 
 # ------------------------------
 # MAIN
@@ -688,10 +596,34 @@ if __name__ == "__main__":
     print("You can enter either:")
     print("1. A category URL (e.g., https://www.watsons.com.my/face-wash-cleanser/c/120101)")
     print("2. A single product URL (e.g., https://www.watsons.com.my/product-name/p/BP_12345)")
+    print("Or type 'export' to rebuild the CSV from the crawl state,")
+    print("or 'refresh' to re-check every stored product and update the ones that changed,")
+    print("or 'reparse' to re-run the detectors on the cached pages without fetching anything")
     print()
     
     user_url = input("Please enter the URL to scrape: ").strip()
     
+    if user_url.lower() == "export":
+        export_products()
+        exit()
+    
+    if user_url.lower() == "reparse":
+        crawl_metrics.start_run(RETAILER)
+        reparse_products()
+        classify_pool.shutdown()
+        crawl_state.close_state()
+        crawl_metrics.finish_run()
+        exit()
+    
+    crawl_metrics.start_run(RETAILER)
+    
+    if user_url.lower() == "refresh":
+        refresh_products()
+        quit_all_drivers()
+        crawl_state.close_state()
+        crawl_metrics.finish_run()
+        exit()
+    
     # Validate URL
     if not user_url:
         print("Error: No URL provided!")
@@ -710,9 +642,15 @@ if __name__ == "__main__":
         scrape_single_product(user_url)
     else:
         # Category URL
-        scrape_category(user_url)
+        workers_input = input(f"Number of browser workers (default {DEFAULT_WORKERS}): ").strip()
+        workers = int(workers_input) if workers_input.isdigit() and int(workers_input) > 0 else DEFAULT_WORKERS
+        scrape_category(user_url, workers=workers)
     
-    driver.quit()
+    close_workers()
+    crawl_state.close_state()
+    page_waits.print_timing_summary()
+    page_waits.save_timings()
+    crawl_metrics.finish_run()
     
     # Play completion sound
     print("\n" + "="*50)
@@ -0,0 +1,438 @@
+"""Keyword detectors for Watsons product pages.
+
+Every detector reads a PageSnapshot (see page_snapshot.py), so they run in
+pure Python on text captured once from the browser or parsed from the raw
+HTML (see watsons_http.py).
+
+All keyword tables are compiled into one KeywordMatcher at import. Each text
+(page body, description, product name) is scanned once and the detectors
+classify from the resulting hit offsets instead of rescanning per keyword.
+"""
+import crawl_metrics
+from keyword_matcher import KeywordMatcher
+
+# Elements that hold the product description (used for body part detection)
+DESCRIPTION_SELECTORS = [
+    ".product-description",
+    ".description",
+    "[class*='description']",
+    "[class*='detail']",
+    ".product-details",
+    ".specifications"
+]
+
+# Headings whose next paragraph describes how the product is used
+USAGE_HEADINGS = ['usage', 'how to use', 'product usage']
+
+# Comprehensive eczema-related keywords
+ECZEMA_KEYWORDS = [
+    # Medical terms
+    'eczema', 'atopic dermatitis', 'dermatitis', 'contact dermatitis',
+    'seborrheic dermatitis', 'nummular eczema', 'dyshidrotic eczema',
+    'neurodermatitis', 'stasis dermatitis', 'xerotic eczema',
+
+    # Symptoms (more specific combinations)
+    'itchy skin', 'skin itch', 'pruritus', 'skin inflammation',
+    'skin rash', 'red patches', 'dry skin condition', 'flaky skin',
+    'scaly skin', 'skin flaking', 'skin scaling', 'rough skin',
+    'cracked skin', 'skin fissures', 'skin weeping', 'oozing skin',
+    'skin crusting', 'skin blisters', 'skin bumps', 'skin irritation',
+    'extremely dry skin', 'severely dry skin', 'chronically dry skin',
+    'dry itchy skin',
+]
+
+# Negative indicators (mentions that mean NOT for eczema)
+ECZEMA_NEGATIVE_INDICATORS = [
+    'do not use', 'avoid', 'not for', 'not recommended', 'warning',
+    'if you have', 'consult your doctor', 'see a doctor', 'discontinue use'
+]
+
+# Positive indicators (mentions that mean FOR eczema)
+ECZEMA_POSITIVE_INDICATORS = [
+    'for eczema', 'treats eczema', 'eczema relief', 'eczema care',
+    'eczema treatment', 'soothe eczema', 'calm eczema', 'relieve eczema',
+    'manage eczema', 'eczema-prone', 'suitable for eczema', 'eczema-friendly'
+]
+
+# Words that suggest eczema is just listed among other conditions
+CONDITION_INDICATORS = ['condition', 'disease', 'disorder', 'problem', 'issue']
+
+# Symptom words (checked against the matched keyword itself)
+SYMPTOM_KEYWORDS = ['itchy', 'rash', 'redness', 'dryness', 'flaky', 'scaly']
+
+# Words that suggest the product helps with the symptoms
+TREATMENT_INDICATORS = ['relieve', 'soothe', 'calm', 'reduce', 'help with', 'improve']
+
+# More specific baby keywords to avoid false positives
+BABY_KEYWORDS = [
+    'for baby', 'for babies', 'for infant', 'for newborns',
+    'baby care', 'baby skin', 'baby formula',
+    'baby shampoo', 'baby lotion', 'baby cream', 'baby oil',
+    'infant care', 'newborn care', 'toddler care'
+]
+
+COUNTRY_INDICATORS = [
+    'made in', 'product of', 'origin:', 'from', 'formulated in',
+    'manufactured in', 'produced in'
+]
+
+COMMON_COUNTRIES = [
+    'usa', 'united states', 'japan', 'korea', 'south korea', 'france',
+    'germany', 'united kingdom', 'uk', 'china', 'taiwan', 'malaysia',
+    'thailand', 'australia', 'canada', 'italy', 'spain', 'switzerland'
+]
+
+# Body part keywords (skin removed)
+BODY_PART_KEYWORDS = {
+    'face': ['face', 'facial', 'forehead', 'cheek', 'chin', 'nose'],
+    'body': ['body', 'bodily', 'full body', 'whole body', 'shower'],
+    'hair': ['hair', 'shampoo', 'conditioner', 'scalp'],
+    'neck': ['neck', 'neckline', 'decollete'],
+    'arms': ['arm', 'arms', 'underarm', 'armpit'],
+    'legs': ['leg', 'legs', 'thigh', 'calf'],
+    'feet': ['foot', 'toes', 'sole', 'heel'],
+    'lips': ['lip', 'lips', 'lip care'],
+    'eye': ['eye', 'eyes', 'eyelid', 'under eye', 'eye area']
+}
+
+CLEANSING_INDICATORS = ['cleansing', 'cleanser', 'cleanse', 'face wash', 'facial wash', 'makeup remover', 'makeup removal']
+
+# Check if it's likely to be about product usage
+USAGE_INDICATORS = ['for', 'use', 'cleanse', 'wash', 'care', 'treatment', 'apply', 'on', 'clean', 'gentle', 'remove', 'massage', 'makeup']
+BODY_PART_NEGATIVE_INDICATORS = ['ingredient', 'extract', 'oil', 'acid', 'chemical', 'footer', 'copyright', 'nav', 'menu']  # Avoid non-usage mentions
+
+# For face-related terms in cleansing context, be more lenient
+FACE_CLEANSING_CONTEXT = ['cleansing', 'cleanse', 'makeup']
+
+# Product function keywords
+FUNCTION_KEYWORDS = {
+    'cleansing': ['cleanse', 'cleansing', 'purify', 'purifying', 'remove dirt', 'deep clean'],
+    'moisturizing': ['moisturize', 'moisturizing', 'hydrate', 'hydrating', 'hydration'],
+    'exfoliating': ['exfoliate', 'exfoliating', 'scrub', 'scrubbing', 'remove dead skin'],
+    'rejuvenating': ['rejuvenate', 'rejuvenating', 'revitalize', 'revitalizing', 'renew'],
+    'nourishing': ['nourish', 'nourishing', 'nutrient', 'nutritious', 'feed skin'],
+    'brightening': ['brighten', 'brightening', 'glow', 'radiance', 'luminous'],
+    'anti-aging': ['anti-aging', 'anti aging', 'wrinkle', 'fine lines', 'age spot'],
+    'acne treatment': ['acne', 'pimple', 'breakout', 'blemish', 'clear skin'],
+    'soothing': ['soothe', 'soothing', 'calm', 'calming', 'relieve irritation'],
+    'protecting': ['protect', 'protecting', 'shield', 'defend', 'barrier'],
+    'repairing': ['repair', 'repairing', 'restore', 'restoring', 'heal'],
+    'firming': ['firm', 'firming', 'tighten', 'tightening', 'lift'],
+    'whitening': ['whiten', 'whitening', 'lighten', 'lightening', 'even tone']
+}
+
+# Product type keywords and patterns
+CATEGORY_TYPES = {
+    'cleanser': ['cleanser', 'cleansing', 'face wash', 'facial wash'],
+    'moisturizer': ['moisturizer', 'moisturising', 'moisturizing', 'cream', 'lotion'],
+    'serum': ['serum', 'essence', 'concentrate', 'ampoule'],
+    'toner': ['toner', 'toning', 'freshener', 'astringent'],
+    'mask': ['mask', 'masque', 'sheet mask', 'pack', 'eye mask'],
+    'sunscreen': ['sunscreen', 'sunblock', 'spf', 'uv protection'],
+    'treatment': ['treatment', 'treatment cream', 'spot treatment'],
+    'scrub': ['scrub', 'exfoliator', 'polishing', 'gommage'],
+    'oil': ['oil', 'facial oil', 'body oil', 'hair oil'],
+    'gel': ['gel', 'gel cleanser', 'gel moisturizer'],
+    'foam': ['foam', 'foaming', 'cleansing foam'],
+    'balm': ['balm', 'ointment', 'salve'],
+    'spray': ['spray', 'mist', 'aerosol'],
+    'powder': ['powder', 'talc', 'dusting powder'],
+    'stick': ['stick', 'roll-on', 'applicator stick'],
+    'body wash': ['body wash', 'shower gel', 'body shower'],
+    'shampoo': ['shampoo', 'hair wash', 'dry shampoo'],
+    'conditioner': ['conditioner', 'hair conditioner'],
+    'soap': ['soap', 'bar soap', 'bath soap'],
+    'tonic': ['tonic', 'hair tonic', 'skin tonic']
+}
+
+# One automaton for every keyword above, built once at import
+KEYWORD_MATCHER = KeywordMatcher(
+    ECZEMA_KEYWORDS + ECZEMA_NEGATIVE_INDICATORS + ECZEMA_POSITIVE_INDICATORS
+    + CONDITION_INDICATORS + TREATMENT_INDICATORS + BABY_KEYWORDS
+    + COUNTRY_INDICATORS + COMMON_COUNTRIES
+    + [keyword for keywords in BODY_PART_KEYWORDS.values() for keyword in keywords]
+    + CLEANSING_INDICATORS + USAGE_INDICATORS + BODY_PART_NEGATIVE_INDICATORS
+    + FACE_CLEANSING_CONTEXT
+    + [keyword for keywords in FUNCTION_KEYWORDS.values() for keyword in keywords]
+    + [keyword for keywords in CATEGORY_TYPES.values() for keyword in keywords]
+)
+
+def is_single_product(product_name):
+    """Check if the product is a single item (not a bundle/combo)"""
+    # Indicators of multiple products in one listing
+    multi_product_indicators = [
+        ' combo', ' bundle', ' pack', ' set',
+        ' twin', ' duo', ' pair', ' kit', ' collection'
+    ]
+    
+    # Check for size combinations that indicate multiple products
+    # Pattern: number+unit number+unit (e.g., "473ml 454g", "100ml 200ml")
+    import re
+    size_pattern = r'\d+\s*(ml|g|oz|l)\s+\d+\s*(ml|g|oz|l)'
+    
+    product_lower = product_name.lower()
+    
+    # Check for multi-product indicators
+    for indicator in multi_product_indicators:
+        if indicator in product_lower:
+            return False
+    
+    # Check for multiple size patterns
+    if re.search(size_pattern, product_lower):
+        return False
+    
+    return True
+
+def find_keywords(snapshot, name, text):
+    """Scan one text of the snapshot, reusing the hits if it was already scanned"""
+    if name not in snapshot.keyword_hits:
+        snapshot.keyword_hits[name] = KEYWORD_MATCHER.search(text)
+    return snapshot.keyword_hits[name]
+
+def body_keywords(snapshot):
+    """Keyword hits in the whole page text"""
+    return find_keywords(snapshot, "body", snapshot.body_text)
+
+def check_for_eczema(snapshot):
+    """Check if the product description mentions eczema in a positive context"""
+    try:
+        page_text = snapshot.body_text
+        hits = body_keywords(snapshot)
+
+        # Check if any eczema-related keyword appears in the text
+        for keyword in ECZEMA_KEYWORDS:
+            if keyword in hits:
+                # Check context around the keyword to determine if it's positive or negative
+                keyword_index = hits.first(keyword)
+
+                # Get broader context around the keyword
+                start = max(0, keyword_index - 150)
+                end = min(len(page_text), keyword_index + len(keyword) + 150)
+
+                # Check for explicit positive context first
+                if hits.any_within(ECZEMA_POSITIVE_INDICATORS, start, end):
+                    return "Yes"  # Explicit positive mention
+
+                # Check for negative context
+                if hits.any_within(ECZEMA_NEGATIVE_INDICATORS, start, end):
+                    return "No"  # Negative mention (warning/avoid)
+
+                # If it's just listed among other conditions without positive context, assume No
+                if hits.any_within(CONDITION_INDICATORS, start, end):
+                    return "No"  # Likely just listing conditions, not treating them
+
+                # If no clear context but mentions symptoms, check if product description suggests treatment
+                if any(symptom in keyword for symptom in SYMPTOM_KEYWORDS):
+                    if hits.any_within(TREATMENT_INDICATORS, start, end):
+                        return "Yes"
+                    else:
+                        return "No"  # Just mentioning symptoms without treatment context
+
+                # Default to No for ambiguous mentions
+                return "No"
+
+        return "No"
+
+    except Exception as e:
+        print(f"Error checking for eczema: {e}")
+        return "No"
+
+def check_for_baby(snapshot):
+    """Check if the product description mentions it's for babies"""
+    try:
+        hits = body_keywords(snapshot)
+
+        # Check if any baby-related keyword appears in the text
+        for keyword in BABY_KEYWORDS:
+            if keyword in hits:
+                return "Yes"
+
+        return "No"
+
+    except Exception as e:
+        print(f"Error checking for baby: {e}")
+        return "No"
+
+def detect_country(snapshot):
+    """Detect the country of origin from the product page"""
+    try:
+        # Method 1: Look for "Origin" heading and get the next paragraph
+        for section in snapshot.find_sections(['origin']):
+            country = (section["next_paragraph"] or "").strip()
+            if country and len(country) < 50:  # Reasonable length for country name
+                return country
+
+        # Method 2: Look for other country indicators in the page text
+        page_text = snapshot.body_text
+        hits = body_keywords(snapshot)
+
+        for indicator in COUNTRY_INDICATORS:
+            if indicator in hits:
+                # Look for country names just after the indicator
+                indicator_index = hits.first(indicator)
+                end = min(len(page_text), indicator_index + len(indicator) + 30)
+
+                for country in COMMON_COUNTRIES:
+                    if hits.any_within([country], indicator_index, end):
+                        return country.title()
+
+        return ""  # Return empty string if no country found
+
+    except Exception as e:
+        print(f"Error detecting country: {e}")
+        return ""
+
+def detect_body_parts(snapshot):
+    """Detect which body parts the product is used for"""
+    try:
+        # Get text from specific sections only (not entire page)
+        page_text = snapshot.description_text
+
+        # Also check product usage section specifically
+        for section in snapshot.find_sections(USAGE_HEADINGS):
+            if section["next_paragraph"] is not None:
+                page_text += " " + section["next_paragraph"].lower()
+
+        # If no specific content found, fall back to entire page but be more careful
+        if page_text.strip():
+            hits = find_keywords(snapshot, "description", page_text)
+        else:
+            page_text = snapshot.body_text
+            hits = body_keywords(snapshot)
+
+        detected_parts = []
+
+        # First priority: Check product name (most reliable)
+        name_hits = find_keywords(snapshot, "name", snapshot.product_name.lower())
+        for part, keywords in BODY_PART_KEYWORDS.items():
+            if any(keyword in name_hits for keyword in keywords):
+                detected_parts.append(part)
+
+        # For cleansing products, assume face if not specified otherwise
+        if not detected_parts:
+            if any(indicator in name_hits for indicator in CLEANSING_INDICATORS):
+                detected_parts.append('face')
+
+        # Second priority: Check description with context
+        for part, keywords in BODY_PART_KEYWORDS.items():
+            for keyword in keywords:
+                if keyword in hits:
+                    # Context checking - look for usage context but be less strict
+                    keyword_index = hits.first(keyword)
+                    start = max(0, keyword_index - 50)
+                    end = min(len(page_text), keyword_index + len(keyword) + 50)
+
+                    # For face-related terms in cleansing context, be more lenient
+                    if part == 'face' and hits.any_within(FACE_CLEANSING_CONTEXT, start, end):
+                        if part not in detected_parts:
+                            detected_parts.append(part)
+                        break
+                    # For other parts, require usage indicators AND no negative indicators
+                    elif (hits.any_within(USAGE_INDICATORS, start, end) and
+                          not hits.any_within(BODY_PART_NEGATIVE_INDICATORS, start, end)):
+                        if part not in detected_parts:
+                            detected_parts.append(part)
+                        break
+
+        return ", ".join(detected_parts) if detected_parts else "Not specified"
+
+    except Exception as e:
+        print(f"Error detecting body parts: {e}")
+        return "Not specified"
+
+def detect_product_function(snapshot):
+    """Detect what the product does (its function)"""
+    try:
+        hits = body_keywords(snapshot)
+
+        detected_functions = []
+        for function, keywords in FUNCTION_KEYWORDS.items():
+            if any(keyword in hits for keyword in keywords):
+                detected_functions.append(function)
+
+        return ", ".join(detected_functions) if detected_functions else "Not specified"
+
+    except Exception as e:
+        print(f"Error detecting product function: {e}")
+        return "Not specified"
+
+def detect_category_type(snapshot):
+    """Detect the product type/category based on name and description"""
+    try:
+        hits = body_keywords(snapshot)
+
+        # The name is matched together with the start of the page so keywords
+        # spanning the "name + page" join are still found
+        name_text = snapshot.product_name.lower() + " " + snapshot.body_text[:KEYWORD_MATCHER.max_length]
+        name_hits = find_keywords(snapshot, "name_and_start", name_text)
+
+        # Check for matches in the name and page text
+        for category, keywords in CATEGORY_TYPES.items():
+            for keyword in keywords:
+                if keyword in hits or keyword in name_hits:
+                    return category
+
+        return "Not specified"
+
+    except Exception as e:
+        print(f"Error detecting category type: {e}")
+        return "Not specified"
+
+def extract_ingredients(snapshot):
+    """Find the ingredient list in the page sections"""
+    try:
+        # Method 1: Look for any heading containing "ingredient"
+        sections = snapshot.find_sections(['ingredient'])
+        
+        if not sections:
+            # Method 2: Look for any element containing "ingredient"
+            sections = snapshot.find_sections(['ingredient'], tag=None)
+        
+        for section in sections:
+            # Try the next sibling paragraph, then the next element of any kind
+            if section["next_paragraph"] is not None:
+                if section["next_paragraph"].strip():
+                    return section["next_paragraph"]
+            elif section["next_element"] and section["next_element"].strip():
+                return section["next_element"]
+        
+        # Method 3: If still not found, use any element next to an ingredient/composition label
+        for section in snapshot.find_sections(['ingredient', 'composition'], tag=None):
+            if section["sibling"]:
+                return section["sibling"]
+        
+        return "N/A"
+        
+    except Exception as e:
+        print(f"Error extracting ingredients from {snapshot.url}: {e}")
+        return "N/A"
+
+def timed_detector(detector, snapshot):
+    """Run one detector, recording its time in crawl_metrics"""
+    with crawl_metrics.timed(detector.__name__, snapshot.url):
+        return detector(snapshot)
+
+def build_record(snapshot):
+    """Run every detector on a page snapshot and build the CSV row"""
+    # The shared keyword scan is timed on its own instead of inside the first detector
+    with crawl_metrics.timed("keyword_scan", snapshot.url):
+        body_keywords(snapshot)
+
+    return {
+        "brandName": snapshot.brand_name,
+        "productName": snapshot.product_name,
+        "categoryType": timed_detector(detect_category_type, snapshot),
+        "bodyParts": timed_detector(detect_body_parts, snapshot),
+        "productFunction": timed_detector(detect_product_function, snapshot),
+        "babyProduct": timed_detector(check_for_baby, snapshot),
+        "eczemaProduct": timed_detector(check_for_eczema, snapshot),
+        "country": timed_detector(detect_country, snapshot),
+        "productIngredient": timed_detector(extract_ingredients, snapshot),
+        "productURL": snapshot.url
+    }
+
+def classify_snapshot(snapshot):
+    """The CSV row of a product page, or None for a multi-product bundle"""
+    if not is_single_product(snapshot.product_name):
+        return None
+    return build_record(snapshot)
@@ -0,0 +1,270 @@
+"""HTTP fetch backend for Watsons product pages.
+
+Watsons renders the product name, brand, ingredients and country of origin
+on the server, so most pages can be read with a plain HTTP request and an
+HTML parser instead of a full Chrome page load. fetch_snapshot() returns the
+same PageSnapshot the browser would capture, or None when the HTML is missing
+required elements and the browser has to be used.
+
+Saved pages can be checked offline:
+    python watsons_http.py saved_page.html [product_url]
+    python watsons_http.py check [fixture_dir]    # pages against fixture_dir/expected.json
+
+The default fixtures (fixtures/watsons_products_synthetic) are synthetic:
+benchmark/make_corpus.py rendered them from collected CSV rows with the
+markup the selectors target. They catch regressions in snapshot_from_html
+but don't show that real Watsons HTML parses. For that, save real product
+pages in a directory with an expected.json taken from the Chrome path
+(browser_snapshot) on the same pages, and run check on that directory.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+import domain_limits
+import watsons_detectors as detectors
+from page_snapshot import PageSnapshot
+
+REQUEST_TIMEOUT = 15  # seconds
+POOL_SIZE = 10  # keep-alive connections per host
+
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+        "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+    ),
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-MY,en;q=0.9",
+}
+
+# Elements whose text never shows on the page
+HIDDEN_TAGS = {"script", "style", "noscript", "template", "head", "svg"}
+
+# Elements always recorded as page sections
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+
+# Elements that start a new line in the rendered text (like Selenium's .text)
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt",
+    "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2", "h3",
+    "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre",
+    "section", "table", "tr", "td", "th", "ul",
+}
+
+# Saved product pages and the fields expected from them (expected.json)
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "watsons_products_synthetic")
+CHECKED_FIELDS = ("productName", "brandName", "productIngredient", "country")
+
+# One session per thread so pool workers each reuse their own connections
+session_local = threading.local()
+
+def get_session():
+    """Get this thread's pooled HTTP session"""
+    session = getattr(session_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        # 429s are not retried here: domain_limits sees them and backs off (Retry-After included)
+        retries = Retry(total=2, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504],
+                        respect_retry_after_header=False)
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retries)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(HEADERS)
+        session_local.session = session
+    return session
+
+def fetch_html(url):
+    """Download a page, returning its HTML or None if the request failed"""
+    try:
+        with domain_limits.request(url):
+            start = time.perf_counter()
+            response = get_session().get(url, timeout=REQUEST_TIMEOUT)
+        domain_limits.report_response(url, response, time.perf_counter() - start)
+        if response.status_code != 200:
+            print(f"  HTTP {response.status_code} for {url}")
+            return None
+        return response.text
+    except requests.RequestException as e:
+        domain_limits.report(url, "timeout" if isinstance(e, requests.Timeout) else "error")
+        print(f"  HTTP request failed for {url}: {e}")
+        return None
+
+def fetch_if_changed(url, etag=None, last_modified=None):
+    """Conditional GET using the validators from the last fetch
+
+    Returns (status, html, etag, last_modified) where status is "unchanged"
+    (304, no body downloaded), "fetched", "gone" (404/410) or "failed".
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        with domain_limits.request(url):
+            start = time.perf_counter()
+            response = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+        domain_limits.report_response(url, response, time.perf_counter() - start)
+    except requests.RequestException as e:
+        domain_limits.report(url, "timeout" if isinstance(e, requests.Timeout) else "error")
+        print(f"  HTTP request failed for {url}: {e}")
+        return "failed", None, etag, last_modified
+
+    new_etag = response.headers.get("ETag", etag)
+    new_last_modified = response.headers.get("Last-Modified", last_modified)
+    if response.status_code == 304:
+        return "unchanged", None, new_etag, new_last_modified
+    if response.status_code in (404, 410):
+        return "gone", None, None, None
+    if response.status_code != 200:
+        print(f"  HTTP {response.status_code} for {url}")
+        return "failed", None, etag, last_modified
+    return "fetched", response.text, new_etag, new_last_modified
+
+def collect_text(node, parts):
+    """Append the visible text of node to parts, marking block boundaries with newlines"""
+    for child in node.children:
+        if isinstance(child, Tag):
+            if child.name in HIDDEN_TAGS:
+                continue
+            if child.name == "br":
+                parts.append("\n")
+                continue
+            is_block = child.name in BLOCK_TAGS
+            if is_block:
+                parts.append("\n")
+            collect_text(child, parts)
+            if is_block:
+                parts.append("\n")
+        elif type(child) is NavigableString:  # skip comments, doctype, CDATA
+            parts.append(re.sub(r"\s+", " ", child))
+
+def visible_text(element):
+    """Get an element's text the way the browser shows it (one line per block)"""
+    if element is None:
+        return ""
+    parts = []
+    collect_text(element, parts)
+    lines = (line.strip() for line in "".join(parts).split("\n"))
+    return "\n".join(line for line in lines if line)
+
+def own_text(element):
+    """First direct text of an element (what XPath text() looks at)"""
+    for child in element.children:
+        if type(child) is NavigableString and child.strip():
+            return str(child)
+    return ""
+
+def collect_sections(soup):
+    """Headings and ingredient labels with the text that follows them"""
+    sections = []
+    for element in (soup.body or soup).find_all(True):
+        heading = own_text(element)
+        if not heading:
+            continue
+        label = heading.lower()
+        if element.name not in HEADING_TAGS and 'ingredient' not in label and 'composition' not in label:
+            continue
+
+        paragraph = element.find_next_sibling("p")
+        next_element = element.find_next_sibling()
+        sibling = None
+        for candidate in element.parent.find_all(True, recursive=False):
+            if candidate is not element and visible_text(candidate).strip():
+                sibling = visible_text(candidate)
+                break
+
+        sections.append({
+            "tag": element.name,
+            "heading": heading,
+            "next_paragraph": visible_text(paragraph) if paragraph is not None else None,
+            "next_element": visible_text(next_element) if next_element is not None else None,
+            "sibling": sibling,
+        })
+    return sections
+
+def collect_description(soup):
+    """Text of the product description elements (footer/navigation excluded)"""
+    description_text = ""
+    for selector in detectors.DESCRIPTION_SELECTORS:
+        for element in soup.select(selector):
+            classes = " ".join(element.get("class", [])).lower()
+            if "footer" not in classes and "nav" not in classes:
+                description_text += " " + visible_text(element)
+    return description_text
+
+def snapshot_from_html(html, url):
+    """Build a PageSnapshot from a page's HTML"""
+    soup = BeautifulSoup(html, "html.parser")
+
+    product_name = visible_text(soup.select_one(".product-name")) or "N/A"
+    brand_name = visible_text(soup.select_one(".brand-group .product-brand a")) or "N/A"
+
+    return PageSnapshot(
+        url,
+        visible_text(soup.body or soup),
+        product_name=product_name,
+        brand_name=brand_name,
+        description_text=collect_description(soup),
+        sections=collect_sections(soup),
+    )
+
+def fetch_snapshot(url):
+    """Fetch a product page without a browser (None = use the browser instead)"""
+    html = fetch_html(url)
+    if html is None:
+        return None
+
+    snapshot = snapshot_from_html(html, url)
+    if not snapshot.has_required_fields():
+        print(f"  Product details not in page HTML, using browser: {url}")
+        return None
+    return snapshot
+
+def check_fixtures(fixture_dir=FIXTURE_DIR):
+    """Parse every page in fixture_dir and compare with its expected.json; returns the number of mismatches"""
+    with open(os.path.join(fixture_dir, "expected.json"), "r", encoding="utf-8") as f:
+        expected = json.load(f)
+
+    mismatches = 0
+    for filename, fields in expected.items():
+        with open(os.path.join(fixture_dir, filename), "r", encoding="utf-8") as f:
+            snapshot = snapshot_from_html(f.read(), fields["url"])
+        record = detectors.build_record(snapshot)
+        failed = [name for name in CHECKED_FIELDS if record[name] != fields[name]]
+        if not snapshot.has_required_fields():
+            failed.append("required fields")
+        for name in failed:
+            print(f"✗ {filename} {name}: expected {fields.get(name)!r}, got {record.get(name)!r}")
+        if not failed:
+            print(f"✓ {filename}")
+        mismatches += len(failed)
+    return mismatches
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python watsons_http.py saved_page.html [product_url]")
+        print("       python watsons_http.py check [fixture_dir]")
+        sys.exit(1)
+
+    if sys.argv[1] == "check":
+        fixture_dir = sys.argv[2] if len(sys.argv) > 2 else FIXTURE_DIR
+        if fixture_dir == FIXTURE_DIR:
+            print("Checking synthetic pages (markup regressions only, not real Watsons HTML)")
+        sys.exit(1 if check_fixtures(fixture_dir) else 0)
+
+    with open(sys.argv[1], "r", encoding="utf-8") as f:
+        snapshot = snapshot_from_html(f.read(), sys.argv[2] if len(sys.argv) > 2 else sys.argv[1])
+
+    if not snapshot.has_required_fields():
+        print("Required elements (.product-name, .brand-group .product-brand a) not found")
+    for key, value in detectors.build_record(snapshot).items():
+        print(f"{key}: {value}")
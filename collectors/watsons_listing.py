@@ -0,0 +1,235 @@
+"""Category discovery from the Watsons product search API.
+
+The category grid is assumed to be rendered from a JSON product search on
+the commerce API. Requesting that JSON directly would return the URL, name
+and brand of 64 products per request, with the total page count, so
+discovering a category needs no rendering and no scrolling. harvest_listing()
+returns None when the API can't be used, or stops answering part way through
+a category, and the caller falls back to the browser.
+
+The endpoint and response shape are not verified against the live site yet:
+the fixtures in fixtures/watsons_listing are hand-written in the expected
+shape. Record a real category with "record" and compare before relying on it.
+
+Responses can be recorded and replayed offline:
+    python watsons_listing.py record <category_url> <fixture_dir>
+    python watsons_listing.py <fixture_dir> [category_url]
+    python watsons_listing.py check    # fixtures/watsons_listing against expected.json
+"""
+import json
+import os
+import re
+import sys
+import time
+
+import requests
+
+import domain_limits
+import watsons_http
+
+SITE_URL = "https://www.watsons.com.my"
+
+# Product search endpoint the category grid is assumed to call (unverified, see above)
+LISTING_API = "https://api.watsons.com.my/api/v2/wtcmy/products/search"
+PAGE_SIZE = 64
+MAX_PAGES = 50
+
+API_HEADERS = {
+    "Accept": "application/json, text/plain, */*",
+    "Origin": SITE_URL,
+    "Referer": SITE_URL + "/",
+}
+
+# Hand-written search pages and the products expected from them (expected.json)
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "watsons_listing")
+
+# Keys the brand has been seen under in product search results
+BRAND_KEYS = ("masterBrand", "brand", "brandName", "manufacturer")
+
+class IncompleteListing(Exception):
+    """A listing page after the first could not be fetched, so the pages so far
+    are not the whole category"""
+
+def category_code(category_url):
+    """Category code from a URL like https://www.watsons.com.my/face-wash-cleanser/c/120101"""
+    match = re.search(r"/c/([^/?#]+)", category_url)
+    return match.group(1) if match else None
+
+def listing_params(code, page):
+    """Query string for one page of a category's product search"""
+    return {
+        "fields": "FULL",
+        "query": f":relevance:category:{code}",
+        "pageSize": PAGE_SIZE,
+        "currentPage": page,
+        "lang": "en_MY",
+        "curr": "MYR",
+    }
+
+def fetch_listing_page(category_url, page):
+    """Download one page of the product search JSON, or None if the request failed"""
+    code = category_code(category_url)
+    if code is None:
+        return None
+    try:
+        with domain_limits.request(LISTING_API):
+            start = time.perf_counter()
+            response = watsons_http.get_session().get(
+                LISTING_API, params=listing_params(code, page), headers=API_HEADERS,
+                timeout=watsons_http.REQUEST_TIMEOUT,
+            )
+        domain_limits.report_response(LISTING_API, response, time.perf_counter() - start)
+        if response.status_code != 200:
+            print(f"  Listing API returned HTTP {response.status_code} for page {page + 1}")
+            return None
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        if isinstance(e, requests.RequestException):
+            domain_limits.report(LISTING_API, "timeout" if isinstance(e, requests.Timeout) else "error")
+        print(f"  Listing API request failed for page {page + 1}: {e}")
+        return None
+
+def brand_of(product):
+    """Brand name of one search result, or "N/A" """
+    for key in BRAND_KEYS:
+        value = product.get(key)
+        if isinstance(value, dict):
+            value = value.get("name")
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return "N/A"
+
+def parse_listing(data):
+    """(products, total_pages) from one page of search JSON
+
+    products is a list of (url, name, brand) with absolute product URLs.
+    """
+    products = []
+    for product in data.get("products") or []:
+        url = product.get("url")
+        if not url or "/p/" not in url:
+            continue
+        if url.startswith("/"):
+            url = SITE_URL + url
+        name = (product.get("name") or "").strip() or "N/A"
+        products.append((url, name, brand_of(product)))
+
+    pagination = data.get("pagination") or {}
+    total_pages = pagination.get("totalPages") or 1
+    return products, total_pages
+
+def iter_listing(category_url, fetch_page=fetch_listing_page):
+    """Yield each listing page's new products as (url, name, brand) lists, as soon as it arrives
+
+    fetch_page(category_url, page) returns a page of search JSON (or None);
+    pass a fixture reader to replay recorded responses. Yields nothing if
+    the first page can't be fetched, and raises IncompleteListing if a later
+    page can't be.
+    """
+    seen = set()
+    page = 0
+    total_pages = 1
+    while page < min(total_pages, MAX_PAGES):
+        start = time.perf_counter()
+        data = fetch_page(category_url, page)
+        if data is None:
+            if page > 0:
+                raise IncompleteListing(f"Listing page {page + 1}/{total_pages} could not be fetched "
+                                        f"after {len(seen)} products")
+            return
+
+        page_products, total_pages = parse_listing(data)
+        new_products = []
+        for product in page_products:
+            if product[0] not in seen:
+                seen.add(product[0])
+                new_products.append(product)
+        print(f"Listing page {page + 1}/{total_pages}: {len(new_products)} new products "
+              f"({time.perf_counter() - start:.2f}s)")
+        yield new_products
+        page += 1
+
+def harvest_listing(category_url, fetch_page=fetch_listing_page):
+    """Every product of a category as (url, name, brand), in listing order
+
+    Returns None if the first page can't be fetched or has no products, or if
+    a later page can't be fetched (a partial category must not be taken for
+    the whole one).
+    """
+    products = []
+    try:
+        for page_products in iter_listing(category_url, fetch_page):
+            if not products and not page_products:
+                return None
+            products.extend(page_products)
+    except IncompleteListing as e:
+        print(e)
+        return None
+
+    if not products:
+        return None
+    print(f"Total unique products found: {len(products)}")
+    return products
+
+def fixture_reader(fixture_dir):
+    """fetch_page replacement that reads page_000.json, page_001.json, ... from a folder"""
+    def fetch_page(category_url, page):
+        path = os.path.join(fixture_dir, f"page_{page:03d}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return fetch_page
+
+def record_fixtures(category_url, fixture_dir):
+    """Download a category's search JSON and save each page as a fixture"""
+    os.makedirs(fixture_dir, exist_ok=True)
+
+    def fetch_and_save(url, page):
+        data = fetch_listing_page(url, page)
+        if data is not None:
+            with open(os.path.join(fixture_dir, f"page_{page:03d}.json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+        return data
+
+    return harvest_listing(category_url, fetch_and_save)
+
+def check_fixtures(fixture_dir=FIXTURE_DIR):
+    """Replay the pages in fixture_dir and compare the products with expected.json; returns the number of mismatches"""
+    with open(os.path.join(fixture_dir, "expected.json"), "r", encoding="utf-8") as f:
+        expected = json.load(f)
+
+    found = harvest_listing(expected["category_url"], fixture_reader(fixture_dir)) or []
+    wanted = [tuple(product) for product in expected["products"]]
+    mismatches = 0
+    for position in range(max(len(found), len(wanted))):
+        got = found[position] if position < len(found) else None
+        want = wanted[position] if position < len(wanted) else None
+        if got != want:
+            print(f"✗ product {position + 1}: expected {want}, got {got}")
+            mismatches += 1
+    if not mismatches:
+        print(f"✓ {len(found)} products from {fixture_dir}")
+    return mismatches
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "check":
+        sys.exit(1 if check_fixtures() else 0)
+
+    if len(sys.argv) >= 4 and sys.argv[1] == "record":
+        found = record_fixtures(sys.argv[2], sys.argv[3])
+        print(f"Recorded {len(found or [])} products to {sys.argv[3]}")
+        sys.exit(0)
+
+    if len(sys.argv) < 2:
+        print("Usage: python watsons_listing.py <fixture_dir> [category_url]")
+        print("       python watsons_listing.py record <category_url> <fixture_dir>")
+        print("       python watsons_listing.py check")
+        sys.exit(1)
+
+    found = harvest_listing(sys.argv[2] if len(sys.argv) > 2 else sys.argv[1], fixture_reader(sys.argv[1]))
+    if found is None:
+        print("No products in the fixtures")
+        sys.exit(1)
+    for url, name, brand in found:
+        print(f"{brand} | {name} | {url}")
@@ -0,0 +1,259 @@
+"""Streaming Watsons category scrape: discover -> fetch -> parse -> classify -> write.
+
+scrape_category in watsons_collector.py works in stages: every listing page
+first, then every product page, then the CSV. Here each stage is an asyncio
+task connected to the next by a bounded queue, so:
+
+- product fetches start as soon as the first listing page has been read
+- records are written (and saved to the crawl state) the moment they are ready
+- a full queue makes the stage before it wait (backpressure), so memory use
+  stays the same whatever the size of the category
+
+Blocking work (HTTP requests, BeautifulSoup, Chrome) runs in thread pools;
+Chrome is only used for pages whose HTML is missing the product details, and
+is retried with backoff like scrape_category (a failed attempt restarts the
+browser); a page that still fails is saved as failed. The detectors run in classify_pool's worker processes, one classify task per
+process. Rows are written in the order they finish, not listing order;
+export from the crawl state if a stable order is needed.
+
+    python watsons_pipeline.py <category_url> [output.csv]
+"""
+import asyncio
+import csv
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import classify_pool
+import columnar_store
+import crawl_metrics
+import crawl_state
+import listing_prefilter
+import watsons_collector as collector
+import watsons_http
+import watsons_listing
+
+QUEUE_SIZE = 64  # items waiting between two stages
+FETCH_WORKERS = 8
+PARSE_WORKERS = 2
+BROWSER_WORKERS = 1  # Chrome instances for pages that need rendering
+CLASSIFY_WORKERS = classify_pool.PROCESSES
+
+DONE = None  # end-of-stream marker passed down the queues
+
+class PipelineStats:
+    """Counters and the time the first record was written"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_record = None
+        self.discovered = 0
+        self.scraped = 0
+        self.skipped = 0
+        self.failed = 0
+        self.browser_pages = 0
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start
+        first = f"{self.first_record - self.start:.1f}s" if self.first_record else "-"
+        return (f"{self.discovered} discovered, {self.scraped} scraped, {self.skipped} skipped, "
+                f"{self.failed} failed ({self.browser_pages} needed Chrome) in {elapsed:.1f}s, "
+                f"first record after {first}")
+
+def timed_call(stage, url, func, *args):
+    """func(*args), timed in crawl_metrics (runs inside the pool thread)"""
+    with crawl_metrics.timed(stage, url):
+        return func(*args)
+
+async def finish_stage(workers, next_queue, next_workers):
+    """Wait for a stage's workers, then tell each worker of the next stage to stop"""
+    await asyncio.gather(*workers)
+    for _ in range(next_workers):
+        await next_queue.put(DONE)
+
+async def discover(category_url, url_queue, state, stats):
+    """Listing pages -> prefiltered, not-yet-scraped product URLs"""
+    loop = asyncio.get_running_loop()
+    brandlist = await loop.run_in_executor(None, listing_prefilter.load_brandlist, collector.BRANDLIST_FILE)
+
+    pages = watsons_listing.iter_listing(category_url)
+    from_api = False
+    seen = set()  # a product listed on several pages is only fetched once
+    try:
+        while True:
+            page_products = await loop.run_in_executor(None, next, pages, DONE)
+            if page_products is DONE:
+                break
+            from_api = True
+            await queue_products(page_products, url_queue, state, stats, brandlist, seen)
+    except watsons_listing.IncompleteListing as e:
+        print(e)
+        from_api = False  # products already queued are skipped through seen
+
+    if not from_api:
+        print("Listing API unavailable or incomplete, scrolling the category pages instead")
+        products = await loop.run_in_executor(None, collector.get_all_product_links, category_url)
+        await queue_products(products, url_queue, state, stats, brandlist, seen)
+
+async def queue_products(products, url_queue, state, stats, brandlist, seen):
+    """Prefilter one batch of listed products and queue the new ones"""
+    products = listing_prefilter.prefilter_listing(products, collector.is_single_product, brandlist)
+    for url, name, brand in products:
+        if url in seen or crawl_state.is_done(state, collector.RETAILER, url):
+            continue
+        seen.add(url)
+        stats.discovered += 1
+        await url_queue.put(url)  # waits while the fetchers are behind
+
+async def fetch(url_queue, page_queue, pool):
+    """Product URL -> (url, html); html is None when the request failed"""
+    loop = asyncio.get_running_loop()
+    while True:
+        url = await url_queue.get()
+        if url is DONE:
+            return
+        try:
+            html = await loop.run_in_executor(pool, timed_call, "product_http.navigation", url,
+                                              watsons_http.fetch_html, url)
+        except Exception as e:
+            print(f"HTTP fetch failed for {url}: {e}")
+            html = None  # Chrome gets a try in the parse stage
+        await page_queue.put((url, html))
+
+def browser_snapshot_with_retries(state, category_url, url):
+    """collector.browser_snapshot with the collector's retries and backoff (runs in the browser pool)
+
+    A failed attempt restarts this thread's Chrome before the next one.
+    """
+    return crawl_state.scrape_with_retries(
+        state, collector.RETAILER, category_url, url, collector.browser_snapshot,
+        on_error=lambda error: collector.quit_driver(),
+    )
+
+async def parse(page_queue, snapshot_queue, pool, browser_pool, stats, state, category_url):
+    """(url, html) -> (url, snapshot, error), rendering in Chrome when the HTML lacks details"""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await page_queue.get()
+        if item is DONE:
+            return
+        url, html = item
+        snapshot = None
+        try:
+            if html is not None:
+                snapshot = await loop.run_in_executor(pool, timed_call, "parse", url,
+                                                      watsons_http.snapshot_from_html, html, url)
+            if snapshot is None or not snapshot.has_required_fields():
+                stats.browser_pages += 1
+                snapshot = await loop.run_in_executor(browser_pool, browser_snapshot_with_retries,
+                                                      state, category_url, url)
+            await snapshot_queue.put((url, snapshot, None))
+        except Exception as e:
+            await snapshot_queue.put((url, None, e))
+
+async def classify(snapshot_queue, record_queue, pool):
+    """(url, snapshot) -> (url, record, error); record None for bundles"""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await snapshot_queue.get()
+        if item is DONE:
+            return
+        url, snapshot, error = item
+        record = None
+        if error is None:
+            await loop.run_in_executor(pool, collector.cache_snapshot, snapshot)
+            try:
+                future = classify_pool.submit(snapshot)
+                await asyncio.wrap_future(future)
+                record = classify_pool.result(future, url)
+            except Exception as e:
+                error = e
+        await record_queue.put((url, record, error))
+
+async def write(record_queue, writer, output, state, stats, classify_workers):
+    """Write each record as it arrives and save it to the crawl state"""
+    remaining = classify_workers
+    while remaining:
+        item = await record_queue.get()
+        if item is DONE:
+            remaining -= 1
+            continue
+        url, record, error = item
+        if error is not None:
+            crawl_state.save_product(state, collector.RETAILER, url, "failed", error=error)
+            stats.failed += 1
+            print(f"Failed to scrape {url}: {error}")
+        elif record is None:
+            crawl_state.save_product(state, collector.RETAILER, url, "skipped")
+            stats.skipped += 1
+        else:
+            with crawl_metrics.timed("csv_write", url):
+                writer.writerow(record)
+                output.flush()
+            crawl_state.save_product(state, collector.RETAILER, url, "scraped", record)
+            stats.scraped += 1
+            if stats.first_record is None:
+                stats.first_record = time.perf_counter()
+            print(f"[{stats.scraped}] Scraped: {record['brandName']} - {record['productName']}")
+
+async def run_pipeline(category_url, writer, output, state):
+    """Run every stage until the category is exhausted; returns the PipelineStats"""
+    stats = PipelineStats()
+    url_queue = asyncio.Queue(QUEUE_SIZE)
+    page_queue = asyncio.Queue(QUEUE_SIZE)
+    snapshot_queue = asyncio.Queue(QUEUE_SIZE)
+    record_queue = asyncio.Queue(QUEUE_SIZE)
+
+    fetch_pool = ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix="fetch")
+    cpu_pool = ThreadPoolExecutor(PARSE_WORKERS, thread_name_prefix="parse")
+    browser_pool = ThreadPoolExecutor(BROWSER_WORKERS, thread_name_prefix="browser")
+    try:
+        discoverer = asyncio.create_task(discover(category_url, url_queue, state, stats))
+        fetchers = [asyncio.create_task(fetch(url_queue, page_queue, fetch_pool)) for _ in range(FETCH_WORKERS)]
+        parsers = [asyncio.create_task(parse(page_queue, snapshot_queue, cpu_pool, browser_pool, stats,
+                                             state, category_url))
+                   for _ in range(PARSE_WORKERS)]
+        classifiers = [asyncio.create_task(classify(snapshot_queue, record_queue, cpu_pool))
+                       for _ in range(CLASSIFY_WORKERS)]
+        writer_task = asyncio.create_task(write(record_queue, writer, output, state, stats, CLASSIFY_WORKERS))
+
+        await asyncio.gather(
+            finish_stage([discoverer], url_queue, FETCH_WORKERS),
+            finish_stage(fetchers, page_queue, PARSE_WORKERS),
+            finish_stage(parsers, snapshot_queue, CLASSIFY_WORKERS),
+            finish_stage(classifiers, record_queue, CLASSIFY_WORKERS),
+            writer_task,
+        )
+    finally:
+        fetch_pool.shutdown()
+        cpu_pool.shutdown()
+        browser_pool.shutdown()
+        classify_pool.shutdown()
+        collector.quit_all_drivers()
+    return stats
+
+def scrape_category_streaming(category_url, output_file="watsons_products.csv"):
+    """Scrape a category with the streaming pipeline, appending to the CSV as records finish"""
+    state = crawl_state.get_state()
+    file_exists = crawl_state.prepare_output(state, collector.RETAILER, output_file,
+                                             collector.FIELDNAMES, "productURL")
+    if collector.PARQUET_OUTPUT and file_exists and not columnar_store.is_current(output_file):
+        crawl_state.export_parquet(state, collector.RETAILER, output_file, collector.FIELDNAMES)
+    with columnar_store.parquet_output(output_file, collector.FIELDNAMES, collector.PARQUET_OUTPUT) as parquet, \
+            open(output_file, "a" if file_exists else "w", newline="", encoding="utf-8") as f:
+        writer = columnar_store.TeeWriter(csv.DictWriter(f, fieldnames=collector.FIELDNAMES), parquet)
+        if not file_exists:
+            writer.writeheader()
+        stats = asyncio.run(run_pipeline(category_url, writer, f, state))
+    print(stats.summary())
+    return stats
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python watsons_pipeline.py <category_url> [output.csv]")
+        sys.exit(1)
+
+    crawl_metrics.start_run(collector.RETAILER)
+    scrape_category_streaming(sys.argv[1], *sys.argv[2:3])
+    crawl_state.close_state()
+    crawl_metrics.finish_run()
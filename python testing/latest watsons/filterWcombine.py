@@ -1,28 +1,91 @@
 import pandas as pd
 import os
+import sys
+
+# The brandlist matcher lives with the collectors
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'collectors'))
+from brandlist_matcher import BrandlistIndex
+import columnar_store
+import csv_encoding
+import streaming_filter
+
+# Columns read from the collector's Parquet copy of the product list (if there is one)
+PRODUCT_COLUMNS = ['brand_name', 'product_name', 'url', 'category']
 
 def read_csv_with_encoding(file_path):
-    """Try to read a CSV file with multiple encodings"""
-    encodings_to_try = ['utf-8', 'latin-1', 'cp1252', 'iso-8859-1', 'utf-16', 'utf-16-le']
-    
-    for encoding in encodings_to_try:
-        try:
-            df = pd.read_csv(file_path, encoding=encoding, on_bad_lines='warn')
-            print(f"✓ Successfully read {os.path.basename(file_path)} with {encoding} encoding")
-            return df
-        except UnicodeDecodeError:
-            continue
-        except Exception as e:
-            continue
-    
-    # If all encodings fail, try with error handling
-    try:
-        df = pd.read_csv(file_path, encoding='utf-8', on_bad_lines='skip', encoding_errors='replace')
-        print(f"✓ Read {os.path.basename(file_path)} with error replacement")
-        return df
-    except Exception as e:
-        print(f"✗ Failed to read {os.path.basename(file_path)}: {e}")
-        return None
+    """Read a CSV file in one pass with its detected encoding (see collectors/csv_encoding.py)"""
+    return csv_encoding.read_csv(file_path)
+
+def build_taken_index(brandlist_df):
+    """
+    Find the product (and brand) columns in brandlist.csv and index the taken entries.
+    Returns (taken_index, brand_column), or (None, None) if there is no product column.
+    """
+    # Find product name column in brandlist
+    print(f"\n" + "="*70)
+    print(f"ANALYZING BRANDLIST STRUCTURE")
+    print(f"="*70)
+    
+    # Common column names for product names
+    common_product_columns = ['product_name', 'productName', 'product', 'name', 'product name', 
+                             'item', 'description', 'Product', 'Product Name', 'PRODUCT_NAME']
+    
+    product_column = None
+    for possible_col in common_product_columns:
+        if possible_col in brandlist_df.columns:
+            product_column = possible_col
+            print(f"✓ Found product column: '{product_column}'")
+            break
+    
+    if product_column is None:
+        # Try to detect by content
+        for col in brandlist_df.columns:
+            if brandlist_df[col].astype(str).str.len().mean() > 5:  # Product names are usually longer
+                product_column = col
+                print(f"✓ Detected product names in column: '{product_column}' (based on content length)")
+                break
+    
+    if product_column is None and len(brandlist_df.columns) > 0:
+        # Use the last column (often contains product names)
+        product_column = brandlist_df.columns[-1]
+        print(f"⚠ Using last column '{product_column}' for product names")
+    
+    # Extract and clean taken product names
+    if product_column:
+        taken_products = brandlist_df[product_column].dropna().astype(str).str.strip().unique()
+        print(f"\n✓ Found {len(taken_products)} unique product names in brandlist.csv")
+        if len(taken_products) > 0:
+            print(f"Sample of taken products:")
+            for i, product in enumerate(taken_products[:5]):
+                print(f"  {i+1}. {product[:80]}{'...' if len(product) > 80 else ''}")
+    else:
+        print("❌ ERROR: Could not identify product column in brandlist.csv!")
+        return None, None
+    
+    # Find brand column in brandlist
+    common_brand_columns = ['brand_name', 'brandName', 'brand', 'company', 'manufacturer', 
+                           'Brand', 'Brand Name', 'BRAND_NAME']
+    
+    brand_column = None
+    for possible_col in common_brand_columns:
+        if possible_col in brandlist_df.columns:
+            brand_column = possible_col
+            print(f"✓ Found brand column: '{brand_column}'")
+            break
+    
+    # Clean taken products
+    taken_products_clean = [str(p).strip().lower() for p in taken_products]
+    
+    # If brand column exists in brandlist, also match by brand
+    if brand_column:
+        taken_brands = brandlist_df[brand_column].dropna().astype(str).str.strip().str.lower().unique()
+        print(f"✓ Found {len(taken_brands)} unique brands in brandlist.csv")
+        
+        # Taken if the brand is taken, or the names partially match (entries longer than 3 chars)
+        return BrandlistIndex(taken_products_clean, taken_brands, min_length=4, skip_empty=True), brand_column
+    
+    # Taken if the names partially match
+    return BrandlistIndex(taken_products_clean, skip_empty=True), None
 
 def remove_taken_products():
     """
@@ -63,8 +126,10 @@ def remove_taken_products():
             print("Please rename one of them to 'brandlist.csv'")
         return
     
-    # Read files with encoding detection
-    watsons_df = read_csv_with_encoding('watsons_products_simple.csv')
+    # Read files with encoding detection (the Parquet copy is memory-mapped instead when present)
+    watsons_df = columnar_store.read_columns('watsons_products_simple.csv', PRODUCT_COLUMNS)
+    if watsons_df is None:
+        watsons_df = read_csv_with_encoding('watsons_products_simple.csv')
     if watsons_df is None:
         return
         
@@ -102,58 +167,10 @@ def remove_taken_products():
     else:
         print("Brandlist file is empty!")
     
-    # Find product name column in brandlist
-    print(f"\n" + "="*70)
-    print(f"ANALYZING BRANDLIST STRUCTURE")
-    print(f"="*70)
-    
-    # Common column names for product names
-    common_product_columns = ['product_name', 'productName', 'product', 'name', 'product name', 
-                             'item', 'description', 'Product', 'Product Name', 'PRODUCT_NAME']
-    
-    product_column = None
-    for possible_col in common_product_columns:
-        if possible_col in brandlist_df.columns:
-            product_column = possible_col
-            print(f"✓ Found product column: '{product_column}'")
-            break
-    
-    if product_column is None:
-        # Try to detect by content
-        for col in brandlist_df.columns:
-            if brandlist_df[col].astype(str).str.len().mean() > 5:  # Product names are usually longer
-                product_column = col
-                print(f"✓ Detected product names in column: '{product_column}' (based on content length)")
-                break
-    
-    if product_column is None and len(brandlist_df.columns) > 0:
-        # Use the last column (often contains product names)
-        product_column = brandlist_df.columns[-1]
-        print(f"⚠ Using last column '{product_column}' for product names")
-    
-    # Extract and clean taken product names
-    if product_column:
-        taken_products = brandlist_df[product_column].dropna().astype(str).str.strip().unique()
-        print(f"\n✓ Found {len(taken_products)} unique product names in brandlist.csv")
-        if len(taken_products) > 0:
-            print(f"Sample of taken products:")
-            for i, product in enumerate(taken_products[:5]):
-                print(f"  {i+1}. {product[:80]}{'...' if len(product) > 80 else ''}")
-    else:
-        print("❌ ERROR: Could not identify product column in brandlist.csv!")
+    taken_index, brand_column = build_taken_index(brandlist_df)
+    if taken_index is None:
         return
     
-    # Find brand column in brandlist
-    common_brand_columns = ['brand_name', 'brandName', 'brand', 'company', 'manufacturer', 
-                           'Brand', 'Brand Name', 'BRAND_NAME']
-    
-    brand_column = None
-    for possible_col in common_brand_columns:
-        if possible_col in brandlist_df.columns:
-            brand_column = possible_col
-            print(f"✓ Found brand column: '{brand_column}'")
-            break
-    
     # Check if watsons file has the expected columns
     print(f"\n" + "="*70)
     print(f"PREPARING FOR MATCHING")
@@ -210,48 +227,20 @@ def remove_taken_products():
                 print(f"⚠ Using column '{col}' for brand names")
                 break
     
-    # Clean taken products
-    taken_products_clean = [str(p).strip().lower() for p in taken_products]
-    
     # If brand column exists in brandlist, also match by brand
     if brand_column:
-        taken_brands = brandlist_df[brand_column].dropna().astype(str).str.strip().str.lower().unique()
-        print(f"✓ Found {len(taken_brands)} unique brands in brandlist.csv")
-        
-        # Function to check if product is taken
-        def is_product_taken(row):
-            clean_product = str(row['product_name_clean']).strip()
-            clean_brand = str(row.get('brand_name_clean', '')).strip()
-            
-            # Check if brand is in taken brands
-            if clean_brand and clean_brand in taken_brands:
-                return True
-            
-            # Check if product name is similar to any taken product
-            for taken in taken_products_clean:
-                if taken and clean_product:
-                    # Check for partial matches
-                    if (taken in clean_product or clean_product in taken) and len(taken) > 3:
-                        return True
-            
-            return False
+        clean_products = watsons_df['product_name_clean'].astype(str).str.strip()
+        if 'brand_name_clean' in watsons_df.columns:
+            clean_brands = watsons_df['brand_name_clean'].astype(str).str.strip()
+        else:
+            clean_brands = None
         
         print("🔍 Matching products by brand AND product name...")
-        mask = watsons_df.apply(is_product_taken, axis=1)
+        mask = pd.Series(taken_index.mark_taken(clean_products, clean_brands), index=watsons_df.index)
         
     else:
-        # Function to check if product is taken (by product name only)
-        def is_product_taken(product_name):
-            clean_name = str(product_name).strip().lower()
-            for taken in taken_products_clean:
-                if taken and clean_name:
-                    # Check for partial matches
-                    if taken in clean_name or clean_name in taken:
-                        return True
-            return False
-        
         print("🔍 Matching products by product name only...")
-        mask = watsons_df['product_name_clean'].apply(is_product_taken)
+        mask = pd.Series(taken_index.mark_taken(watsons_df['product_name_clean']), index=watsons_df.index)
     
     # Create filtered dataframes
     filtered_df = watsons_df[~mask].copy()
@@ -460,5 +449,107 @@ def remove_taken_products():
     
     print(f"\n" + "="*70)
 
+def remove_taken_products_streaming():
+    """
+    Same filter and sorted outputs as remove_taken_products(), reading
+    watsons_products_simple.csv in chunks; the sorted files are merged from
+    sorted runs on disk, so memory stays flat for any number of products
+    """
+    
+    print("=" * 70)
+    print("WATSONS PRODUCT FILTER WITH CHECKBOX (STREAMING)")
+    print("=" * 70)
+    
+    for required in ('watsons_products_simple.csv', 'brandlist.csv'):
+        if not os.path.exists(required):
+            print(f"\n❌ ERROR: {required} not found!")
+            return
+    
+    brandlist_df = read_csv_with_encoding('brandlist.csv')
+    if brandlist_df is None:
+        return
+    brandlist_df.columns = brandlist_df.columns.str.strip()
+    # Brands only count as taken when brandlist.csv has a brand column (the index knows)
+    taken_index, _ = build_taken_index(brandlist_df)
+    if taken_index is None:
+        return
+    
+    fieldnames = streaming_filter.read_fieldnames('watsons_products_simple.csv')
+    product_name_col = next((col for col in ('product_name', 'Product Name') if col in fieldnames), None)
+    if product_name_col is None:
+        product_name_col = next((col for col in fieldnames if 'product' in col.lower() or 'name' in col.lower()), None)
+    brand_name_col = next((col for col in ('brand_name', 'Brand Name') if col in fieldnames), None)
+    if brand_name_col is None:
+        brand_name_col = next((col for col in fieldnames if 'brand' in col.lower()), None)
+    if product_name_col is None:
+        print("❌ ERROR: Could not find product name column in watsons file!")
+        print(f"Available columns: {fieldnames}")
+        return
+    
+    sort_columns = [brand_name_col, product_name_col] if brand_name_col else [product_name_col]
+    combined_file = 'watsons_products_combined_sorted.csv'
+    output_file = 'watsons_products_remaining_sorted.csv'
+    removed_file = 'watsons_products_removed_sorted.csv'
+    
+    print(f"\n🔍 Matching and sorting products in chunks of {streaming_filter.CHUNK_SIZE}...")
+    result = streaming_filter.filter_products(
+        'watsons_products_simple.csv', taken_index, product_name_col, brand_name_col,
+        remaining_file=output_file, removed_file=removed_file, combined_file=combined_file,
+        sort_columns=sort_columns,
+    )
+    
+    print(f"\n" + "="*70)
+    print(f"RESULTS")
+    print(f"="*70)
+    print(f"📊 Total watsons products: {result.total}")
+    print(f"✅ Remaining products (not taken): {result.remaining}")
+    print(f"❌ Removed products (already taken): {result.removed}")
+    
+    if result.removed_brands:
+        print(f"\n🏷️ Top brands in removed products:")
+        for brand, count in result.removed_brands.most_common(10):
+            print(f"  {brand}: {count} products")
+    
+    summary_file = 'filter_summary.txt'
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        f.write("WATSONS PRODUCT FILTERING SUMMARY\n")
+        f.write("=" * 40 + "\n\n")
+        f.write(f"Date: {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"\n📁 Input files:\n")
+        f.write(f"  • watsons_products_simple.csv: {result.total} products\n")
+        f.write(f"  • brandlist.csv: {len(brandlist_df)} entries\n")
+        f.write(f"\n📊 Results:\n")
+        f.write(f"  • Products remaining: {result.remaining}\n")
+        f.write(f"  • Products removed: {result.removed}\n")
+        f.write(f"  • Total in combined file: {result.total}\n")
+        f.write(f"\n🔠 Sorting applied:\n")
+        f.write(f"  • Alphabetically by brand name\n")
+        f.write(f"  • Then alphabetically by product name within each brand\n")
+        
+        if result.removed_brands:
+            f.write(f"\n🗑️ Removed products by brand:\n")
+            for brand, count in result.removed_brands.most_common():
+                f.write(f"  • {brand}: {count}\n")
+        
+        f.write(f"\n📂 Output files:\n")
+        f.write(f"  1. {combined_file} - ALL products sorted with checkbox (✅=taken, □=not taken)\n")
+        f.write(f"  2. {output_file} - Only products to photograph (sorted)\n")
+        if result.removed:
+            f.write(f"  3. {removed_file} - Only already taken products (sorted)\n")
+        f.write(f"  4. {summary_file} - This summary file\n")
+    
+    print(f"\n📂 All output files created:")
+    print(f"  1. {combined_file} - ALL products sorted with checkbox")
+    print(f"  2. {output_file} - Only products to photograph (sorted)")
+    if result.removed:
+        print(f"  3. {removed_file} - Only already taken products (sorted)")
+    print(f"  4. {summary_file} - Summary report")
+    
+    print(f"\n" + "="*70)
+
 if __name__ == "__main__":
-    remove_taken_products()
\ No newline at end of file
+    # python filterWcombine.py --stream: chunked mode for very large product lists
+    if '--stream' in sys.argv:
+        remove_taken_products_streaming()
+    else:
+        remove_taken_products()
\ No newline at end of file
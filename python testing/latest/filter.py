@@ -1,4 +1,48 @@
 import pandas as pd
+import os
+import sys
+
+# The brandlist matcher lives with the collectors
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'collectors'))
+from brandlist_matcher import BrandlistIndex
+import columnar_store
+import streaming_filter
+
+# Columns read from the collector's Parquet copy of the product list (if there is one)
+PRODUCT_COLUMNS = ['brandName', 'productName', 'productURL']
+
+def build_taken_index(brandlist_df):
+    """
+    Find the product name column in brandlist.csv and index the taken products
+    """
+    # Assuming product names are in the second column (index 1)
+    # Let's identify which column has product names
+    print("\n" + "="*60)
+    print("Analyzing brandlist.csv structure...")
+    
+    # Find the column with product names (longer text entries)
+    product_column = None
+    for col in brandlist_df.columns:
+        # Check if this column contains product-like names (longer strings)
+        if brandlist_df[col].astype(str).str.len().mean() > 10:  # Assuming product names are longer
+            product_column = col
+            print(f"Detected product names in column: '{product_column}'")
+            break
+    
+    if product_column is None:
+        # If we can't detect, use the second column
+        product_column = brandlist_df.columns[1] if len(brandlist_df.columns) > 1 else brandlist_df.columns[0]
+        print(f"Using column '{product_column}' for product names")
+    
+    # Extract and clean taken product names
+    taken_products = brandlist_df[product_column].dropna().astype(str).str.strip().unique()
+    print(f"\nFound {len(taken_products)} unique product names in brandlist.csv")
+    print(f"Sample taken products: {taken_products[:5]}")
+    
+    taken_products_clean = [str(p).strip().lower() for p in taken_products]
+    
+    # Index the taken list once (a product is taken if either name contains the other)
+    return BrandlistIndex(taken_products_clean)
 
 def remove_taken_products():
     """
@@ -7,7 +51,9 @@ def remove_taken_products():
     
     # Read the CSV files
     print("Reading CSV files...")
-    sephora_df = pd.read_csv('sephora_product_all.csv')
+    sephora_df = columnar_store.read_columns('sephora_product_all.csv', PRODUCT_COLUMNS)
+    if sephora_df is None:
+        sephora_df = pd.read_csv('sephora_product_all.csv')
     brandlist_df = pd.read_csv('brandlist.csv')
     
     # Clean column names (remove whitespace)
@@ -28,49 +74,17 @@ def remove_taken_products():
     print("\nFirst 3 rows from brandlist.csv:")
     print(brandlist_df.head(3).to_string(index=False))
     
-    # METHOD 1: Extract product names from brandlist
-    # Assuming product names are in the second column (index 1)
-    # Let's identify which column has product names
-    print("\n" + "="*60)
-    print("Analyzing brandlist.csv structure...")
-    
-    # Find the column with product names (longer text entries)
-    product_column = None
-    for col in brandlist_df.columns:
-        # Check if this column contains product-like names (longer strings)
-        if brandlist_df[col].astype(str).str.len().mean() > 10:  # Assuming product names are longer
-            product_column = col
-            print(f"Detected product names in column: '{product_column}'")
-            break
-    
-    if product_column is None:
-        # If we can't detect, use the second column
-        product_column = brandlist_df.columns[1] if len(brandlist_df.columns) > 1 else brandlist_df.columns[0]
-        print(f"Using column '{product_column}' for product names")
-    
-    # Extract and clean taken product names
-    taken_products = brandlist_df[product_column].dropna().astype(str).str.strip().unique()
-    print(f"\nFound {len(taken_products)} unique product names in brandlist.csv")
-    print(f"Sample taken products: {taken_products[:5]}")
+    taken_index = build_taken_index(brandlist_df)
     
     # Clean sephora product names for matching
     sephora_df['productName_clean'] = sephora_df['productName'].astype(str).str.strip().str.lower()
-    taken_products_clean = [str(p).strip().lower() for p in taken_products]
-    
-    # Create a function to check if product is in taken list
-    def is_product_taken(product_name):
-        clean_name = str(product_name).strip().lower()
-        for taken in taken_products_clean:
-            if taken in clean_name or clean_name in taken:
-                return True
-        return False
     
     # Apply the matching
     print("\n" + "="*60)
     print("Matching products...")
     
     # Find which sephora products are in the taken list
-    mask = sephora_df['productName_clean'].apply(is_product_taken)
+    mask = pd.Series(taken_index.mark_taken(sephora_df['productName_clean']), index=sephora_df.index)
     
     # Create filtered dataframe (products NOT taken)
     filtered_df = sephora_df[~mask].copy()
@@ -134,5 +148,57 @@ def remove_taken_products():
     print("\nVerification (sample of remaining products):")
     print(filtered_df[['brandName', 'productName']].head(5).to_string(index=False))
 
+def remove_taken_products_streaming():
+    """
+    Same filter as remove_taken_products(), reading sephora_product_all.csv in
+    chunks and writing the results as it goes, so memory stays flat for any size
+    """
+    print("Reading brandlist.csv...")
+    brandlist_df = pd.read_csv('brandlist.csv')
+    brandlist_df.columns = brandlist_df.columns.str.strip()
+    taken_index = build_taken_index(brandlist_df)
+    
+    print("\n" + "="*60)
+    print(f"Matching products in chunks of {streaming_filter.CHUNK_SIZE}...")
+    result = streaming_filter.filter_products(
+        'sephora_product_all.csv', taken_index, 'productName', 'brandName',
+        remaining_file='sephora_products_remaining.csv',
+        removed_file='sephora_products_removed.csv',
+    )
+    
+    print(f"\n=== Results ===")
+    print(f"Total sephora products: {result.total}")
+    print(f"Remaining products (not taken): {result.remaining}")
+    print(f"Removed products (already taken): {result.removed}")
+    
+    if result.removed_brands:
+        print(f"\nTop brands in removed products:")
+        for brand, count in result.removed_brands.most_common(10):
+            print(f"  {brand}: {count} products")
+    
+    print(f"✓ Saved remaining products to: sephora_products_remaining.csv")
+    if result.removed:
+        print(f"✓ Saved removed products to: sephora_products_removed.csv")
+    
+    with open('filter_summary.txt', 'w') as f:
+        f.write(f"Product Filtering Summary\n")
+        f.write(f"=======================\n")
+        f.write(f"Date: {pd.Timestamp.now()}\n")
+        f.write(f"\nInput files:\n")
+        f.write(f"- sephora_product_all.csv: {result.total} products\n")
+        f.write(f"- brandlist.csv: {len(brandlist_df)} entries\n")
+        f.write(f"\nResults:\n")
+        f.write(f"- Products remaining: {result.remaining}\n")
+        f.write(f"- Products removed: {result.removed}\n")
+        f.write(f"\nRemoved products by brand:\n")
+        for brand, count in result.removed_brands.most_common():
+            f.write(f"  {brand}: {count}\n")
+    
+    print(f"✓ Saved summary to: filter_summary.txt")
+
 if __name__ == "__main__":
-    remove_taken_products()
\ No newline at end of file
+    # python filter.py --stream: chunked mode for very large product lists
+    if '--stream' in sys.argv:
+        remove_taken_products_streaming()
+    else:
+        remove_taken_products()
\ No newline at end of file
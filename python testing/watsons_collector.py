@@ -9,6 +9,13 @@ import csv
 import winsound  # For Windows sound
 import os
 import re
+import sys
+
+# Shared helpers live in the collectors folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'collectors'))
+import columnar_store
+import crawl_state
+from listing_prefilter import is_combo_url
 
 # Setup ChromeDriver
 service = Service(r"C:\Users\User\Desktop\python testing\chromedriver-win64\chromedriver.exe")
@@ -25,6 +32,16 @@ options.add_argument('--blink-settings=imagesEnabled=false')
 
 driver = webdriver.Chrome(service=service, options=options)
 
+# Key for this scraper's products in the crawl state database. The store keeps
+# one product set per retailer and every run writes all of it to the chosen
+# output file, so always use the same output file with this scraper.
+RETAILER = "watsons_simple"
+
+FIELDNAMES = ["brand_name", "product_name", "url", "category"]
+
+# Also write a Parquet copy next to the CSV (needs pyarrow); filterW.py reads it when present
+PARQUET_OUTPUT = False
+
 def extract_category_from_url(url):
     """Extract category name from URL"""
     try:
@@ -48,35 +65,6 @@ def extract_category_from_url(url):
     except:
         return "Uncategorized"
 
-def is_combo_url(url):
-    """Check if URL contains combo/bundle keywords to filter out early"""
-    # Keywords that indicate combos/bundles in URLs
-    combo_keywords = [
-        'combo', 'bundle', 'pack', 'set',
-        'trio', 'calendar', 'kit', 'collection',
-        'duo', 'pair', 'twin', 'multi'
-    ]
-    
-    url_lower = url.lower()
-    
-    # Check for combo keywords in the URL path
-    for keyword in combo_keywords:
-        if keyword in url_lower:
-            # Make sure it's not part of another word
-            pattern = r'[^a-z]' + keyword + r'[^a-z]|^' + keyword + r'[^a-z]|[^a-z]' + keyword + r'$'
-            if re.search(pattern, url_lower):
-                return True
-    
-    # Check for patterns like "2-in-1", "3-in-1", etc.
-    if re.search(r'\d+\s*-\s*in\s*-\s*\d+', url_lower):
-        return True
-    
-    # Check for patterns like "2x", "3x", etc.
-    if re.search(r'/\d+\s*x\s*\d+/', url_lower):
-        return True
-    
-    return False
-
 def is_single_product(product_name):
     """Check if the product is a single item (not a bundle/combo)"""
     # This is a secondary check for product names (after URL filtering)
@@ -269,27 +257,6 @@ def extract_product_info_fast(url, category_url=None):
             'category': extract_category_from_url(category_url) if category_url else extract_category_from_url(url),
         }
 
-def read_existing_data(output_file):
-    """Read existing data from CSV file and return as sorted list"""
-    existing_data = []
-    try:
-        with open(output_file, "r", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                existing_data.append({
-                    'brand_name': row.get('brand_name', 'N/A'),
-                    'product_name': row.get('product_name', 'N/A'),
-                    'url': row.get('url', ''),
-                    'category': row.get('category', 'Uncategorized')
-                })
-        print(f"Read {len(existing_data)} existing products from CSV")
-    except FileNotFoundError:
-        print("No existing CSV file found.")
-    except Exception as e:
-        print(f"Error reading CSV: {e}")
-    
-    return existing_data
-
 def write_sorted_data(data, output_file):
     """Write data to CSV file sorted alphabetically by brand name then product name"""
     sorted_data = sorted(data, key=lambda x: (
@@ -298,11 +265,14 @@ def write_sorted_data(data, output_file):
     ))
     
     with open(output_file, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["brand_name", "product_name", "url", "category"])
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
         writer.writeheader()
         writer.writerows(sorted_data)
     
     print(f"Saved {len(sorted_data)} products to {output_file} (sorted alphabetically)")
+    
+    if PARQUET_OUTPUT and columnar_store.write_dataset(sorted_data, output_file, FIELDNAMES) is not None:
+        print(f"Saved {len(sorted_data)} products to {columnar_store.dataset_path(output_file)}")
 
 def scrape_single_product(product_url, output_file="watsons_products_simple.csv", category_url=None):
     """Scrape a single product URL with early filtering"""
@@ -313,10 +283,10 @@ def scrape_single_product(product_url, output_file="watsons_products_simple.csv"
         print(f"✗ Skipping combo/bundle URL: {product_url}")
         return False, 0
     
-    existing_data = read_existing_data(output_file)
-    existing_urls = {item['url'] for item in existing_data}
+    state = crawl_state.get_state()
+    crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "url")
     
-    if product_url in existing_urls:
+    if crawl_state.is_done(state, RETAILER, product_url):
         print("Product already exists in CSV. Skipping.")
         return False, 0
     
@@ -325,15 +295,17 @@ def scrape_single_product(product_url, output_file="watsons_products_simple.csv"
         
         # Secondary check on product name (just in case)
         if not is_single_product(data['product_name']):
+            crawl_state.save_product(state, RETAILER, product_url, "skipped")
             print(f"✗ Skipping bundle/combo: {data['product_name']}")
             return False, 0
-            
-        existing_data.append(data)
-        write_sorted_data(existing_data, output_file)
         
-        print(f"✓ Added and sorted: {data['brand_name']} - {data['product_name']}")
+        # Saved to the crawl state; the sorted CSV is written once at the end of the run
+        crawl_state.save_product(state, RETAILER, product_url, "scraped", data)
+        
+        print(f"✓ Added: {data['brand_name']} - {data['product_name']}")
         return True, 1
     except Exception as e:
+        crawl_state.save_product(state, RETAILER, product_url, "failed", error=e)
         print(f"Failed to scrape {product_url}: {e}")
         return False, 0
 
@@ -344,22 +316,31 @@ def scrape_category(category_url, output_file="watsons_products_simple.csv"):
     category_name = extract_category_from_url(category_url)
     print(f"Category detected: {category_name}")
     
-    # Get product links with early filtering
-    product_urls = get_all_product_links(category_url)
-    print(f"Found {len(product_urls)} single products after URL filtering.")
+    state = crawl_state.get_state()
+    
+    # Resume an interrupted run from its checkpoint instead of paginating the category again
+    product_urls = crawl_state.load_checkpoint(state, RETAILER, category_url)
+    if product_urls is not None:
+        print(f"Resuming unfinished run: {len(product_urls)} products from checkpoint.")
+    else:
+        # Get product links with early filtering
+        product_urls = get_all_product_links(category_url)
+        crawl_state.start_checkpoint(state, RETAILER, category_url, product_urls)
+        print(f"Found {len(product_urls)} single products after URL filtering.")
     
     if not product_urls:
+        crawl_state.finish_checkpoint(state, RETAILER, category_url)
         print("No single products to scrape after filtering.")
         return 0, 0
     
-    existing_data = read_existing_data(output_file)
-    existing_urls = {item['url'] for item in existing_data}
+    crawl_state.prepare_output(state, RETAILER, output_file, FIELDNAMES, "url")
     
-    # Filter out products that already exist in CSV
-    new_product_urls = [url for url in product_urls if url not in existing_urls]
+    # Products not scraped yet (and failed ones with attempts left)
+    new_product_urls = crawl_state.checkpoint_remaining(state, RETAILER, category_url)
     print(f"Found {len(new_product_urls)} new products to scrape")
     
     if not new_product_urls:
+        crawl_state.finish_checkpoint(state, RETAILER, category_url)
         print("No new products to add. Exiting.")
         return 0, 0
     
@@ -372,16 +353,24 @@ def scrape_category(category_url, output_file="watsons_products_simple.csv"):
     
     for i, url in enumerate(new_product_urls, 1):
         try:
-            data = extract_product_info_fast(url, category_url)
+            # Failures are retried with backoff before giving up on the URL
+            data = crawl_state.scrape_with_retries(
+                state, RETAILER, category_url, url,
+                lambda product_url: extract_product_info_fast(product_url, category_url),
+            )
             
             # Quick secondary check
             if is_single_product(data['product_name']):
                 new_products.append(data)
+                crawl_state.save_product(state, RETAILER, url, "scraped", data)
                 print(f"[{i}/{len(new_product_urls)}] ✓ {data['brand_name']} - {data['product_name'][:50]}...")
             else:
+                crawl_state.save_product(state, RETAILER, url, "skipped")
                 print(f"[{i}/{len(new_product_urls)}] ✗ Secondary filter: {data['product_name'][:50]}...")
+            crawl_state.record_attempt(state, RETAILER, category_url, url)
                 
         except Exception as e:
+            crawl_state.save_product(state, RETAILER, url, "failed", error=e)
             print(f"[{i}/{len(new_product_urls)}] ✗ Failed: {e}")
             failed_urls.append(url)
         
@@ -392,20 +381,16 @@ def scrape_category(category_url, output_file="watsons_products_simple.csv"):
             remaining = avg_time * (len(new_product_urls) - i)
             print(f"  Progress: {i}/{len(new_product_urls)} | Avg: {avg_time:.1f}s/product | Est. remaining: {remaining:.0f}s")
     
-    # Combine and sort data
-    if new_products:
-        all_data = existing_data + new_products
-        write_sorted_data(all_data, output_file)
-    
     elapsed_total = time.time() - start_time
     print(f"\nScraping completed in {elapsed_total:.1f} seconds")
     print(f"Successfully scraped: {len(new_products)} products")
     print(f"Failed: {len(failed_urls)} URLs")
-    if failed_urls:
-        print("Failed URLs saved to: failed_urls.txt")
-        with open("failed_urls.txt", "w") as f:
-            for url in failed_urls:
-                f.write(url + "\n")
+    
+    gave_up = crawl_state.finish_checkpoint(state, RETAILER, category_url)
+    if gave_up:
+        print(f"Failed URLs kept in {crawl_state.STATE_DB} (retried on the next run):")
+        for url in gave_up:
+            print(f"  {url}")
     
     return len(new_products), len(failed_urls)
 
@@ -424,27 +409,35 @@ def process_urls(url_list, output_file="watsons_products_simple.csv"):
     total_saved = 0
     total_failed = 0
     
-    for i, url in enumerate(url_list, 1):
-        print(f"\n{'='*60}")
-        print(f"Processing URL {i}/{len(url_list)}: {url}")
-        print(f"{'='*60}")
-        
-        if '/p/' in url:
-            category_context = None
-            for prev_url in url_list[:i-1]:
-                if not '/p/' in prev_url:
-                    category_context = prev_url
-                    break
+    try:
+        for i, url in enumerate(url_list, 1):
+            print(f"\n{'='*60}")
+            print(f"Processing URL {i}/{len(url_list)}: {url}")
+            print(f"{'='*60}")
             
-            saved, count = scrape_single_product(url, output_file, category_context)
-            total_processed += 1
-            if saved:
-                total_saved += count
-        else:
-            saved_count, failed_count = scrape_category(url, output_file)
-            total_saved += saved_count
-            total_failed += failed_count
-            total_processed += saved_count + failed_count
+            if '/p/' in url:
+                category_context = None
+                for prev_url in url_list[:i-1]:
+                    if not '/p/' in prev_url:
+                        category_context = prev_url
+                        break
+                
+                saved, count = scrape_single_product(url, output_file, category_context)
+                total_processed += 1
+                if saved:
+                    total_saved += count
+            else:
+                saved_count, failed_count = scrape_category(url, output_file)
+                total_saved += saved_count
+                total_failed += failed_count
+                total_processed += saved_count + failed_count
+    finally:
+        # Write the sorted CSV once per run from the crawl state, also when nothing
+        # new was saved or the run was interrupted, so products stored by an earlier
+        # run that stopped before this step still reach the CSV
+        records = crawl_state.load_records(crawl_state.get_state(), RETAILER)
+        if records:
+            write_sorted_data(records, output_file)
     
     return total_processed, total_saved, total_failed
 
@@ -555,6 +548,7 @@ if __name__ == "__main__":
     total_time = time.time() - start_time
     
     driver.quit()
+    crawl_state.close_state()
     
     print("\n" + "="*60)
     print("FINAL SUMMARY")